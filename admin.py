@@ -0,0 +1,97 @@
+import socket
+import threading
+import logging
+import sys
+
+ADMIN_TIMEOUT = 5  # Seconds an admin client has to send its command
+MAX_COMMAND = 1024  # Longest command line accepted
+
+class AdminConsole:
+    # Control channel for operators on a local Unix socket. Each connection sends one command
+    # line and gets a text reply. Commands are answered on the console's own thread from
+    # snapshots of server state, and changes go through the same room actors as gameplay,
+    # so using the console never pauses games.
+    def __init__(self, listener, handler, allow=lambda conn: True, takeovers=None):
+        # listener: Listening Unix socket
+        # handler: Callable taking the command's words and returning the reply text
+        # allow: Callable taking a connection, False to refuse it
+        # takeovers: Command -> callable taking the connection and the words, for commands
+        #            that talk over the connection themselves instead of replying with text
+        self.listener = listener
+        self.handler = handler
+        self.allow = allow
+        self.takeovers = takeovers or {}
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return  # Listener closed
+            try:
+                if self.allow(conn):
+                    self.answer(conn)
+            except Exception as e:
+                logging.error(f"Admin command failed: {e}")
+            finally:
+                conn.close()
+
+    def answer(self, conn):
+        conn.settimeout(ADMIN_TIMEOUT)
+        line = b""
+        while not line.endswith(b"\n") and len(line) < MAX_COMMAND:
+            chunk = conn.recv(MAX_COMMAND)
+            if not chunk:
+                break
+            line += chunk
+        words = line.decode(errors="replace").split()
+        if not words:
+            return
+        logging.info(f"Admin command: {' '.join(words)}")
+        if words[0] in self.takeovers:
+            self.takeovers[words[0]](conn, words)
+            return
+        try:
+            reply = self.handler(words)
+        except Exception as e:
+            reply = f"Error: {e}"
+        conn.sendall(reply.encode() + b"\n")
+
+    def close(self):
+        self.listener.close()
+
+def send_command(path, command):
+    # Sends one command to a server's admin socket and returns the reply.
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(ADMIN_TIMEOUT)
+        conn.connect(path)
+        conn.sendall(command.encode() + b"\n")
+        reply = b""
+        while True:
+            chunk = conn.recv(4096)
+            if not chunk:
+                return reply.decode().rstrip("\n")
+            reply += chunk
+
+# Sends the command given on the command line, or reads commands until end of input
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] == "-h":
+        print("Usage: admin.py Socket-Path [command ...]")
+        print("Commands: help, rooms, connections, kick ID, drain ID, reset ROOM, loglevel LEVEL, shutdown")
+        sys.exit(0)
+    if len(sys.argv) > 2:
+        print(send_command(sys.argv[1], " ".join(sys.argv[2:])))
+        sys.exit(0)
+    while True:
+        try:
+            command = input("admin> ")
+        except EOFError:
+            break
+        if command.strip():
+            print(send_command(sys.argv[1], command))
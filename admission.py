@@ -0,0 +1,79 @@
+import threading
+import logging
+
+MAX_CONNECTIONS = 1000  # Connections accepted at once; more are closed straight after accept
+MAX_IN_FLIGHT = 64  # Messages being handled at once before low priority messages are refused
+LATENCY_TARGET = 0.5  # Seconds a message may wait before being handled before the server counts as overloaded
+RETRY_AFTER = 5  # Seconds a refused client is told to wait before trying again
+HIGH_PRIORITY_TYPES = ("move", "resume", "quit", "ping", "pong")  # Never shed, so games in progress keep going
+
+class AdmissionController:
+    # Decides whether new connections and messages are let in.
+    # The server is overloaded when too many messages are being handled at once, or when
+    # the smoothed time messages wait before being handled goes over the target. While
+    # overloaded, joins, chat and other low priority messages are refused with a
+    # "server busy" error, and moves in games already running are still handled.
+    def __init__(self, max_connections=MAX_CONNECTIONS, max_in_flight=MAX_IN_FLIGHT,
+                 latency_target=LATENCY_TARGET, retry_after=RETRY_AFTER):
+        self.max_connections = max_connections
+        self.max_in_flight = max_in_flight
+        self.latency_target = latency_target
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.in_flight = 0
+        self.latency = 0.0  # Exponentially weighted moving average of queue latency, in seconds
+        self.shed = 0  # Messages refused so far
+        self.refused_connections = 0  # Connections refused so far
+
+    def admit_connection(self):
+        # Reserves a connection slot. Returns False if the server is full.
+        with self.lock:
+            if self.connections >= self.max_connections:
+                self.refused_connections += 1
+                return False
+            self.connections += 1
+            return True
+
+    def release_connection(self):
+        with self.lock:
+            self.connections -= 1
+
+    def overloaded(self):
+        return self.in_flight >= self.max_in_flight or self.latency > self.latency_target
+
+    def begin(self, message_type):
+        # Called when a message arrives. Returns False if it should be refused;
+        # otherwise the caller must call started() when handling begins and end() after.
+        with self.lock:
+            if message_type not in HIGH_PRIORITY_TYPES and self.overloaded():
+                # A refused message never queues, so it counts as a zero wait; this lets the
+                # average recover once the backlog has drained
+                self.latency *= 0.8
+                self.shed += 1
+                if self.shed % 100 == 1:
+                    logging.warning(f"Server overloaded ({self.in_flight} in flight, "
+                                    f"{self.latency * 1000:.0f}ms queue latency); shedding low priority messages")
+                return False
+            self.in_flight += 1
+            return True
+
+    def started(self, waited):
+        # Records how long a message waited in its room's queue before being handled.
+        # waited: Seconds since the message was received
+        with self.lock:
+            self.latency += 0.2 * (waited - self.latency)
+
+    def end(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "connections": self.connections,
+                "in_flight": self.in_flight,
+                "queue_latency_ms": round(self.latency * 1000, 1),
+                "shed": self.shed,
+                "refused_connections": self.refused_connections
+            }
@@ -0,0 +1,67 @@
+import time
+from collections import deque
+
+CHAT_RATE = 1.0  # Chat messages a user may send per second on average
+CHAT_BURST = 5  # Chat messages a user may send back to back before being limited
+CHAT_HISTORY = 50  # Recent chat lines kept per room for players and spectators who join late
+MAX_CHAT_LENGTH = 500  # Longest chat message accepted, in characters
+
+class TokenBucket:
+    # Allows `capacity` events at once, refilled at `rate` events per second.
+    __slots__ = ("rate", "capacity", "tokens", "last", "limited")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.limited = False  # True once an event was refused, until one is allowed again
+
+    def consume(self):
+        # Takes one token if available. Returns False when the caller should be refused.
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        self.limited = False
+        return True
+
+class ChatChannel:
+    # Chat state of one room: per-user rate limits and a ring buffer of recent lines.
+    def __init__(self, rate=CHAT_RATE, burst=CHAT_BURST, history_size=CHAT_HISTORY):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}  # Username of a seated player -> TokenBucket; kept across reconnects
+        self.history = deque(maxlen=history_size)  # Oldest lines drop off automatically
+
+    def allow(self, sender):
+        # Checks a sender's rate limit. Only call it for players seated in the room, so there
+        # is at most one bucket per seat.
+        # sender: Username
+        # Returns "ok", "limited" for the first refused message, or "dropped" after that,
+        # so the caller can warn a spammer once and then ignore them cheaply.
+        bucket = self.buckets.get(sender)
+        if bucket is None:
+            bucket = self.buckets[sender] = TokenBucket(self.rate, self.burst)
+        if bucket.consume():
+            return "ok"
+        if bucket.limited:
+            return "dropped"
+        bucket.limited = True
+        return "limited"
+
+    def record(self, username, message):
+        self.history.append({"username": username, "message": message})
+
+    def recent(self):
+        # Returns the recent lines, oldest first.
+        return list(self.history)
+
+    def forget(self, sender):
+        # Drops the rate limit state of a player who left the room.
+        self.buckets.pop(sender, None)
+
+    def forget_all(self):
+        self.buckets.clear()
@@ -1,11 +1,8 @@
 import socket
 import logging
 import sys
-import json
-import threading
 import time
-from encryption import MessageEncryption, KeyExchange
-from gui_client import start_gui
+from connection import GameConnection
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,19 +14,19 @@ logging.basicConfig(
 )
 HOST = None  # Server's IP address or DNS name
 PORT = 65432  # Port the server is listening on
+UNIX_SOCKET = None  # Path of the server's Unix socket, used instead of HOST and PORT
+PLAINTEXT = False  # The server trusts its Unix socket clients, so skip the key exchange
 current_username = None  # Store the current user's username
 
-# Initialize encryption
-key_exchange = KeyExchange()
-encryption = None  # Will be initialized after key exchange
-
 # Parses command-line arguments to set the server's host and port values
 def handle_arguments():
     global HOST
     global PORT
+    global UNIX_SOCKET
+    global PLAINTEXT
     n = len(sys.argv)
     i = 1
-    use_gui = False
+    interface = "console"  # "console", "gui" or "dashboard"
     port_specified = False
     while i < n:
         arg = sys.argv[i]
@@ -39,9 +36,23 @@ def handle_arguments():
             print("-i Host-IP      Set the host IP address (REQUIRED)")
             print("-p Host-Port    Set the host port number (REQUIRED)")
             print("-g              Use GUI interface")
+            print("-d              Watch every room on a dashboard")
+            print("-u Socket-Path  Connect through the server's Unix socket instead of -i and -p")
+            print("-t              The server trusts its Unix socket (server -t), so do not encrypt")
             sys.exit(0)
+        elif arg == "-u":
+            if i + 1 < n:
+                UNIX_SOCKET = sys.argv[i + 1]
+                i += 1
+            else:
+                print("Error: -u requires a socket path")
+                sys.exit(1)
+        elif arg == "-t":
+            PLAINTEXT = True
         elif arg == "-g":
-            use_gui = True
+            interface = "gui"
+        elif arg == "-d":
+            interface = "dashboard"
         elif arg == "-i":
             if i + 1 < n:
                 HOST = sys.argv[i + 1]
@@ -72,6 +83,15 @@ def handle_arguments():
             sys.exit(1)
         i += 1
 
+    if UNIX_SOCKET is not None:
+        if interface != "console":
+            print("Error: -u only works with the console client")
+            sys.exit(1)
+        return interface
+    if PLAINTEXT:
+        print("Error: -t needs a Unix socket (-u)")
+        sys.exit(1)
+
     if not port_specified:
         print("Error: Port number (-p) is required")
         print("Use -h for help")
@@ -81,57 +101,14 @@ def handle_arguments():
         print("Error: -i (IP address) is required")
         sys.exit(1)
 
-    return use_gui
+    return interface
 
-# Sends a message to the server with a specified type and data payload
-def send_message(client_socket, message_type, data):
-    message = {
-        "type": message_type,
-        "data": data
-    }
-    encrypted_message = encryption.encrypt_message(json.dumps(message) + '\n')
-    client_socket.sendall(encrypted_message)
-
-# Continuously listens for responses from the server and processes each message
-def handle_server_response(client_socket):
-    buffer = b""
-    while True:
-        try:
-            # Receives data from the server in chunks
-            chunk = client_socket.recv(1024)
-            if not chunk:
-                logging.info("Connection closed by server.")
-                break
-
-            # Make sure encryption is initialized
-            if encryption is None:
-                logging.error("Encryption not initialized")
-                break
-
-            buffer += chunk
-
-            try:
-                # Try to decrypt the entire buffer
-                decrypted_data = encryption.decrypt_message(buffer)
-                buffer = b""  # Clear buffer after successful decryption
-                
-                # Process each complete message
-                lines = decrypted_data.split('\n')
-                for line in lines:
-                    if line:
-                        try:
-                            message = json.loads(line)
-                            print()
-                            handle_message(message)
-                        except json.JSONDecodeError as e:
-                            logging.error(f"JSON decode error: {e} - Line: {line}")
-            except Exception as e:
-                # Placeholder
-                continue
-
-        except socket.error as e:
-            logging.error(f"Socket error: {e}")
-            break
+# Prints a server message on its own line, below the input prompt
+def print_message(message):
+    if message["type"] == "disconnected":
+        return
+    print()
+    handle_message(message)
 
 # Formats the board as a 3x3 grid
 def format_board(board):
@@ -163,57 +140,60 @@ def handle_message(message):
         logging.info(f"Game result: {message['data']['result']}")
         if message['data']['result'] == "win":
             logging.info(f"Winner: {message['data']['winner']}")
+        if message['data'].get('reason') == "timeout":
+            logging.info("The other player ran out of time.")
 
     elif message["type"] == "chat":
         username = message["data"]["username"]
         chat_message = message["data"]["message"]
         logging.info(f"{username}: {chat_message}")
 
+    elif message["type"] == "restart":
+        logging.info(message["data"]["message"])
+
+    elif message["type"] == "chat_history":
+        for line in message["data"]["messages"]:
+            logging.info(f"{line['username']}: {line['message']}")
+
+    elif message["type"] == "leaderboard":
+        logging.info("Leaderboard:")
+        for entry in message["data"]["top"]:
+            logging.info(f"{entry['rank']}. {entry['username']} ({entry['rating']}) "
+                         f"W{entry['wins']} L{entry['losses']} D{entry['draws']}")
+        player = message["data"].get("player")
+        if player:
+            logging.info(f"Your rank: {player['rank']} ({player['rating']})")
+
 # Connects to the server, manages message sending, and listens for commands from the user
 def connect_to_server():
     global current_username
     
+    connection = GameConnection(HOST, PORT, path=UNIX_SOCKET, plaintext=PLAINTEXT)
     try:
-        # Creates a TCP socket and connects to the specified server
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        client_socket.connect((HOST, PORT))
-        logging.info(f"Connected to server at {HOST}:{PORT}")
-        
-        # Receive server's public key
-        server_public_key = client_socket.recv(1024)
-        if not server_public_key:
-            logging.error("Failed to receive server's public key")
-            return
-            
-        # Generate our symmetric key and encrypt it with server's public key
-        global encryption
-        encryption = MessageEncryption()
-        encrypted_symmetric_key = key_exchange.encrypt_symmetric_key(
-            server_public_key,
-            encryption.get_symmetric_key()
-        )
-        
-        # Send encrypted symmetric key to server
-        client_socket.sendall(encrypted_symmetric_key)
-        
-        # Start listening for server responses in a separate thread
-        response_thread = threading.Thread(target=handle_server_response, args=(client_socket,))
-        response_thread.daemon = True
-        response_thread.start()
+        # Connects, exchanges keys and prints server messages as they arrive
+        connection.connect()
+        logging.info(f"Connected to server at {UNIX_SOCKET or f'{HOST}:{PORT}'}")
+        connection.on("*", print_message)
+        connection.start()
 
         # Main loop for user input, allowing the user to send various types of messages
         while True:
             # Wait for a short time to prevent the input prompt from appearing before the server response
             time.sleep(0.1)
-            message = input("Enter message type (join/move/chat/reset/quit) or 'exit' to disconnect: ")
+            message = input("Enter message type (join/spectate/move/chat/reset/leaderboard/quit) or 'exit' to disconnect: ")
             if message.lower() == 'exit':
                 break
 
             if message == "join":
                 username = input("Enter your username: ")
+                room = input("Enter room (default main): ") or "main"
                 global current_username
                 current_username = username
-                send_message(client_socket, "join", {"username": username})
+                connection.join(username, room)
+
+            elif message == "spectate":
+                room = input("Enter room to watch (default main): ") or "main"
+                connection.spectate(room)
 
             elif message == "move":
                 if not current_username:
@@ -228,24 +208,27 @@ def connect_to_server():
                 if not (0 <= row <= 2 and 0 <= col <= 2):
                     logging.error("Row and Column must be between 0 and 2.")
                     continue
-                send_message(client_socket, "move", {"username": current_username, "position": {"row": row, "col": col}})
+                connection.move(current_username, row, col)
 
             elif message == "chat":
                 if not current_username:
                     logging.error("Please join the game first.")
                     continue
                 chat_message = input("Enter your message: ")
-                send_message(client_socket, "chat", {"username": current_username, "message": chat_message})
+                connection.chat(current_username, chat_message)
 
             elif message == "reset":
                 if not current_username:
                     logging.error("Please join the game first.")
                     continue
-                send_message(client_socket, "reset", {"username": current_username})
+                connection.reset(current_username)
+
+            elif message == "leaderboard":
+                connection.leaderboard(current_username)
 
             elif message == "quit":
                 if current_username:
-                    send_message(client_socket, "quit", {"username": current_username})
+                    connection.quit(current_username)
                 break
 
             else:
@@ -256,13 +239,18 @@ def connect_to_server():
     except socket.error as e:
         logging.error(f"Socket error: {e}")
     finally:
-        client_socket.close()
+        connection.close()
         logging.info("Disconnected from server.")
 
 # Main entry point for the script: processes command-line arguments and connects to the server
 if __name__ == "__main__":
-    use_gui = handle_arguments()
-    if use_gui:
+    interface = handle_arguments()
+    # The graphical interfaces are imported only when chosen, so the console client never loads tkinter
+    if interface == "gui":
+        from gui_client import start_gui
         start_gui(HOST, PORT)
+    elif interface == "dashboard":
+        from dashboard import start_dashboard
+        start_dashboard(HOST, PORT)
     else:
         connect_to_server()
@@ -0,0 +1,100 @@
+import time
+
+MOVE_TIME = 30  # Default seconds a player has for one move
+GAME_TIME = 300  # Default seconds on each player's clock for the whole game
+INCREMENT = 2  # Default seconds added to a player's clock after each move they make
+MAX_TIME_CONTROL = 3600  # Longest per-move or total time, in seconds, a room may ask for
+
+def default_time_control():
+    return {"move": MOVE_TIME, "total": GAME_TIME, "increment": INCREMENT}
+
+def parse_time_control(data):
+    # Returns the time control a join asked for, with defaults for missing fields.
+    # Raises ValueError if it is not a dict of sensible numbers of seconds.
+    if not isinstance(data, dict):
+        raise ValueError("Time control must be an object.")
+    control = default_time_control()
+    for field in control:
+        value = data.get(field, control[field])
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Time control {field} must be a number of seconds.")
+        lowest = 0 if field == "increment" else 1
+        if not lowest <= value <= MAX_TIME_CONTROL:
+            raise ValueError(f"Time control {field} must be between {lowest} and {MAX_TIME_CONTROL} seconds.")
+        control[field] = value
+    return control
+
+class GameClock:
+    # Both players' clocks in one game. The player to move must move within the per-move
+    # limit and before their total runs out; each move adds the increment to their total.
+    # The clock only does arithmetic; the server keeps one TimerWheel timer per running
+    # clock, so any number of games costs one thread and O(1) work per move.
+    __slots__ = ("move_time", "increment", "remaining", "turn", "turn_started", "timer")
+
+    def __init__(self, control):
+        # control: Time control dict, as returned by parse_time_control
+        self.move_time = control["move"]
+        self.increment = control["increment"]
+        self.remaining = {"X": control["total"], "O": control["total"]}  # Symbol -> seconds left in total
+        self.turn = None  # Symbol whose clock is running, or None while stopped
+        self.turn_started = None  # time.monotonic() when the running clock started
+        self.timer = None  # TimerWheel timer due when the running clock runs out
+
+    def start(self, symbol, now=None):
+        # Starts the clock of the player to move.
+        self.turn = symbol
+        self.turn_started = time.monotonic() if now is None else now
+
+    def stop(self, now=None):
+        # Stops the running clock after a move, charging the time used and adding the increment.
+        if self.turn is None:
+            return
+        elapsed = (time.monotonic() if now is None else now) - self.turn_started
+        self.remaining[self.turn] = max(0, self.remaining[self.turn] - elapsed) + self.increment
+        self.turn = None
+
+    def time_left(self, now=None):
+        # Seconds before the running clock runs out, or None while stopped.
+        if self.turn is None:
+            return None
+        elapsed = (time.monotonic() if now is None else now) - self.turn_started
+        return min(self.move_time, self.remaining[self.turn]) - elapsed
+
+    def flagged(self, now=None):
+        # True if the player to move ran out of time.
+        left = self.time_left(now)
+        return left is not None and left <= 0
+
+    def to_dict(self, now=None):
+        # Returns the clocks as plain data, e.g. to hand a game to another server process.
+        # The running player keeps the time already used on this move.
+        now = time.monotonic() if now is None else now
+        return {
+            "move": self.move_time,
+            "increment": self.increment,
+            "remaining": dict(self.remaining),
+            "turn": self.turn,
+            "used": 0 if self.turn is None else now - self.turn_started
+        }
+
+    @classmethod
+    def from_dict(cls, data, now=None):
+        # Rebuilds clocks saved with to_dict; a running clock carries on from now.
+        clock = cls({"move": data["move"], "total": 0, "increment": data["increment"]})
+        clock.remaining = dict(data["remaining"])
+        if data["turn"] is not None:
+            clock.start(data["turn"], (time.monotonic() if now is None else now) - data["used"])
+        return clock
+
+    def snapshot(self, now=None):
+        # Returns the clocks as sent to clients: seconds left per symbol and whose clock runs.
+        now = time.monotonic() if now is None else now
+        remaining = dict(self.remaining)
+        if self.turn is not None:
+            remaining[self.turn] = max(0, remaining[self.turn] - (now - self.turn_started))
+        return {
+            "X": round(remaining["X"], 1),
+            "O": round(remaining["O"], 1),
+            "running": self.turn,
+            "move_left": None if self.turn is None else round(max(0, self.time_left(now)), 1)
+        }
@@ -0,0 +1,35 @@
+STATUSES = ("waiting for players", "ongoing", "win", "draw")  # Status strings, stored as their index
+
+class CompactGame:
+    # One game in a few machine words instead of nested lists of strings.
+    __slots__ = ("x_mask", "o_mask", "next_symbol", "status", "x_player", "o_player")
+
+    def __init__(self, x_mask=0, o_mask=0, next_symbol=None, status="waiting for players",
+                 x_player=None, o_player=None):
+        self.x_mask = x_mask  # Cells held by X, bit row * 3 + col
+        self.o_mask = o_mask  # Cells held by O
+        self.next_symbol = next_symbol  # "X", "O" or None before anyone has joined
+        self.status = status
+        self.x_player = x_player  # Username seated as X, or None
+        self.o_player = o_player  # Username seated as O, or None
+
+IN_USE = 1 << 22  # Board word bit marking a slot that holds a game
+
+def encode_word(game):
+    # Packs a CompactGame's board, next symbol and status into one 32-bit word:
+    #   bits 0-8 X cells, bits 9-17 O cells, bits 18-19 next symbol (0 none, 1 X, 2 O),
+    #   bits 20-21 status index, bit 22 slot in use.
+    next_code = 0 if game.next_symbol is None else 1 if game.next_symbol == "X" else 2
+    return (game.x_mask | game.o_mask << 9 | next_code << 18
+            | STATUSES.index(game.status) << 20 | IN_USE)
+
+def decode_word(word, x_player=None, o_player=None):
+    # Returns the CompactGame in a word from encode_word.
+    return CompactGame(
+        x_mask=word & 0x1FF,
+        o_mask=word >> 9 & 0x1FF,
+        next_symbol=(None, "X", "O")[word >> 18 & 3],
+        status=STATUSES[word >> 20 & 3],
+        x_player=x_player,
+        o_player=o_player
+    )
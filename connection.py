@@ -0,0 +1,326 @@
+import socket
+import threading
+import json
+import logging
+import time
+from encryption import MessageEncryption, KeyExchange, FrameReader, PlainText
+
+PUBLIC_KEY_END = b"-----END PUBLIC KEY-----\n"  # Last line of the PEM key the server sends first
+RECV_SIZE = 4096  # Bytes read from the socket at a time
+RECONNECT_ATTEMPTS = 10  # Tries to reach a restarting server before giving up
+RECONNECT_DELAY = 0.5  # Seconds between those tries
+
+def client_session_key(server_public_key):
+    # Returns a new MessageEncryption and its key encrypted for the server.
+    encryption = MessageEncryption()
+    return encryption, KeyExchange.encrypt_symmetric_key(server_public_key, encryption.get_symmetric_key())
+
+class GameClient:
+    # What the blocking and asyncio connections share: decoding, handlers and ownership tokens.
+    # Handlers are registered per message type with on(); "*" receives every message and
+    # "disconnected" is called once when the server closes the connection.
+    # Pings are answered automatically and not passed to handlers.
+    # To reach a server on the same host through its Unix socket, pass path instead of host
+    # and port, and plaintext=True if the server trusts local clients (server -u PATH -t).
+    def __init__(self, host, port, path=None, plaintext=False):
+        self.host = host
+        self.port = port
+        self.path = path  # Unix domain socket of the server, used instead of host and port
+        self.plaintext = plaintext  # Skip the key exchange; only for a server's trusted Unix socket
+        self.encryption = None
+        self.reader = None  # FrameReader, set up by the handshake
+        self.handlers = {}  # Message type -> callbacks
+        self.tokens = {}  # Ownership token the server gave each username this client plays as
+        self.rooms = {}  # Room each username is seated in
+        self.last_seq = None  # Sequence number of the last room broadcast received
+        self.restarting = False  # Set by a "restart" notice: the server is handing over to a new process
+
+    def on(self, message_type, callback):
+        # Registers callback(message) for a message type. Returns callback, so it can decorate.
+        self.handlers.setdefault(message_type, []).append(callback)
+        return callback
+
+    def decode(self, data):
+        # Returns the messages completed by received bytes.
+        messages = []
+        try:
+            texts = self.reader.feed(data)
+        except Exception as e:
+            raise ConnectionError(f"Corrupt stream from server: {e}")
+        for text in texts:
+            for line in text.split("\n"):
+                if not line:
+                    continue
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError as e:
+                    logging.error(f"JSON decode error: {e} - Line: {line}")
+                    continue
+                messages.append(self.track(message))
+        return messages
+
+    def track(self, message):
+        # Remembers the tokens, rooms and sequence number a received message carries. Returns message.
+        if message.get("type") == "move_ack" and "token" in message.get("data", {}):
+            self.tokens[message["data"]["username"]] = message["data"]["token"]
+            self.rooms[message["data"]["username"]] = message["data"].get("room")
+        if "seq" in message:
+            self.last_seq = message["seq"]
+        if message.get("type") == "restart":
+            self.restarting = True
+        return message
+
+    def callbacks(self, message):
+        return self.handlers.get(message.get("type"), []) + self.handlers.get("*", [])
+
+    def with_token(self, data):
+        # Adds the username's token to a message's data when this client holds one.
+        username = data.get("username")
+        if username in self.tokens and "token" not in data:
+            return {**data, "token": self.tokens[username]}
+        return data
+
+    def encode(self, message_type, data):
+        # Encrypts a message, adding the username's token when this client holds one.
+        return self.encryption.encrypt_frame(json.dumps({"type": message_type, "data": self.with_token(data)}) + "\n")
+
+    # Typed requests. Each returns what send() returns, so asyncio callers await them.
+    def join(self, username, room=None):
+        data = {"username": username}
+        if room:
+            data["room"] = room
+        return self.send("join", data)
+
+    def resume(self, username):
+        # Takes back a seat after reconnecting; the server replays the broadcasts missed since last_seq.
+        return self.send("resume", {"username": username, "room": self.rooms.get(username), "last_seq": self.last_seq})
+
+    def spectate(self, room=None):
+        return self.send("spectate", {"room": room} if room else {})
+
+    def move(self, username, row, col):
+        return self.send("move", {"username": username, "position": {"row": row, "col": col}})
+
+    def chat(self, username, text):
+        return self.send("chat", {"username": username, "message": text})
+
+    def evaluate(self, boards, request_id=None):
+        # Asks for perfect-play evaluations; results arrive in "evaluation" chunks tagged with request_id.
+        return self.send("evaluate", {"boards": boards, "id": request_id})
+
+    def batch(self, commands):
+        # Sends several commands in one frame; the server handles them in order.
+        # commands: (request id, message type, data) tuples. Replies to a command carry its
+        # id in a top-level "id", and a "done" message with the id follows the last of them.
+        return self.send("batch", {"commands": [{"id": request_id, "type": message_type, "data": self.with_token(data)}
+                                                for request_id, message_type, data in commands]})
+
+    def watch_rooms(self):
+        return self.send("watch_rooms", {})
+
+    def reset(self, username):
+        return self.send("reset", {"username": username})
+
+    def leaderboard(self, username=None):
+        return self.send("leaderboard", {"username": username})
+
+    def quit(self, username):
+        return self.send("quit", {"username": username})
+
+class GameConnection(GameClient):
+    # Blocking connection. Either call start() to have handlers run on a listener thread,
+    # or call receive() from your own loop. A started connection that gets a "restart"
+    # notice reconnects to the new server process and resumes its seats on its own.
+    def __init__(self, host, port, timeout=None, path=None, plaintext=False):
+        super().__init__(host, port, path, plaintext)
+        self.timeout = timeout  # Seconds to wait for connect and the handshake
+        self.socket = None
+        self.send_lock = threading.Lock()
+        self.listener_thread = None
+        self.closed = False
+
+    def connect(self):
+        # Connects and exchanges keys. Raises socket.error on failure.
+        # After a dropped connection, connect() and start() again, then resume() each username.
+        self.closed = False
+        if self.path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.settimeout(self.timeout)
+            self.socket.connect(self.path)
+        else:
+            self.socket = socket.create_connection((self.host, self.port), self.timeout)
+        if self.plaintext:
+            self.encryption = PlainText()
+        else:
+            server_public_key = b""
+            while not server_public_key.endswith(PUBLIC_KEY_END):
+                chunk = self.socket.recv(RECV_SIZE)
+                if not chunk:
+                    raise ConnectionError("Server closed the connection during the handshake")
+                server_public_key += chunk
+            self.encryption, encrypted_key = client_session_key(server_public_key)
+            self.socket.sendall(encrypted_key)
+        self.socket.settimeout(None)
+        self.reader = FrameReader(self.encryption)
+        return self
+
+    def send(self, message_type, data):
+        frame = self.encode(message_type, data)
+        with self.send_lock:
+            self.socket.sendall(frame)
+
+    def receive(self):
+        # Blocks until at least one message arrives and returns the messages read.
+        # Returns an empty list once the connection is closed.
+        while True:
+            try:
+                chunk = self.socket.recv(RECV_SIZE)
+                decoded = self.decode(chunk) if chunk else None
+            except (socket.error, ValueError) as e:
+                if not self.closed:
+                    logging.error(f"Connection error: {e}")
+                chunk = b""
+            if not chunk:
+                return []
+            messages = []
+            for message in decoded:
+                if message.get("type") == "ping":
+                    try:
+                        self.send("pong", {})
+                    except socket.error:
+                        pass
+                else:
+                    messages.append(message)
+            if messages:
+                return messages
+
+    def start(self):
+        # Runs handlers for incoming messages on a daemon thread.
+        self.listener_thread = threading.Thread(target=self.listen)
+        self.listener_thread.daemon = True
+        self.listener_thread.start()
+        return self
+
+    def listen(self):
+        while True:
+            messages = self.receive()
+            if not messages:
+                if self.restarting and not self.closed and self.reconnect():
+                    continue
+                break
+            for message in messages:
+                self.dispatch(message)
+        if not self.closed:
+            logging.info("Connection closed by server.")
+        self.dispatch({"type": "disconnected", "data": {}})
+
+    def reconnect(self):
+        # Connects to the restarted server and resumes every seat this client holds.
+        # Returns False if the server cannot be reached.
+        self.restarting = False
+        self.socket.close()
+        for _ in range(RECONNECT_ATTEMPTS):
+            time.sleep(RECONNECT_DELAY)
+            try:
+                self.connect()
+            except (socket.error, ConnectionError):
+                continue
+            for username in list(self.tokens):
+                self.resume(username)
+            logging.info("Reconnected to the restarted server.")
+            return True
+        return False
+
+    def dispatch(self, message):
+        for callback in self.callbacks(message):
+            try:
+                callback(message)
+            except Exception:
+                logging.exception(f"Error handling {message.get('type')} message")
+
+    def close(self):
+        # Closes the connection. Shutting down first wakes a listener blocked in recv.
+        self.closed = True
+        if self.socket is None:
+            return
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.socket.close()
+
+class AsyncGameConnection(GameClient):
+    # asyncio connection. Handlers may be plain functions or coroutine functions;
+    # run() dispatches until the connection closes, or read with receive().
+    def __init__(self, host, port, path=None, plaintext=False):
+        super().__init__(host, port, path, plaintext)
+        self.stream_reader = None
+        self.writer = None
+
+    async def connect(self):
+        import asyncio  # Imported here so blocking clients do not pay for loading asyncio
+        if self.path is not None:
+            self.stream_reader, self.writer = await asyncio.open_unix_connection(self.path)
+        else:
+            self.stream_reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        if self.plaintext:
+            self.encryption = PlainText()
+        else:
+            server_public_key = await self.stream_reader.readuntil(PUBLIC_KEY_END)
+            self.encryption, encrypted_key = client_session_key(server_public_key)
+            self.writer.write(encrypted_key)
+            await self.writer.drain()
+        self.reader = FrameReader(self.encryption)
+        return self
+
+    async def send(self, message_type, data):
+        self.writer.write(self.encode(message_type, data))
+        await self.writer.drain()
+
+    async def receive(self):
+        # Waits until at least one message arrives. Returns an empty list once closed.
+        while True:
+            try:
+                chunk = await self.stream_reader.read(RECV_SIZE)
+                decoded = self.decode(chunk) if chunk else None
+            except (ConnectionError, ValueError) as e:
+                logging.error(f"Connection error: {e}")
+                chunk = b""
+            if not chunk:
+                return []
+            messages = []
+            for message in decoded:
+                if message.get("type") == "ping":
+                    await self.send("pong", {})
+                else:
+                    messages.append(message)
+            if messages:
+                return messages
+
+    async def run(self):
+        # Dispatches incoming messages to handlers until the connection closes.
+        while True:
+            messages = await self.receive()
+            if not messages:
+                break
+            for message in messages:
+                await self.dispatch(message)
+        await self.dispatch({"type": "disconnected", "data": {}})
+
+    async def dispatch(self, message):
+        for callback in self.callbacks(message):
+            try:
+                result = callback(message)
+                if hasattr(result, "__await__"):
+                    await result
+            except Exception:
+                logging.exception(f"Error handling {message.get('type')} message")
+
+    async def close(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
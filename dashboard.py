@@ -0,0 +1,156 @@
+import tkinter as tk
+import heapq
+import logging
+import queue
+from connection import GameConnection
+
+REDRAW_INTERVAL = 33  # Milliseconds between redraws, about 30 frames a second
+MAX_BATCH = 500  # Messages taken from the inbox per redraw
+COLUMNS = 8  # Boards per row
+TILE_SIZE = 140  # Pixels per board, title included
+TILE_MARGIN = 10  # Pixels between boards
+TITLE_HEIGHT = 20  # Pixels above each board for the room name and status
+
+class BoardTile:
+    # The canvas items drawing one board. Tiles are reused when rooms close and open,
+    # and only the items of cells that changed are reconfigured, so Tk only repaints those.
+    def __init__(self, canvas, index):
+        self.canvas = canvas
+        self.index = index  # Position on the canvas, left to right then top to bottom
+        self.tag = f"tile{index}"  # Canvas tag on every item of this tile
+        self.x = TILE_MARGIN + (index % COLUMNS) * (TILE_SIZE + TILE_MARGIN)
+        self.y = TILE_MARGIN + (index // COLUMNS) * (TILE_SIZE + TILE_MARGIN)
+        self.size = 0  # Board width in cells, 0 until the first board is drawn
+        self.cells = []  # Text item per cell, row by row
+        self.shown = []  # Text currently displayed per cell
+        self.caption = None  # Title text currently displayed
+        self.title = canvas.create_text(self.x, self.y, anchor=tk.NW, text="", tags=self.tag)
+        self.frame = canvas.create_rectangle(self.x, self.y + TITLE_HEIGHT, self.x + TILE_SIZE,
+                                             self.y + TILE_SIZE, tags=self.tag)
+
+    def layout(self, size):
+        # Creates the grid lines and cell items for a size x size board.
+        self.canvas.delete(f"{self.tag}grid")
+        top = self.y + TITLE_HEIGHT
+        cell = (TILE_SIZE - TITLE_HEIGHT) / size
+        left = self.x + (TILE_SIZE - cell * size) / 2
+        tags = (self.tag, f"{self.tag}grid")
+        for i in range(1, size):
+            self.canvas.create_line(left + i * cell, top, left + i * cell, top + cell * size, fill="gray", tags=tags)
+            self.canvas.create_line(left, top + i * cell, left + cell * size, top + i * cell, fill="gray", tags=tags)
+        font = ("Arial", max(6, int(cell * 0.5)))
+        self.cells = [self.canvas.create_text(left + (col + 0.5) * cell, top + (row + 0.5) * cell, text="",
+                                              font=font, tags=tags)
+                      for row in range(size) for col in range(size)]
+        self.shown = [""] * (size * size)
+        self.size = size
+
+    def show(self, summary):
+        # Draws a room_update summary, touching only what changed since the last one.
+        board = summary["board"]
+        if len(board) != self.size:
+            self.layout(len(board))
+        for i, value in enumerate(cell for row in board for cell in row):
+            if value != self.shown[i]:
+                self.canvas.itemconfigure(self.cells[i], text=value)
+                self.shown[i] = value
+        caption = f"{summary['room']}: {summary['status']}"
+        if caption != self.caption:
+            self.canvas.itemconfigure(self.title, text=caption)
+            self.caption = caption
+
+    def set_visible(self, visible):
+        self.canvas.itemconfigure(self.tag, state=tk.NORMAL if visible else tk.HIDDEN)
+
+class Dashboard:
+    # Read-only view of every room on one canvas, fed by the server's room listing.
+    # Updates are queued by the listener thread and drawn on the Tk thread; several
+    # updates to a room between two redraws are drawn once.
+    def __init__(self, host, port):
+        self.root = tk.Tk()
+        self.root.title("Tic Tac Toe - All Rooms")
+        self.connection = GameConnection(host, port)
+        self.inbox = queue.SimpleQueue()  # Messages from the listener thread
+        self.tiles = []  # Every BoardTile created, by position
+        self.room_tiles = {}  # room -> BoardTile showing it
+        self.free_tiles = []  # Heap of positions of hidden tiles, so new rooms fill gaps first
+        self.dirty = {}  # room -> newest summary not yet drawn, or None once the room closed
+
+        width = COLUMNS * (TILE_SIZE + TILE_MARGIN) + TILE_MARGIN
+        self.status_label = tk.Label(self.root, text="Connecting to server...", font=('Arial', 12))
+        self.status_label.pack(pady=5)
+        frame = tk.Frame(self.root)
+        frame.pack(fill=tk.BOTH, expand=True)
+        self.canvas = tk.Canvas(frame, width=width, height=3 * (TILE_SIZE + TILE_MARGIN), background="white")
+        scrollbar = tk.Scrollbar(frame, orient=tk.VERTICAL, command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+    def connect(self):
+        try:
+            self.connection.connect()
+        except Exception as e:
+            logging.error(f"Connection Error: {str(e)}")
+            return False
+        self.connection.on("*", self.inbox.put)
+        self.connection.start()
+        self.connection.watch_rooms()
+        return True
+
+    def drain_inbox(self):
+        # Runs on the Tk thread every REDRAW_INTERVAL.
+        for _ in range(MAX_BATCH):
+            try:
+                message = self.inbox.get_nowait()
+            except queue.Empty:
+                break
+            if message["type"] == "room_update":
+                self.dirty[message["data"]["room"]] = message["data"]
+            elif message["type"] == "room_closed":
+                self.dirty[message["data"]["room"]] = None
+            elif message["type"] == "disconnected":
+                logging.error("Server connection lost")
+                self.root.quit()
+                return
+        if self.dirty:
+            self.redraw()
+        self.root.after(REDRAW_INTERVAL, self.drain_inbox)
+
+    def redraw(self):
+        tile_count = len(self.tiles)
+        for room, summary in self.dirty.items():
+            tile = self.room_tiles.get(room)
+            if summary is None:
+                if tile is not None:
+                    del self.room_tiles[room]
+                    tile.set_visible(False)
+                    heapq.heappush(self.free_tiles, tile.index)
+                continue
+            if tile is None:
+                tile = self.room_tiles[room] = self.take_tile()
+            tile.show(summary)
+        self.dirty.clear()
+        if len(self.tiles) != tile_count:
+            self.canvas.configure(scrollregion=self.canvas.bbox(tk.ALL))
+        self.status_label.config(text=f"Watching {len(self.room_tiles)} rooms")
+
+    def take_tile(self):
+        # Returns a hidden tile to reuse, or a new one after the last.
+        if self.free_tiles:
+            tile = self.tiles[heapq.heappop(self.free_tiles)]
+            tile.set_visible(True)
+            return tile
+        tile = BoardTile(self.canvas, len(self.tiles))
+        self.tiles.append(tile)
+        return tile
+
+    def run(self):
+        if not self.connect():
+            return
+        self.root.after(REDRAW_INTERVAL, self.drain_inbox)
+        self.root.mainloop()
+        self.connection.close()
+
+def start_dashboard(host, port):
+    Dashboard(host, port).run()
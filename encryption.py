@@ -4,15 +4,38 @@ from cryptography.hazmat.primitives import serialization, hashes
 import base64
 import os
 
+FRAME_DELIMITER = b"\n"  # Ends every encrypted message on the wire; never part of a Fernet token
+MAX_FRAME = 1048576  # Longest frame accepted before the stream is treated as corrupt; fits a 10,000 board evaluate request in the 3x3 list form
+
 class KeyExchange:
-    def __init__(self):
-        # Generate RSA key pair
-        self.private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048
-        )
+    def __init__(self, private_key=None):
+        # Use an existing RSA private key, or generate a new key pair
+        if private_key is None:
+            private_key = rsa.generate_private_key(
+                public_exponent=65537,
+                key_size=2048
+            )
+        self.private_key = private_key
         self.public_key = self.private_key.public_key()
 
+    @classmethod
+    def load_or_create(cls, path):
+        # Load the private key saved at path, or generate one and save it there (readable by the owner only).
+        try:
+            with open(path, "rb") as key_file:
+                return cls(serialization.load_pem_private_key(key_file.read(), password=None))
+        except FileNotFoundError:
+            pass
+        key_exchange = cls()
+        pem = key_exchange.private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        )
+        with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as key_file:
+            key_file.write(pem)
+        return key_exchange
+
     def get_public_key_bytes(self):
         # Get public key in bytes format for sending over network.
         return self.public_key.public_bytes(
@@ -20,8 +43,10 @@ class KeyExchange:
             format=serialization.PublicFormat.SubjectPublicKeyInfo
         )
 
-    def encrypt_symmetric_key(self, public_key_bytes, symmetric_key):
-        # Encrypt symmetric key using received public key.
+    @staticmethod
+    def encrypt_symmetric_key(public_key_bytes, symmetric_key):
+        # Encrypt symmetric key using received public key. Needs no key pair of its own,
+        # so clients call it on the class.
         public_key = serialization.load_pem_public_key(public_key_bytes)
         return public_key.encrypt(
             symmetric_key,
@@ -61,3 +86,39 @@ class MessageEncryption:
     def decrypt_message(self, encrypted_message):
         # Decrypt an encrypted message.
         return self.fernet.decrypt(encrypted_message).decode()
+
+    def encrypt_frame(self, message):
+        # Encrypt a string message and add the frame delimiter, ready to send.
+        return self.fernet.encrypt(message.encode()) + FRAME_DELIMITER
+
+class PlainText:
+    # Stands in for MessageEncryption on connections that need no encryption, such as a
+    # trusted local Unix socket. Frames are the JSON messages themselves, one per line.
+    def encrypt_message(self, message):
+        return message.encode()
+
+    def decrypt_message(self, encrypted_message):
+        return encrypted_message.decode()
+
+    def encrypt_frame(self, message):
+        return message.rstrip("\n").encode() + FRAME_DELIMITER
+
+class FrameReader:
+    # Turns a stream of received bytes back into decrypted messages.
+    # Frames may arrive split across reads or several in one read.
+    def __init__(self, encryption):
+        self.encryption = encryption
+        self.buffer = b""
+
+    def feed(self, data):
+        # Adds received bytes and returns the decrypted text of every complete frame.
+        return [self.encryption.decrypt_message(frame) for frame in self.frames(data)]
+
+    def frames(self, data):
+        # Adds received bytes and returns every complete frame, still encrypted.
+        # Raises ValueError once an unfinished frame grows past MAX_FRAME.
+        self.buffer += data
+        *frames, self.buffer = self.buffer.split(FRAME_DELIMITER)
+        if len(self.buffer) > MAX_FRAME:
+            raise ValueError(f"Frame longer than {MAX_FRAME} bytes")
+        return [frame for frame in frames if frame]
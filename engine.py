@@ -0,0 +1,173 @@
+# Tic-tac-toe rules on packed boards.
+# A board is two 9-bit masks, one per symbol, with cell (row, col) at bit row * 3 + col.
+# Everything that plays or judges games (the server, analysis, simulations) uses these
+# functions so they all agree on the rules.
+
+SYMBOLS = ("X", "O")
+FULL_BOARD = 0x1FF  # All nine cells taken
+LINES = ((0, 1, 2), (3, 4, 5), (6, 7, 8), (0, 3, 6), (1, 4, 7), (2, 5, 8), (0, 4, 8), (2, 4, 6))
+LINE_MASKS = tuple(sum(1 << cell for cell in line) for line in LINES)
+# WINNING[mask] is 1 if a symbol holding the cells in mask has three in a row
+WINNING = bytes(1 if any(mask & line == line for line in LINE_MASKS) else 0 for mask in range(512))
+
+def pack_board(board):
+    # Converts a 3x3 list board of "X", "O" and "" into (x_mask, o_mask).
+    x_mask = o_mask = 0
+    for row in range(3):
+        for col in range(3):
+            cell = board[row][col]
+            if cell == "X":
+                x_mask |= 1 << (row * 3 + col)
+            elif cell == "O":
+                o_mask |= 1 << (row * 3 + col)
+    return x_mask, o_mask
+
+def unpack_board(x_mask, o_mask):
+    # Converts (x_mask, o_mask) back into a 3x3 list board.
+    return [["X" if x_mask >> (row * 3 + col) & 1 else "O" if o_mask >> (row * 3 + col) & 1 else ""
+             for col in range(3)] for row in range(3)]
+
+def winner(x_mask, o_mask):
+    # Returns "X" or "O" if that symbol has three in a row, otherwise None.
+    if WINNING[x_mask]:
+        return "X"
+    if WINNING[o_mask]:
+        return "O"
+    return None
+
+def game_result(x_mask, o_mask):
+    # Returns "X" or "O" for a win, "draw" for a full board, or None while the game goes on.
+    won = winner(x_mask, o_mask)
+    if won:
+        return won
+    if x_mask | o_mask == FULL_BOARD:
+        return "draw"
+    return None
+
+def to_move(x_mask, o_mask):
+    # Returns the symbol whose turn it is; X always moves first.
+    return "X" if bin(x_mask).count("1") == bin(o_mask).count("1") else "O"
+
+def legal_moves(x_mask, o_mask):
+    # Returns the free cells, lowest first.
+    taken = x_mask | o_mask
+    return [cell for cell in range(9) if not taken >> cell & 1]
+
+def play(x_mask, o_mask, symbol, cell):
+    # Returns the masks after symbol takes cell. The caller checks the cell is free.
+    if symbol == "X":
+        return x_mask | 1 << cell, o_mask
+    return x_mask, o_mask | 1 << cell
+
+ONGOING, X_WON, O_WON, DRAW = range(4)  # Result codes of BoardBatch.results
+RESULT_NAMES = (None, "X", "O", "draw")  # game_result value of each result code
+
+def load_numpy():
+    # Returns the numpy module, or None if it is not installed. Only batch mode uses it.
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+class BoardBatch:
+    # Packed boards of many games side by side, for simulations and tournaments where thousands
+    # of moves land at once. Moves are applied one by one or in bulk, and results() judges any
+    # number of boards in one pass: with NumPy, the line sums of every board are one masked
+    # matrix product; without it, each board is one WINNING lookup per symbol.
+    def __init__(self, capacity, use_numpy=True):
+        self.numpy = load_numpy() if use_numpy else None
+        self.capacity = capacity
+        if self.numpy is not None:
+            self.x_masks = self.numpy.zeros(capacity, dtype=self.numpy.uint16)
+            self.o_masks = self.numpy.zeros(capacity, dtype=self.numpy.uint16)
+            # line_matrix[cell, line] is 1 if the cell is on the line
+            self.line_matrix = self.numpy.zeros((9, len(LINES)), dtype=self.numpy.int32)
+            for line_index, line in enumerate(LINES):
+                self.line_matrix[list(line), line_index] = 1
+            self.shifts = self.numpy.arange(9, dtype=self.numpy.int32)
+        else:
+            from array import array
+            self.x_masks = array("H", bytes(2 * capacity))
+            self.o_masks = array("H", bytes(2 * capacity))
+        self.free = list(range(capacity - 1, -1, -1))  # Unused slots, lowest last so it is taken first
+        self.touched = {}  # Slots played on since the last resolve(), as an ordered set
+
+    def __len__(self):
+        return self.capacity - len(self.free)
+
+    def add(self, x_mask=0, o_mask=0):
+        # Stores a board and returns its slot. Raises ValueError if the batch is full.
+        if not self.free:
+            raise ValueError("Board batch is full")
+        slot = self.free.pop()
+        self.x_masks[slot] = x_mask
+        self.o_masks[slot] = o_mask
+        return slot
+
+    def release(self, slot):
+        self.x_masks[slot] = 0
+        self.o_masks[slot] = 0
+        self.touched.pop(slot, None)
+        self.free.append(slot)
+
+    def board(self, slot):
+        # Returns a slot's board as (x_mask, o_mask).
+        return int(self.x_masks[slot]), int(self.o_masks[slot])
+
+    def boards(self, slots):
+        # Returns the (x_mask, o_mask) board of each slot, in order, read in one pass.
+        if self.numpy is None:
+            return [(self.x_masks[slot], self.o_masks[slot]) for slot in slots]
+        slots = self.numpy.asarray(slots, dtype=self.numpy.int64)
+        return list(zip(self.x_masks[slots].tolist(), self.o_masks[slots].tolist()))
+
+    def play(self, slot, symbol, cell):
+        # Marks one move. The caller checks it is legal, e.g. with legal_moves.
+        if symbol == "X":
+            self.x_masks[slot] |= 1 << cell
+        else:
+            self.o_masks[slot] |= 1 << cell
+        self.touched[slot] = None
+
+    def play_many(self, slots, symbols, cells):
+        # Marks one move on each of many boards. A slot may appear only once per call.
+        if self.numpy is None:
+            for slot, symbol, cell in zip(slots, symbols, cells):
+                self.play(slot, symbol, cell)
+            return
+        numpy = self.numpy
+        slots = numpy.asarray(slots, dtype=numpy.int64)
+        bits = (numpy.ones(len(slots), dtype=numpy.uint16) << numpy.asarray(cells, dtype=numpy.uint16))
+        is_x = numpy.asarray(symbols) == "X"
+        self.x_masks[slots[is_x]] |= bits[is_x]
+        self.o_masks[slots[~is_x]] |= bits[~is_x]
+        self.touched.update(dict.fromkeys(slots.tolist()))
+
+    def results(self, slots):
+        # Returns the result code (ONGOING, X_WON, O_WON or DRAW) of each slot, in order.
+        if self.numpy is None:
+            codes = []
+            for slot in slots:
+                x_mask, o_mask = self.x_masks[slot], self.o_masks[slot]
+                codes.append(X_WON if WINNING[x_mask] else O_WON if WINNING[o_mask]
+                             else DRAW if x_mask | o_mask == FULL_BOARD else ONGOING)
+            return codes
+        numpy = self.numpy
+        slots = numpy.asarray(slots, dtype=numpy.int64)
+        x_masks = self.x_masks[slots].astype(numpy.int32)
+        o_masks = self.o_masks[slots].astype(numpy.int32)
+        # Cells of each board as a 0/1 row, times the line matrix, gives how much of each line a symbol holds
+        x_won = (((x_masks[:, None] >> self.shifts) & 1) @ self.line_matrix == 3).any(axis=1)
+        o_won = (((o_masks[:, None] >> self.shifts) & 1) @ self.line_matrix == 3).any(axis=1)
+        full = (x_masks | o_masks) == FULL_BOARD
+        return numpy.select([x_won, o_won, full], [X_WON, O_WON, DRAW], ONGOING).tolist()
+
+    def resolve(self):
+        # Judges every board played on since the last call, in one pass.
+        # Returns {slot: "X", "O" or "draw"} for the boards whose game is over.
+        slots = list(self.touched)
+        self.touched.clear()
+        if not slots:
+            return {}
+        return {slot: RESULT_NAMES[code] for slot, code in zip(slots, self.results(slots)) if code != ONGOING}
@@ -1,10 +1,8 @@
 import tkinter as tk
 from tkinter import messagebox, simpledialog
-import socket
-import threading
-import json
 import logging
-from encryption import MessageEncryption, KeyExchange
+import queue
+from connection import GameConnection
 
 logging.basicConfig(
     level=logging.INFO,
@@ -15,32 +13,38 @@ logging.basicConfig(
     ]
 )
 
+POLL_INTERVAL = 50  # Milliseconds between drains of the network inbox on the Tk thread
+MAX_BATCH = 100  # Messages handled per drain, so a burst cannot freeze the window
+CHAT_LINES = 200  # Lines kept in the chat box; older ones are removed
+PENDING_COLOR = "gray"  # Text color of a move drawn before the server has confirmed it
+
 class TicTacToeGUI:
     def __init__(self, host, port):
         self.root = tk.Tk()
         self.root.title("Tic Tac Toe")
         self.host = host
         self.port = port
-        self.socket = None
-        self.encryption = None
+        self.connection = GameConnection(host, port)
         self.username = None
         self.connected = False
         self.game_over = False
+        self.inbox = queue.SimpleQueue()  # Messages from the listener thread, handled on the Tk thread
         
         # Game state
-        self.board = [['' for _ in range(3)] for _ in range(3)]
+        self.board = [['' for _ in range(3)] for _ in range(3)]  # Board as last confirmed by the server
+        self.next_turn = None  # Username whose turn it is, from the last game_update
+        self.symbol = None  # Symbol the server seated this client as
+        self.pending_move = None  # (row, col) drawn locally and not yet confirmed by the server
+        self.pending_id = None  # Request id the pending move was sent with; the server tags its error with it
+        self.moves_sent = 0  # Numbers the request ids of moves
         self.buttons = [[None for _ in range(3)] for _ in range(3)]
         
         # Create GUI elements
         self.create_gui()
+        self.root.after(POLL_INTERVAL, self.drain_inbox)
         
         # Connect to server
         self.connect_to_server()
-        
-        # Start message receiving thread
-        self.receive_thread = threading.Thread(target=self.receive_messages)
-        self.receive_thread.daemon = True
-        self.receive_thread.start()
 
     def create_gui(self):
         # Status label
@@ -62,6 +66,7 @@ class TicTacToeGUI:
                     command=lambda row=i, col=j: self.make_move(row, col)
                 )
                 self.buttons[i][j].grid(row=i, column=j)
+        self.default_fg = self.buttons[0][0].cget('fg')
         
         # Chat frame
         chat_frame = tk.Frame(self.root)
@@ -93,29 +98,11 @@ class TicTacToeGUI:
 
     def connect_to_server(self):
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
-            
-            # Handle key exchange
-            key_exchange = KeyExchange()
-            server_public_key = self.socket.recv(1024)
-            
-            # Create encryption object
-            self.encryption = MessageEncryption()
-            
-            # Encrypt our symmetric key with server's public key
-            encrypted_symmetric_key = key_exchange.encrypt_symmetric_key(
-                server_public_key,
-                self.encryption.get_symmetric_key()
-            )
-            
-            # Send our encrypted symmetric key
-            self.socket.sendall(encrypted_symmetric_key)
-            
-            # Start message receiving thread
-            self.receive_thread = threading.Thread(target=self.receive_messages)
-            self.receive_thread.daemon = True
-            self.receive_thread.start()
+            # Handshake, then queue server messages for the Tk thread. Tk widgets must only be
+            # touched from the thread running mainloop, so the listener thread never calls handlers
+            self.connection.connect()
+            self.connection.on("*", self.inbox.put)
+            self.connection.start()
             
             # Get username and join game
             self.username = simpledialog.askstring("Username", "Enter your username:")
@@ -135,63 +122,71 @@ class TicTacToeGUI:
             logging.error(f"Connection Error: {str(e)}")
             self.root.quit()
 
-    def receive_messages(self):
-        buffer = b""
-        while True:
+    def drain_inbox(self):
+        # Runs on the Tk thread every POLL_INTERVAL and handles queued messages in a batch.
+        # Each game_update is a full snapshot, so only the newest one in a batch is drawn.
+        batch = []
+        while len(batch) < MAX_BATCH:
             try:
-                data = self.socket.recv(4096)
-                if not data:
-                    logging.error("Server connection lost")
-                    self.root.quit()
-                    break
-
-                buffer += data
-                
-                try:
-                    # Try to decrypt the entire buffer
-                    decrypted_data = self.encryption.decrypt_message(buffer)
-                    buffer = b""  # Clear buffer after successful decryption
-                    
-                    # Process each complete message
-                    lines = decrypted_data.split('\n')
-                    for line in lines:
-                        if line:
-                            try:
-                                message = json.loads(line)
-                                self.handle_message(message)
-                            except json.JSONDecodeError as e:
-                                logging.error(f"JSON decode error: {e} - Line: {line}")
-                except Exception as e:
-                    # If decryption fails, keep the data in buffer
-                    continue
-
-            except Exception as e:
-                logging.error(f"Error receiving message: {e}")
+                batch.append(self.inbox.get_nowait())
+            except queue.Empty:
                 break
+        last_update = max((i for i, message in enumerate(batch) if message["type"] == "game_update"), default=None)
+        for i, message in enumerate(batch):
+            if message["type"] == "game_update" and i != last_update:
+                continue
+            self.handle_message(message)
+        self.root.after(POLL_INTERVAL, self.drain_inbox)
 
-        self.socket.close()
+    def connection_lost(self):
+        logging.error("Server connection lost")
         self.root.quit()
 
+    def show_board(self, board):
+        # Updates only the buttons whose cell changed. The server's board is authoritative,
+        # so a pending move is replaced by whatever the server has in that cell.
+        for i in range(3):
+            for j in range(3):
+                if board[i][j] != self.board[i][j] or (i, j) == self.pending_move:
+                    self.buttons[i][j].config(text=board[i][j] or '', fg=self.default_fg)
+        self.board = board
+        self.pending_move = None
+
+    def rollback_move(self):
+        # Removes a pending move the server refused.
+        row, col = self.pending_move
+        self.buttons[row][col].config(text=self.board[row][col] or '', fg=self.default_fg)
+        self.pending_move = None
+        self.next_turn = self.username
+
+    def add_chat_line(self, line):
+        # Appends a line to the chat box, dropping the oldest lines past CHAT_LINES.
+        self.chat_text.insert(tk.END, f"{line}\n")
+        excess = int(self.chat_text.index('end-1c').split('.')[0]) - 1 - CHAT_LINES
+        if excess > 0:
+            self.chat_text.delete('1.0', f'{excess + 1}.0')
+        self.chat_text.see(tk.END)
+
     def display_system_message(self, message):
         # Display system message in chat
-        self.chat_text.insert(tk.END, f"System: {message}\n")
-        self.chat_text.see(tk.END)
+        self.add_chat_line(f"System: {message}")
 
     def handle_message(self, message):
         # Logic of processing json messages
         message_type = message["type"]
         data = message["data"]
         
+        if message_type == "disconnected":
+            self.connection_lost()
+
         # Handle game updates (who's turn, board state, etc.)
-        if message_type == "game_update":
-            self.board = data["board"]
+        elif message_type == "game_update":
             next_turn = data.get("next_turn")
             status = data.get("status")
+            self.next_turn = next_turn
             
             # Update the GUI board
-            for i in range(3):
-                for j in range(3):
-                    self.buttons[i][j].config(text=self.board[i][j] if self.board[i][j] else '')
+            self.show_board(data["board"])
             
             # Display game status in chat
             if status == "waiting for players":
@@ -216,6 +211,8 @@ class TicTacToeGUI:
         # These other types of messages are just for logging
         elif message_type == "move_ack":
             logging.info(f"Move acknowledged: {data['message']}")
+            if "symbol" in data and data.get("username") == self.username:
+                self.symbol = data["symbol"]
             self.display_system_message(data['message'])
 
         elif message_type == "join":
@@ -223,13 +220,20 @@ class TicTacToeGUI:
 
         elif message_type == "error":
             logging.error(f"Error: {data['message']}")
+            # Only the refusal of the pending move takes it back; other errors (a chat
+            # rate limit, say) leave it for the server to settle
+            if self.pending_move and message.get("id") == self.pending_id:
+                self.rollback_move()
             self.display_system_message(f"Error: {data['message']}")
 
+        elif message_type == "chat_history":
+            for line in data["messages"]:
+                self.add_chat_line(f"{line['username']}: {line['message']}")
+
         elif message_type == "chat":
             username = data["username"]
             chat_message = data["message"]
-            self.chat_text.insert(tk.END, f"{username}: {chat_message}\n")
-            self.chat_text.see(tk.END)
+            self.add_chat_line(f"{username}: {chat_message}")
             if " has reset the game! Please rejoin with usernames to start a new game." in chat_message and username == "Server":
                 self.game_over = True
                 self.display_system_message(f"{username} has reset the game! Please click reset to start a new game.")
@@ -243,8 +247,23 @@ class TicTacToeGUI:
             # Don't let players make moves after game is over
             self.display_system_message("Game is over. Click Reset to start a new game!")
             return
+        if self.pending_move:
+            self.display_system_message("Waiting for the server to confirm your last move.")
+            return
+        if self.board[row][col]:
+            self.display_system_message("That cell is already taken.")
+            return
+        if self.next_turn != self.username:
+            self.display_system_message("It's not your turn.")
+            return
+        # Draw the move straight away; the server's game_update or error settles it
         logging.info(f"Making move: {row}, {col}")
-        self.send_message("move", {"username": self.username, "position": {"row": row, "col": col}})
+        self.moves_sent += 1
+        self.pending_move = (row, col)
+        self.pending_id = f"move-{self.moves_sent}"
+        self.next_turn = None
+        self.buttons[row][col].config(text=self.symbol or '', fg=PENDING_COLOR)
+        self.send_message("move", {"username": self.username, "position": {"row": row, "col": col}}, self.pending_id)
 
     def send_chat(self):
         if not self.connected:
@@ -260,9 +279,11 @@ class TicTacToeGUI:
     def clear_board(self):
         # Clear the board and reset game state
         self.board = [['' for _ in range(3)] for _ in range(3)]
+        self.next_turn = None
+        self.pending_move = None
         for i in range(3):
             for j in range(3):
-                self.buttons[i][j].config(text='')
+                self.buttons[i][j].config(text='', fg=self.default_fg)
         self.status_label.config(text="Connecting to server...")
         self.chat_text.delete(1.0, tk.END)
 
@@ -291,7 +312,8 @@ class TicTacToeGUI:
             self.display_system_message(f"Changing username from {old_username} to {self.username}")
             self.status_label.config(text=f"Connected to {self.host}:{self.port} as {self.username}")
 
-    def send_message(self, message_type, data):
+    def send_message(self, message_type, data, request_id=None):
+        # request_id: Sends the message as a one-command batch, so the server's replies carry this id
         if not self.connected:
             logging.error("Not connected to server")
             return
@@ -299,18 +321,19 @@ class TicTacToeGUI:
             logging.info("Game is over. Click Reset to start a new game!")
             return
         try:
-            message = json.dumps({"type": message_type, "data": data}) + '\n'
-            encrypted_message = self.encryption.encrypt_message(message)
-            self.socket.sendall(encrypted_message)
+            if request_id is None:
+                self.connection.send(message_type, data)
+            else:
+                self.connection.batch([(request_id, message_type, data)])
         except Exception as e:
             logging.error(f"Error sending message: {e}")
 
     def run(self):
         self.root.mainloop()
-        if self.socket:
+        if self.connected:
             if self.username:
                 self.send_message("quit", {"username": self.username})
-            self.socket.close()
+            self.connection.close()
 
 def start_gui(host, port):
     gui = TicTacToeGUI(host, port)
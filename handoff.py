@@ -0,0 +1,72 @@
+import socket
+import struct
+import json
+import time
+
+# Hot restart: a new server process takes over from a running one. The old process passes
+# its listening sockets (as file descriptors, over its admin socket) and the state of every
+# room; clients queue in the listen backlog meanwhile, so no connection is refused.
+# Players reconnect to the new process and resume their seats with their tokens.
+
+HANDOFF_COMMAND = b"handoff\n"  # Admin console command asking a server to hand over
+HANDOFF_TIMEOUT = 10  # Seconds either side waits for the other
+HEADER = struct.Struct("!cI")  # b"H" and the length of the JSON that follows the descriptors
+MAX_LISTENERS = 8  # Most listening sockets one handoff can carry
+
+def send_handoff(conn, listeners, state, deadline=None):
+    # Sends listening sockets and server state to the process taking over, and waits until
+    # it confirms it is serving them. Raises OSError or ValueError if it does not.
+    # conn: Admin console connection the handoff was asked on
+    # listeners: (socket, trusted) pairs
+    # state: JSON-serialisable server state
+    # deadline: time.monotonic() by which the new process must confirm; HANDOFF_TIMEOUT from now by default
+    if deadline is None:
+        deadline = time.monotonic() + HANDOFF_TIMEOUT
+    payload = json.dumps({"trusted": [trusted for _, trusted in listeners], "state": state}).encode()
+    conn.settimeout(time_left(deadline))
+    socket.send_fds(conn, [HEADER.pack(b"H", len(payload))], [listener.fileno() for listener, _ in listeners])
+    conn.settimeout(time_left(deadline))
+    conn.sendall(payload)
+    conn.settimeout(time_left(deadline))
+    if read_exactly(conn, 3) != b"ok\n":
+        raise ValueError("The new process did not confirm the handoff")
+
+def receive_handoff(path):
+    # Asks the server with its admin console at path to hand over. Returns the connection
+    # (pass it to confirm_handoff once serving), the (socket, trusted) listeners and the state.
+    # Raises OSError or ValueError if the server refuses or goes away.
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(HANDOFF_TIMEOUT)
+    conn.connect(path)
+    conn.sendall(HANDOFF_COMMAND)
+    header, fds, _, _ = socket.recv_fds(conn, HEADER.size, MAX_LISTENERS)
+    sockets = [socket.socket(fileno=fd) for fd in fds]
+    if not header.startswith(b"H"):
+        for listener in sockets:
+            listener.close()
+        raise ValueError((header + conn.recv(4096)).decode(errors="replace").strip() or "No handoff")
+    header += read_exactly(conn, HEADER.size - len(header))
+    _, length = HEADER.unpack(header)
+    data = json.loads(read_exactly(conn, length))
+    return conn, list(zip(sockets, data["trusted"])), data["state"]
+
+def confirm_handoff(conn):
+    # Tells the old process the new one is serving, so it can exit.
+    conn.sendall(b"ok\n")
+    conn.close()
+
+def time_left(deadline):
+    # Seconds until a time.monotonic() deadline. Raises TimeoutError once it has passed.
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError("The handoff ran out of time")
+    return left
+
+def read_exactly(conn, size):
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ValueError("Connection closed during the handoff")
+        data += chunk
+    return data
@@ -0,0 +1,174 @@
+import os
+import sys
+import mmap
+import math
+import time
+import struct
+import logging
+import threading
+from array import array
+from compact import IN_USE, encode_word, decode_word
+from engine import unpack_board
+
+# Live room state in a memory-mapped file (put it on /dev/shm to keep it in memory), so
+# dashboards, analytics and admin tools can sample every game without asking the server.
+#
+# The file is a header followed by one fixed-size record per slot; each room has a slot
+# while it exists. A record starts with a sequence counter used as a seqlock: the room's
+# actor, the only writer of its slot, makes the counter odd, writes the record, and makes
+# it even again. Readers copy a record and keep the copy only if the counter was even and
+# unchanged around it, so writers never wait and nobody takes a lock. Readers map the file
+# read-only and cannot disturb the server.
+
+MAGIC = b"TTTL"
+VERSION = 1
+HEADER = struct.Struct("<4sIIII")  # Magic, version, slot count, record size, closed flag
+HEADER_SIZE = 64  # Bytes reserved for the header, keeping records cache-line aligned
+CLOSED_OFFSET = 16  # Offset of the closed flag in the header
+# Counter, board word (see compact.encode_word), room sequence number, moves played,
+# X and O seconds left (NaN without a clock), time.time() of the write, room id, X and O usernames
+RECORD = struct.Struct("<IIIIffd32s32s32s")
+COUNTER = struct.Struct("<I")
+ARENA_SLOTS = 4096  # Rooms mirrored at once; rooms beyond this are left out
+READ_RETRIES = 1000  # Attempts to get a consistent copy of a record being rewritten
+
+class LiveStateArena:
+    # The server's side: creates the file and writes each room's record on its actor.
+    def __init__(self, path, slots=ARENA_SLOTS):
+        # path: File to create, replacing any earlier one; readers that still have that mapped see it closed
+        self.path = path
+        size = HEADER_SIZE + slots * RECORD.size
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(temp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+            self.inode = os.fstat(fd).st_ino
+        finally:
+            os.close(fd)
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, slots, RECORD.size, 0)
+        os.replace(temp_path, path)
+        self.counters = array("I", [0]) * slots  # Counter of each slot as last written
+        self.slot_of = {}  # Room id -> slot
+        self.free_slots = list(range(slots - 1, -1, -1))
+        self.lock = threading.Lock()  # Guards handing out slots, not writing records
+        self.full = False  # True once a room found no free slot, to warn only once
+
+    def allocate(self, room_id):
+        with self.lock:
+            slot = self.slot_of.get(room_id)
+            if slot is None and self.free_slots:
+                slot = self.slot_of[room_id] = self.free_slots.pop()
+            elif slot is None and not self.full:
+                self.full = True
+                logging.warning(f"Live state arena {self.path} is full; new rooms are not mirrored")
+            return slot
+
+    def write(self, room_id, game, seq=0, moves=0, clock=None):
+        # Mirrors a room. Called on the room's actor only.
+        # game: The room's CompactGame
+        # clock: Snapshot of the room's GameClock, or None
+        slot = self.slot_of.get(room_id)
+        if slot is None:
+            slot = self.allocate(room_id)
+            if slot is None:
+                return
+        self.store(slot, encode_word(game), seq, moves,
+                   math.nan if clock is None else clock["X"], math.nan if clock is None else clock["O"],
+                   room_id, game.x_player, game.o_player)
+
+    def release(self, room_id):
+        # Clears a closed room's record and frees its slot.
+        with self.lock:
+            slot = self.slot_of.pop(room_id, None)
+        if slot is None:
+            return
+        self.store(slot, 0, 0, 0, math.nan, math.nan, "", None, None)
+        with self.lock:
+            self.free_slots.append(slot)
+
+    def store(self, slot, word, seq, moves, x_clock, o_clock, room_id, x_player, o_player):
+        offset = HEADER_SIZE + slot * RECORD.size
+        counter = self.counters[slot] + 1  # Odd while the record is being written
+        COUNTER.pack_into(self.map, offset, counter)
+        RECORD.pack_into(self.map, offset, counter, word, seq, moves, x_clock, o_clock, time.time(),
+                         room_id.encode()[:32], (x_player or "").encode()[:32], (o_player or "").encode()[:32])
+        self.counters[slot] = (counter + 1) & 0xFFFFFFFF
+        COUNTER.pack_into(self.map, offset, self.counters[slot])
+
+    def close(self):
+        # Marks the file closed for readers and removes it, unless a newer server has replaced it.
+        COUNTER.pack_into(self.map, CLOSED_OFFSET, 1)
+        self.map.close()
+        try:
+            if os.stat(self.path).st_ino == self.inode:
+                os.unlink(self.path)
+        except OSError:
+            pass
+
+class LiveStateReader:
+    # A sidecar's read-only view of a server's arena.
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.slots, record_size, _ = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            self.map.close()
+            raise ValueError(f"{path} is not a live state file this reader understands")
+
+    @property
+    def closed(self):
+        # True once the server stopped or was replaced; open the path again to follow the new one.
+        return COUNTER.unpack_from(self.map, CLOSED_OFFSET)[0] == 1
+
+    def read(self, slot):
+        # Returns a consistent copy of one room, or None for an unused slot.
+        # Raises TimeoutError if the record is rewritten on every attempt.
+        offset = HEADER_SIZE + slot * RECORD.size
+        for _ in range(READ_RETRIES):
+            before = COUNTER.unpack_from(self.map, offset)[0]
+            if before & 1 == 0:
+                record = self.map[offset:offset + RECORD.size]
+                if COUNTER.unpack_from(self.map, offset)[0] == before:
+                    return decode_record(record)
+            time.sleep(0)  # Let the writer finish
+        raise TimeoutError(f"Slot {slot} kept changing")
+
+    def rooms(self):
+        # Returns every live room, in slot order.
+        return [room for room in map(self.read, range(self.slots)) if room is not None]
+
+    def close(self):
+        self.map.close()
+
+def decode_record(record):
+    # Returns a record as a dict like the server's room_update data, or None if the slot is unused.
+    _, word, seq, moves, x_clock, o_clock, updated, room_id, x_player, o_player = RECORD.unpack(record)
+    if not word & IN_USE:
+        return None
+    game = decode_word(word, x_player.rstrip(b"\0").decode(errors="replace") or None,
+                       o_player.rstrip(b"\0").decode(errors="replace") or None)
+    return {
+        "room": room_id.rstrip(b"\0").decode(errors="replace"),
+        "board": unpack_board(game.x_mask, game.o_mask),
+        "status": game.status,
+        "next_symbol": game.next_symbol,
+        "players": {"X": game.x_player, "O": game.o_player},
+        "clock": None if math.isnan(x_clock) else {"X": round(x_clock, 1), "O": round(o_clock, 1)},
+        "seq": seq,
+        "moves": moves,
+        "updated": updated
+    }
+
+# Prints every live game in a server's arena, as a sample sidecar
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] == "-h":
+        print("Usage: livestate.py Live-State-Path (the path given to server.py -m)")
+        sys.exit(0)
+    reader = LiveStateReader(sys.argv[1])
+    for room in reader.rooms():
+        board = "".join(cell or "." for row in room["board"] for cell in row)
+        print(f"{room['room']}: {room['status']} X={room['players']['X'] or '-'} O={room['players']['O'] or '-'} "
+              f"{board} {room['moves']} moves")
+    if reader.closed:
+        print("(The server has stopped)")
@@ -0,0 +1,78 @@
+import json
+import threading
+from collections import deque
+import server
+from connection import GameClient
+
+class LoopbackTransport:
+    # In-memory replacement for a socket's OutboundQueue: messages the server sends are kept
+    # as encoded JSON in the client's inbox, with no encryption, writer thread or syscall.
+    def __init__(self, client):
+        self.client = client
+        self.sent = 0
+
+    @property
+    def depth(self):
+        return len(self.client.inbox)
+
+    def put(self, message_type, message):
+        with self.client.arrived:
+            self.client.inbox.append(message)
+            self.sent += 1
+            self.client.arrived.notify()
+        return True
+
+    def metrics(self):
+        return {"peer": str(self.client.getpeername()), "depth": self.depth, "peak_depth": None,
+                "congested": False, "sent": self.sent, "dropped": 0, "coalesced": 0}
+
+    def close(self):
+        pass
+
+class LoopbackConnection(GameClient):
+    # A client of the server running in this process, without TCP, RSA or Fernet. Messages
+    # go straight into server.handle_message and replies are read back with receive().
+    # The typed requests (join, move, chat, ...) and token handling are GameClient's.
+    # After server.init_server(inline=True) every message is fully handled before send()
+    # returns, so simulations, fuzzers and benchmarks never wait; with the usual worker
+    # pool, receive() waits for replies like a socket client would. Unless the server was
+    # already started, ratings are kept in memory and never reach the real leaderboard.
+    count = 0  # Connections made so far, used to give each a distinct peer name
+
+    def __init__(self):
+        super().__init__("loopback", None)
+        LoopbackConnection.count += 1
+        self.number = LoopbackConnection.count
+        self.inbox = deque()  # Encoded messages from the server, oldest first
+        self.arrived = threading.Condition()
+        self.connected = False
+
+    def connect(self):
+        server.init_server(persist=False)
+        server.open_connection(self, LoopbackTransport(self))
+        self.connected = True
+        return self
+
+    def send(self, message_type, data):
+        server.handle_message(self, {"type": message_type, "data": self.with_token(data)})
+
+    def receive(self, timeout=0):
+        # Returns the messages received so far, waiting up to timeout seconds for the first one.
+        with self.arrived:
+            if not self.inbox and timeout:
+                self.arrived.wait(timeout)
+            encoded = list(self.inbox)
+            self.inbox.clear()
+        return [self.track(json.loads(text)) for text in encoded]
+
+    # The server treats the client as a socket: it names it in logs and shuts it down when idle
+    def getpeername(self):
+        return ("loopback", self.number)
+
+    def shutdown(self, how=None):
+        self.close()
+
+    def close(self):
+        if self.connected:
+            self.connected = False
+            server.close_connection(self)
@@ -0,0 +1,165 @@
+import socket
+import threading
+import logging
+import time
+from collections import deque
+
+HIGH_WATERMARK = 64  # Queued messages at which a client is treated as a slow consumer
+LOW_WATERMARK = 16  # Queued messages a slow consumer must drain to before it is treated normally again
+MAX_QUEUE = 256  # Queued messages at which a client is disconnected straight away
+SLOW_CONSUMER_DEADLINE = 10.0  # Seconds a client may stay above the high watermark before it is disconnected
+DROPPABLE_TYPES = ("chat", "chat_history")  # Messages dropped for slow consumers
+COALESCED_TYPES = ("game_update",)  # Messages where a slow consumer only needs the newest one
+
+class OutboundQueue:
+    # Bounded send buffer for one client, drained by its own writer thread.
+    # Handlers only append to the queue, so a client that stops reading blocks its
+    # writer thread instead of whichever handler is broadcasting.
+    # Once the queue passes the high watermark the client is congested: chat is dropped,
+    # a queued game_update is replaced by the newest one, and if it has not drained
+    # below the low watermark within the deadline the connection is closed.
+    def __init__(self, conn, encryption, on_congested=None):
+        # conn: Client connection
+        # encryption: The client's MessageEncryption
+        # on_congested: Called (with the lock held) when the queue becomes congested, so the owner
+        #               can schedule check_deadline for a client that is never sent anything again
+        self.conn = conn
+        self.encryption = encryption
+        self.on_congested = on_congested
+        self.queue = deque()  # (message_type, encoded message), oldest first
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)  # Notified when a message is queued, sent or the queue closes
+        self.sending = False  # True while the writer thread sends a message it took off the queue
+        self.congested_since = None  # When the queue passed the high watermark, or None
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.peak_depth = 0
+        self.writer_thread = threading.Thread(target=self.writer_loop)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+
+    @property
+    def depth(self):
+        return len(self.queue)
+
+    def put(self, message_type, message):
+        # Queues a message for the writer thread, applying the slow consumer policy.
+        # Returns False if the message was dropped.
+        with self.lock:
+            if self.closed:
+                return False
+            depth = len(self.queue)
+            if self.congested_since is None and depth >= HIGH_WATERMARK:
+                self.congested_since = time.monotonic()
+                logging.warning(f"Slow consumer {self.peer()}: {depth} messages queued")
+                if self.on_congested is not None:
+                    self.on_congested()
+
+            if self.congested_since is not None:
+                if depth >= MAX_QUEUE or time.monotonic() - self.congested_since > SLOW_CONSUMER_DEADLINE:
+                    self.disconnect(f"{depth} messages queued")
+                    return False
+                if message_type in DROPPABLE_TYPES:
+                    self.dropped += 1
+                    return False
+                if message_type in COALESCED_TYPES:
+                    for index, (queued_type, _) in enumerate(self.queue):
+                        if queued_type == message_type:
+                            del self.queue[index]
+                            self.coalesced += 1
+                            break
+
+            self.queue.append((message_type, message))
+            self.peak_depth = max(self.peak_depth, len(self.queue))
+            self.ready.notify_all()
+            return True
+
+    def writer_loop(self):
+        # Encrypts and sends queued messages in order until the queue is closed.
+        while True:
+            with self.lock:
+                while not self.queue and not self.closed:
+                    self.ready.wait()
+                if self.closed:
+                    return
+                message_type, message = self.queue.popleft()
+                self.sending = True
+                if self.congested_since is not None and len(self.queue) <= LOW_WATERMARK:
+                    logging.info(f"Consumer {self.peer()} caught up after "
+                                 f"{time.monotonic() - self.congested_since:.1f}s")
+                    self.congested_since = None
+            try:
+                self.conn.sendall(self.encryption.encrypt_frame(message))
+                self.sent += 1
+            except socket.error as e:
+                logging.error(f"Error sending message: {e}")
+                self.close()
+                return
+            finally:
+                with self.lock:
+                    self.sending = False
+                    self.ready.notify_all()
+
+    def flush(self, timeout):
+        # Waits until everything queued has been sent, for at most timeout seconds.
+        # Returns True if the queue drained.
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while (self.queue or self.sending) and not self.closed:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self.ready.wait(left)
+            return not self.queue
+
+    def check_deadline(self):
+        # Disconnects the client if it has been congested for longer than the deadline, whether or
+        # not anything else was queued for it. Returns the seconds left while it is still congested
+        # within the deadline, otherwise None.
+        with self.lock:
+            if self.closed or self.congested_since is None:
+                return None
+            left = SLOW_CONSUMER_DEADLINE - (time.monotonic() - self.congested_since)
+            if left < 0:
+                self.disconnect(f"congested for over {SLOW_CONSUMER_DEADLINE:.0f}s")
+                return None
+            return left
+
+    def disconnect(self, reason):
+        # Closes a slow consumer. Shutting the socket down also ends its handler's recv loop,
+        # which does the usual cleanup. Caller holds the lock.
+        logging.warning(f"Disconnecting slow consumer {self.peer()}: {reason}")
+        self.closed = True
+        self.queue.clear()
+        self.ready.notify_all()
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+    def peer(self):
+        try:
+            return self.conn.getpeername()
+        except (socket.error, AttributeError):
+            return "unknown"
+
+    def metrics(self):
+        # Queue depth and counters for this connection.
+        return {
+            "peer": str(self.peer()),
+            "depth": len(self.queue),
+            "peak_depth": self.peak_depth,
+            "congested": self.congested_since is not None,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced
+        }
+
+    def close(self):
+        # Stops the writer thread; anything still queued is discarded.
+        with self.lock:
+            self.closed = True
+            self.queue.clear()
+            self.ready.notify_all()
@@ -0,0 +1,137 @@
+import threading
+import secrets
+import hmac
+
+class Session:
+    # A username seated in a room, the connection that owns it and its ownership token.
+    __slots__ = ("conn", "room_id", "username", "token", "symbol", "expiry")
+
+    def __init__(self, conn, room_id, username, token, symbol):
+        self.conn = conn  # Owning connection, or None while the owner is disconnected
+        self.room_id = room_id
+        self.username = username
+        self.token = token  # Secret given to the owner; presenting it proves ownership from another connection
+        self.symbol = symbol  # "X" or "O"
+        self.expiry = None  # Timer that frees the seat if a disconnected owner does not resume
+
+class SessionRegistry:
+    # Indexes of who plays as whom, kept in both directions so every lookup is O(1):
+    # (room id, username) -> Session, connection -> its Sessions, room id -> its Sessions,
+    # and connection -> the room it is seated in.
+    # One connection may own several usernames (hot-seat play on one client).
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_name = {}  # (room_id, username) -> Session
+        self.by_conn = {}  # conn -> {(room_id, username): Session}
+        self.by_room = {}  # room_id -> {username: Session}
+        self.seats = {}  # conn -> room_id it is currently seated in
+
+    def owner(self, room_id, username):
+        # Returns the Session for a username in a room, or None if nobody holds it.
+        return self.by_name.get((room_id, username))
+
+    def authorize(self, conn, room_id, username, token=None):
+        # True if conn may act as username in the room: it owns the username,
+        # or it presents the username's token.
+        session = self.by_name.get((room_id, username))
+        if session is None:
+            return False
+        if session.conn is conn:
+            return True
+        return bool(token) and hmac.compare_digest(str(token), session.token)
+
+    def claim(self, conn, room_id, username, symbol):
+        # Gives a free username to conn with a new ownership token. Returns the Session.
+        session = Session(conn, room_id, username, secrets.token_urlsafe(16), symbol)
+        key = (room_id, username)
+        with self.lock:
+            self.by_name[key] = session
+            self.by_conn.setdefault(conn, {})[key] = session
+            self.by_room.setdefault(room_id, {})[username] = session
+        return session
+
+    def restore(self, room_id, username, token, symbol):
+        # Recreates a Session handed over by another server process. It has no connection
+        # until its owner resumes with the token.
+        session = Session(None, room_id, username, token, symbol)
+        with self.lock:
+            self.by_name[(room_id, username)] = session
+            self.by_room.setdefault(room_id, {})[username] = session
+        return session
+
+    def transfer(self, session, conn):
+        # Moves an owned username to another connection, e.g. after the owner reconnected.
+        # Returns the connection that owned it before.
+        key = (session.room_id, session.username)
+        with self.lock:
+            previous = session.conn
+            owned = self.by_conn.get(previous)
+            if owned is not None:
+                owned.pop(key, None)
+                if not owned:
+                    del self.by_conn[previous]
+            session.conn = conn
+            self.by_conn.setdefault(conn, {})[key] = session
+        return previous
+
+    def detach(self, session):
+        # Keeps a username seated for an owner that lost its connection, until it resumes
+        # with the token or the seat is released.
+        key = (session.room_id, session.username)
+        with self.lock:
+            owned = self.by_conn.get(session.conn)
+            if owned is not None:
+                owned.pop(key, None)
+                if not owned:
+                    del self.by_conn[session.conn]
+            session.conn = None
+
+    def release(self, session):
+        # Frees a username so anyone can take it again.
+        key = (session.room_id, session.username)
+        with self.lock:
+            if self.by_name.get(key) is not session:
+                return
+            del self.by_name[key]
+            owned = self.by_conn.get(session.conn)
+            if owned is not None:
+                owned.pop(key, None)
+                if not owned:
+                    del self.by_conn[session.conn]
+            in_room = self.by_room.get(session.room_id)
+            if in_room is not None:
+                in_room.pop(session.username, None)
+                if not in_room:
+                    del self.by_room[session.room_id]
+
+    def sessions_of(self, conn, room_id=None):
+        # Returns the Sessions owned by conn, optionally only those in one room.
+        with self.lock:
+            sessions = list(self.by_conn.get(conn, {}).values())
+        if room_id is not None:
+            sessions = [session for session in sessions if session.room_id == room_id]
+        return sessions
+
+    def sessions_in(self, room_id):
+        with self.lock:
+            return list(self.by_room.get(room_id, {}).values())
+
+    def seat(self, conn, room_id):
+        # Records the room conn plays in; messages from conn are routed there.
+        with self.lock:
+            self.seats[conn] = room_id
+
+    def unseat(self, conn, room_id):
+        # Forgets conn's seat, unless it has meanwhile moved to another room.
+        with self.lock:
+            if self.seats.get(conn) == room_id:
+                del self.seats[conn]
+
+    def room_of(self, conn):
+        return self.seats.get(conn)
+
+    def is_seated(self, conn):
+        return conn in self.seats
+
+    def count(self):
+        return len(self.by_name)
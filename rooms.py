@@ -0,0 +1,177 @@
+import threading
+import queue
+import logging
+import math
+import time
+from collections import deque
+from chat import ChatChannel
+from engine import pack_board
+from compact import CompactGame
+from clocks import default_time_control
+
+ACTOR_WORKERS = 8  # Threads shared by all room actors; rooms beyond this take turns
+ACTOR_BATCH = 32  # Commands an actor runs before giving its worker to another room
+EVENT_LOG_SIZE = 64  # Broadcasts kept per room for players resuming after a dropped connection
+RATE_WINDOW = 60.0  # Seconds over which a room's move rate is averaged
+
+class ActorPool:
+    # Worker threads that run room actors. An actor is handed to one worker at a time,
+    # so each room's commands run in order while different rooms run in parallel.
+    def __init__(self, workers=ACTOR_WORKERS):
+        self.ready = queue.SimpleQueue()  # Actors with commands waiting
+        self.threads = []
+        for _ in range(workers):
+            thread = threading.Thread(target=self.worker_loop)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def worker_loop(self):
+        while True:
+            actor = self.ready.get()
+            if actor is None:
+                return
+            actor.run_batch()
+
+    def close(self):
+        for _ in self.threads:
+            self.ready.put(None)
+
+class InlinePool:
+    # Stand-in for ActorPool that runs an actor's commands in the thread that submits them.
+    # Each room still runs its commands one at a time and in order, but a single-threaded
+    # simulation sees every command finish before submit() returns.
+    def __init__(self):
+        self.ready = self  # Actors call pool.ready.put(actor) to be run
+
+    def put(self, actor):
+        actor.run_batch()
+
+    def close(self):
+        pass
+
+class Actor:
+    # A mailbox of commands that are run one at a time, in the order they were submitted.
+    def __init__(self, pool, name):
+        self.pool = pool
+        self.name = name
+        self.mailbox = deque()  # (function, args), oldest first
+        self.lock = threading.Lock()
+        self.scheduled = False  # True while the actor is queued on or running in the pool
+        self.processed = 0  # Commands run so far
+
+    def submit(self, function, *args):
+        # Queues function(*args) to run on this actor. Never blocks on the room's work.
+        with self.lock:
+            self.mailbox.append((function, args))
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.pool.ready.put(self)
+
+    @property
+    def depth(self):
+        return len(self.mailbox)
+
+    def run_batch(self):
+        # Runs up to ACTOR_BATCH commands, then requeues the actor if it still has work.
+        for _ in range(ACTOR_BATCH):
+            with self.lock:
+                if not self.mailbox:
+                    self.scheduled = False
+                    return
+                function, args = self.mailbox.popleft()
+            try:
+                function(*args)
+            except Exception:
+                logging.exception(f"Error in room {self.name}")
+            self.processed += 1
+        with self.lock:
+            if not self.mailbox:
+                self.scheduled = False
+                return
+        self.pool.ready.put(self)
+
+class RateMeter:
+    # Events per second, averaged with an exponential decay over about RATE_WINDOW seconds.
+    # Recording and reading are O(1), with nothing kept per event.
+    def __init__(self, window=RATE_WINDOW):
+        self.window = window
+        self.rate = 0.0
+        self.updated = time.monotonic()
+        self.total = 0
+
+    def decayed(self, now):
+        return self.rate * math.exp((self.updated - now) / self.window)
+
+    def record(self):
+        now = time.monotonic()
+        self.rate = self.decayed(now) + 1 / self.window
+        self.updated = now
+        self.total += 1
+
+    def per_second(self):
+        return self.decayed(time.monotonic())
+
+def new_game_state():
+    # Returns the state of an empty board waiting for players.
+    return {
+        "board": [["" for _ in range(3)] for _ in range(3)],  # 3x3 game board initialized as empty
+        "next_turn": None,  # Player whose turn is next
+        "status": "waiting for players"  # Game status; could be 'waiting for players', 'ongoing', 'win', or 'draw'
+    }
+
+class Room:
+    # One game and everything about it. Only the room's actor reads or changes these fields.
+    def __init__(self, room_id, pool, state=None, players=None):
+        self.room_id = room_id
+        self.state = state if state is not None else new_game_state()
+        self.players = players if players is not None else set()  # Usernames seated in the game
+        self.seats = {"X": None, "O": None}  # Symbol -> username playing it; X moves first
+        self.members = {}  # Client connection -> username it currently plays as in this room
+        self.chat = ChatChannel()
+        self.seq = 0  # Sequence number of the room's latest broadcast
+        self.events = deque(maxlen=EVENT_LOG_SIZE)  # (seq, message_type, encoded message), oldest first
+        self.time_control = default_time_control()  # Set by the first player to join
+        self.clock = None  # GameClock of the game in progress, or None
+        self.moves = RateMeter()  # Moves played, for the admin console
+        self.actor = Actor(pool, room_id)
+
+    def free_symbol(self):
+        # Returns the first unclaimed symbol, or None if both seats are taken.
+        for symbol, username in self.seats.items():
+            if username is None:
+                return symbol
+        return None
+
+    def record(self, message_type, encode):
+        # Numbers a broadcast and keeps it for resuming players. Returns the encoded message.
+        # encode: Callable taking the sequence number and returning the encoded message
+        self.seq += 1
+        message = encode(self.seq)
+        self.events.append((self.seq, message_type, message))
+        return message
+
+    def events_since(self, seq):
+        # Returns the broadcasts after seq, or None if some of them are no longer kept.
+        if not isinstance(seq, int) or seq > self.seq:
+            return None
+        if self.events and seq < self.events[0][0] - 1:
+            return None
+        if not self.events and seq < self.seq:
+            return None
+        return [event for event in self.events if event[0] > seq]
+
+    def to_compact(self):
+        # Returns the game as a CompactGame, as mirrored for sidecars (see livestate.py).
+        x_mask, o_mask = pack_board(self.state["board"])
+        next_turn = self.state["next_turn"]
+        next_symbol = None
+        for symbol, username in self.seats.items():
+            if username is not None and username == next_turn:
+                next_symbol = symbol
+        return CompactGame(x_mask, o_mask, next_symbol, self.state["status"], self.seats["X"], self.seats["O"])
+
+    def submit(self, function, *args):
+        # Runs function(self, *args) on the room's actor.
+        self.actor.submit(function, self, *args)
@@ -2,8 +2,29 @@ import socket
 import threading
 import logging
 import sys
+import os
+import stat
+import struct
+import select
 import json
-from encryption import MessageEncryption, KeyExchange
+import itertools
+import queue
+from cryptography.fernet import InvalidToken
+from encryption import MessageEncryption, KeyExchange, FrameReader, PlainText
+from stats import PlayerStats
+from spectators import SpectatorHub
+from chat import MAX_CHAT_LENGTH
+from outbound import OutboundQueue, SLOW_CONSUMER_DEADLINE
+from timerwheel import TimerWheel
+from admission import AdmissionController
+from rooms import ActorPool, InlinePool, Room, new_game_state
+from registry import SessionRegistry
+from engine import pack_board, game_result
+from clocks import GameClock, parse_time_control
+from solver import evaluate_chunks
+from admin import AdminConsole
+from livestate import LiveStateArena
+from handoff import HANDOFF_TIMEOUT, send_handoff, receive_handoff, confirm_handoff
 import time
 
 logging.basicConfig(
@@ -18,27 +39,68 @@ logging.basicConfig(
 # Default server settings for IP and port
 HOST = '0.0.0.0'  # Listen on all network interfaces
 PORT = 65432
+TCP_ENABLED = True  # Listen on HOST:PORT; off when only a Unix socket is asked for
+UNIX_SOCKET = None  # Path of a Unix domain socket to listen on as well, or None
+TRUST_LOCAL = False  # Skip the key exchange and encryption on the Unix socket, which only the server's user can then open
+ADMIN_SOCKET = None  # Path of the admin console's Unix socket, or None for no console
 RUNNING = True  # Control flag for server operation
+DRAINING = False  # Set by the admin console: accept no connections or new games, and exit once games finish
+DRAIN_CHECK_INTERVAL = 1  # Seconds between checks for the last game ending while draining
+LIVE_STATE = None  # File to mirror live room state into for sidecar readers (livestate.py), or None
+state_arena = None  # LiveStateArena writing LIVE_STATE, opened when the server starts
+TAKEOVER = None  # Admin socket path of a running server to take over from, or None to start afresh
+HANDED_OFF = False  # Set once a new process has taken over this one's sockets and rooms
+HANDOFF_DRAIN = 2  # Seconds a handoff waits for restart notices to be sent and clients to close
+handoff_requests = queue.SimpleQueue()  # (admin connection, time.monotonic() deadline, Event set when done) for the accept loop
 clients = []  # List to keep track of connected clients
+connection_ids = {}  # Maps client connections to the number the admin console shows for them
+next_connection_id = itertools.count(1)
+draining_clients = set()  # Connections closed by the admin console once their game ends
 client_encryptions = {}  # Map client connections to their encryption objects
+STATS_DB = 'stats.db'  # SQLite file holding per-player wins, losses, draws and ratings
+player_stats = None  # PlayerStats store, opened when the server starts
+DEFAULT_ROOM = "main"  # Room joined when a message names no room; it always exists
+MAX_ROOM_ID_LENGTH = 32  # Longest room id a client may create
+outbound_queues = {}  # Maps client connections to their bounded send buffer and writer thread
+PING_INTERVAL = 15  # Seconds of silence from a client before the server pings it
+IDLE_TIMEOUT = 45  # Seconds of silence from a client before its connection is closed
+last_seen = {}  # Maps client connections to when the server last heard from them
+RESUME_GRACE = 60  # Seconds a disconnected player's seat is held for them to resume
+heartbeat_timers = {}  # Maps client connections to their pending heartbeat check
+timer_wheel = TimerWheel()  # One wheel, ticked by one thread, tracks every connection's deadlines
+admission = AdmissionController()  # Connection and message limits used to shed load
+SPECTATOR_MESSAGE_TYPES = ("game_update", "game_result")  # Snapshots forwarded to spectators
+spectator_hub = None  # SpectatorHub for read-only watchers, started with the server
+actor_pool = None  # ActorPool running room actors, started with the server
+rooms = {}  # Maps room ids to Room objects
+rooms_lock = threading.Lock()  # Guards creating and closing rooms, not gameplay
+sessions = SessionRegistry()  # Who plays as whom, with ownership tokens
+pending_rooms = {}  # Maps client connections to the room a queued join, resume or spectate takes them to
+pending_lock = threading.Lock()  # Guards pending_rooms, set by handler threads and cleared by room actors
+replying = threading.local()  # (conn, id) of the command the current thread is handling, for tagging replies
+MAX_BATCH_COMMANDS = 100  # Most commands one batch message may carry
 
-# Initialize key exchange
-key_exchange = KeyExchange()
+MAX_EVAL_BATCH = 10000  # Most boards one evaluate request may ask about
+ERROR_FLUSH_TIMEOUT = 1.0  # Seconds spent sending the error for a malformed frame before the connection is closed
 
-# Current game state including board status, turn info, and game status
-game_state = {
-    "board": [["" for _ in range(3)] for _ in range(3)],  # 3x3 game board initialized as empty
-    "next_turn": None,  # Player whose turn is next
-    "status": "waiting for players"  # Game status; could be 'waiting for players', 'ongoing', 'win', or 'draw'
-}
-usernames = set()  # Set of usernames to ensure unique players
-client_usernames = {}  # Maps client connections to usernames
+SERVER_KEY_FILE = 'server_key.pem'  # RSA private key kept between runs; delete it to get a new key
+key_exchange = None  # KeyExchange with the server's RSA key, loaded when the server starts
+
+# Game state of the default room including board status, turn info, and game status
+game_state = new_game_state()
+usernames = set()  # Usernames seated in the default room
 
 def handle_arguments():
     # Parses command-line arguments to set custom IP address and port number for the server.
     # Displays help if needed and validates argument values.
     global PORT
     global HOST
+    global TCP_ENABLED
+    global UNIX_SOCKET
+    global TRUST_LOCAL
+    global ADMIN_SOCKET
+    global TAKEOVER
+    global LIVE_STATE
     n = len(sys.argv)
     i = 1
     port_specified = False
@@ -48,8 +110,43 @@ def handle_arguments():
             print("Usage:")
             print("-h              Show this help message")
             print("-i Host-IP      Set the host IP address (default: 127.0.0.1)")
-            print("-p Host-Port    Set the host port number (REQUIRED)")
+            print("-p Host-Port    Set the host port number (REQUIRED unless -u is given)")
+            print("-u Socket-Path  Also listen on a Unix domain socket; without -p, only listen there")
+            print("-t              Trust Unix socket clients: no encryption, and only the server's user may connect")
+            print("-a Socket-Path  Open the admin console on this Unix socket (use admin.py to talk to it)")
+            print("-R Socket-Path  Take over the listening sockets and games of the server with this admin socket")
+            print("-m File         Mirror live room state into this file for livestate.py readers (e.g. /dev/shm/tictactoe)")
             sys.exit(0)
+        elif arg == "-m":
+            if i + 1 < n:
+                LIVE_STATE = sys.argv[i + 1]
+                i += 1
+            else:
+                print("Error: -m requires a file path")
+                sys.exit(1)
+        elif arg == "-R":
+            if i + 1 < n:
+                TAKEOVER = sys.argv[i + 1]
+                i += 1
+            else:
+                print("Error: -R requires the running server's admin socket path")
+                sys.exit(1)
+        elif arg == "-a":
+            if i + 1 < n:
+                ADMIN_SOCKET = sys.argv[i + 1]
+                i += 1
+            else:
+                print("Error: -a requires a socket path")
+                sys.exit(1)
+        elif arg == "-u":
+            if i + 1 < n:
+                UNIX_SOCKET = sys.argv[i + 1]
+                i += 1
+            else:
+                print("Error: -u requires a socket path")
+                sys.exit(1)
+        elif arg == "-t":
+            TRUST_LOCAL = True
         elif arg == "-i":
             if i + 1 < n:
                 ip = sys.argv[i + 1]
@@ -81,145 +178,525 @@ def handle_arguments():
             sys.exit(1)
         i += 1
 
+    if TRUST_LOCAL and UNIX_SOCKET is None:
+        print("Error: -t needs a Unix socket (-u)")
+        sys.exit(1)
     if not port_specified:
+        if UNIX_SOCKET is not None or TAKEOVER is not None:
+            TCP_ENABLED = False
+            return
         print("Error: Port number (-p) is required")
         print("Use -h for help")
         sys.exit(1)
 
+def encode_message(message_type, data, seq=None, request_id=None):
+    # Serialises a message once so it can be sent to any number of clients.
+    # seq: Room sequence number, for messages kept in the room's event log
+    # request_id: Id of the client command this message replies to
+    message = {"type": message_type, "data": data}
+    if seq is not None:
+        message["seq"] = seq
+    if request_id is not None:
+        message["id"] = request_id
+    return json.dumps(message) + '\n'
+
+def send_encoded(conn, message_type, message):
+    # Queues an already serialised message for one client without waiting on its socket.
+    # conn: Client connection
+    # message_type: Type of the message, used to decide what a slow client can skip
+    # message: Output of encode_message
+    outq = outbound_queues.get(conn)
+    if outq:
+        outq.put(message_type, message)
+
 def send_message(conn, message_type, data):
     # Sends a JSON-encoded message to the client.
     # conn: Client connection
     # message_type: Type of the message (e.g., "move_ack", "chat")
     # data: Message payload
-    try:
-        message = json.dumps({"type": message_type, "data": data}) + '\n'
-        if conn in client_encryptions:
-            encryption = client_encryptions[conn]
-            encrypted_message = encryption.encrypt_message(message)
-            # Add a small delay between messages to prevent message corruption
-            time.sleep(0.05)
-            conn.sendall(encrypted_message)
-    except socket.error as e:
-        logging.error(f"Error sending message: {e}")
+    # A reply to a command that carried an id is tagged with that id
+    request_id = None
+    current = getattr(replying, "command", None)
+    if current is not None and current[0] is conn:
+        request_id = current[1]
+    send_encoded(conn, message_type, encode_message(message_type, data, request_id=request_id))
 
-def handle_client(conn, addr):
+def handle_client(conn, addr, trusted=False):
     # Manages a single client's connection, receiving messages and handling them.
     # conn: Client connection
     # addr: Client's address
+    # trusted: True for a local client on the trusted Unix socket, which skips the key exchange
     logging.info(f"New connection from {addr}")
+    watch_connection(conn)
     
     try:
-        # First, send our public key to the client
-        conn.sendall(key_exchange.get_public_key_bytes())
-        
-        # Receive the encrypted symmetric key from the client
-        encrypted_symmetric_key = conn.recv(1024)
-        if not encrypted_symmetric_key:
-            return
-            
-        # Decrypt the symmetric key and create encryption object for this client
-        symmetric_key = key_exchange.decrypt_symmetric_key(encrypted_symmetric_key)
-        client_encryptions[conn] = MessageEncryption(symmetric_key)
-            
-        # Add client to the list after successful key exchange
-        clients.append(conn)
+        if trusted:
+            # Messages are plain JSON lines; only the server's own user can reach this socket
+            client_encryptions[conn] = PlainText()
+            data = b""
+        else:
+            # First, send our public key to the client
+            conn.sendall(key_exchange.get_public_key_bytes())
+
+            # Receive the encrypted symmetric key from the client. It is exactly one RSA block;
+            # anything after it is the client's first messages
+            key_length = key_exchange.private_key.key_size // 8
+            encrypted_symmetric_key = b""
+            while len(encrypted_symmetric_key) < key_length:
+                chunk = conn.recv(1024)
+                if not chunk:
+                    return
+                encrypted_symmetric_key += chunk
+            encrypted_symmetric_key, data = encrypted_symmetric_key[:key_length], encrypted_symmetric_key[key_length:]
+
+            # Decrypt the symmetric key and create encryption object for this client
+            symmetric_key = key_exchange.decrypt_symmetric_key(encrypted_symmetric_key)
+            client_encryptions[conn] = MessageEncryption(symmetric_key)
+        open_connection(conn, OutboundQueue(conn, client_encryptions[conn], lambda: watch_congestion(conn)))
         
-        while True:
-            encrypted_message = conn.recv(1024)
-            if not encrypted_message:
+        reader = FrameReader(client_encryptions[conn])
+        received_at = time.monotonic()
+        malformed = None  # Why the last frame could not be read, which ends the connection
+        while malformed is None:
+            try:
+                frames = reader.frames(data)
+            except ValueError as e:
+                frames, malformed = [], e
+            for frame in frames:
+                try:
+                    message = json.loads(client_encryptions[conn].decrypt_message(frame))
+                    if not isinstance(message, dict):
+                        raise ValueError("Message is not an object")
+                except (ValueError, InvalidToken, json.JSONDecodeError) as e:
+                    malformed = e
+                    break
+                handle_message(conn, message, received_at)
+            if malformed is not None:
+                break
+            data = conn.recv(4096)
+            if not data:
                 break
-            encryption = client_encryptions[conn]
-            decrypted_message = encryption.decrypt_message(encrypted_message)
-            handle_message(conn, json.loads(decrypted_message))
+            received_at = time.monotonic()
+            last_seen[conn] = received_at
+        if malformed is not None:
+            # The stream can't be trusted past a bad frame, so say why and hang up
+            logging.warning(f"Closing connection with {addr} after a malformed frame: {malformed!r}")
+            send_message(conn, "error", {"message": "Malformed message; closing the connection."})
+            outbound_queues[conn].flush(ERROR_FLUSH_TIMEOUT)
     except socket.error as e:
         logging.error(f"Socket error with {addr}: {e}")
-        handle_quit(conn, None)  # Let handle_quit handle the cleanup
+        room = rooms.get(sessions.room_of(conn))
+        if room:
+            room.submit(handle_quit, conn, None)  # Let handle_quit handle the cleanup
     finally:
-        if conn in client_usernames:
-            username = client_usernames[conn]
-            usernames.discard(username)
-            del client_usernames[conn]
-        if conn in client_encryptions:
-            del client_encryptions[conn]
+        close_connection(conn)
         conn.close()
-        if conn in clients:
-            clients.remove(conn)
+        admission.release_connection()
         logging.info(f"Connection closed with {addr}")
 
-def handle_message(conn, message):
+def open_connection(conn, transport):
+    # Starts serving a client whose handshake is done.
+    # conn: Client connection; any hashable object with getpeername() and shutdown() will do
+    # transport: What messages to the client are put on: an OutboundQueue for sockets, or an
+    #            in-memory transport (see loopback.py) with the same put, close, metrics and depth
+    outbound_queues[conn] = transport
+    connection_ids[conn] = next(next_connection_id)
+    clients.append(conn)
+
+def close_connection(conn):
+    # Forgets a client that went away, holding its seats for it to resume.
+    unwatch_connection(conn)
+    with pending_lock:
+        pending_rooms.pop(conn, None)
+    for room_id in {session.room_id for session in sessions.sessions_of(conn)}:
+        room = rooms.get(room_id)
+        if room:
+            room.submit(drop_connection, conn, True)
+    spectator_hub.unsubscribe(conn)
+    if conn in client_encryptions:
+        del client_encryptions[conn]
+    if conn in outbound_queues:
+        outbound_queues.pop(conn).close()
+    connection_ids.pop(conn, None)
+    draining_clients.discard(conn)
+    if conn in clients:
+        clients.remove(conn)
+
+def watch_connection(conn):
+    # Starts tracking a connection's heartbeat from the moment it is accepted.
+    last_seen[conn] = time.monotonic()
+    heartbeat_timers[conn] = timer_wheel.schedule(PING_INTERVAL, lambda: check_heartbeat(conn))
+
+def unwatch_connection(conn):
+    last_seen.pop(conn, None)
+    timer = heartbeat_timers.pop(conn, None)
+    if timer:
+        timer_wheel.cancel(timer)
+
+def check_heartbeat(conn):
+    # Runs on the timer thread when a connection's heartbeat deadline comes up.
+    # Any message from the client counts as a sign of life, so receiving only records a
+    # timestamp and the deadline is worked out lazily here instead of rescheduled per message.
+    if conn not in last_seen:
+        return
+    idle = time.monotonic() - last_seen[conn]
+    if idle >= IDLE_TIMEOUT:
+        logging.info(f"Closing idle connection after {idle:.0f}s without a reply")
+        heartbeat_timers.pop(conn, None)
+        try:
+            # Makes the handler's recv return so it runs the usual cleanup
+            conn.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        return
+    if idle >= PING_INTERVAL:
+        send_message(conn, "ping", {})
+        delay = min(PING_INTERVAL, IDLE_TIMEOUT - idle)
+    else:
+        delay = PING_INTERVAL - idle
+    heartbeat_timers[conn] = timer_wheel.schedule(delay, lambda: check_heartbeat(conn))
+
+def watch_congestion(conn):
+    # Called when a connection's send queue becomes congested. Enforces the slow consumer
+    # deadline on the timer wheel, so a client that stops reading is closed even if nothing
+    # more is ever sent to it.
+    timer_wheel.schedule(SLOW_CONSUMER_DEADLINE, lambda: check_congestion(conn))
+
+def check_congestion(conn):
+    transport = outbound_queues.get(conn)
+    if transport is None:
+        return
+    left = transport.check_deadline()
+    if left is not None:
+        # Timers never fire early, but the float arithmetic can leave a moment to go
+        timer_wheel.schedule(left, lambda: check_congestion(conn))
+
+def handle_message(conn, message, received_at=None):
     # Processes received messages based on message type and dispatches to specific handlers.
+    # Messages about a room are queued on that room's actor, so each room handles its
+    # messages one at a time while different rooms run in parallel.
+    # Low priority messages are refused here while the server is overloaded.
+    # conn: Client connection
+    # message: JSON-decoded message dictionary
+    # received_at: time.monotonic() when the message arrived, used to measure queue latency
+    message_type = message.get("type")
+    if message_type == "batch":
+        data = message.get("data")
+        handle_batch(conn, data.get("commands") if isinstance(data, dict) else None, received_at)
+        return
+    if not admission.begin(message_type):
+        refuse_command(conn, message.get("id"), {
+            "message": f"Server busy, retry after {admission.retry_after} seconds.",
+            "retry_after": admission.retry_after
+        })
+        return
+    if received_at is None:
+        received_at = time.monotonic()
+    try:
+        room = route_message(conn, message)
+        if room is not None:
+            room.submit(run_message, conn, message, received_at)
+    except Exception:
+        # run_message gives the admission back once it runs; until then it is ours to give back
+        admission.end()
+        raise
+    if room is None:
+        run_message(None, conn, message, received_at)
+
+def handle_batch(conn, commands, received_at=None):
+    # Handles the commands of a batch message in order, as if each had arrived on its own.
+    # One frame carries them all, so the client pays for one encryption and the server for
+    # one decryption. Replies to a command carry its "id", and "done" follows the last one.
+    # conn: Client connection
+    # commands: List of {"id", "type", "data"} messages
+    if not isinstance(commands, list) or not commands:
+        send_message(conn, "error", {"message": "A batch needs a list of commands."})
+        return
+    if len(commands) > MAX_BATCH_COMMANDS:
+        send_message(conn, "error", {"message": f"A batch may carry at most {MAX_BATCH_COMMANDS} commands."})
+        return
+    for command in commands:
+        if not isinstance(command, dict) or command.get("type") == "batch":
+            refuse_command(conn, command.get("id") if isinstance(command, dict) else None,
+                           {"message": "Invalid command in batch."})
+            continue
+        handle_message(conn, command, received_at)
+
+def refuse_command(conn, request_id, data):
+    # Sends the error for a command refused before it ran, followed by "done" when the command
+    # has an id, just as if it had run and failed.
+    send_encoded(conn, "error", encode_message("error", data, request_id=request_id))
+    if request_id is not None:
+        send_encoded(conn, "done", encode_message("done", {}, request_id=request_id))
+
+def route_message(conn, message):
+    # Returns the room whose actor should handle a message, or None if it needs no room.
+    # A command sent right behind a join (pipelined, or in the same batch) follows the join
+    # to its room, even though the join has not run yet.
+    message_type = message.get("type")
+    data = message.get("data") or {}
+    if not isinstance(data, dict):
+        return None
+    if message_type in ("join", "spectate", "resume"):
+        room_id = data.get("room") or DEFAULT_ROOM
+        if not isinstance(room_id, str):
+            return None
+        room = get_room(room_id, create=message_type == "join")
+        if room is not None:
+            with pending_lock:
+                pending_rooms[conn] = room
+        return room
+    if message_type in ("move", "chat", "quit", "reset"):
+        room = pending_rooms.get(conn)
+        if room is not None:
+            return room
+        room_id = sessions.room_of(conn) or spectator_hub.room_of(conn) or DEFAULT_ROOM
+        return rooms.get(room_id)
+    return None
+
+def get_room(room_id, create=False):
+    # Looks up a room by id, creating it if asked to.
+    room = rooms.get(room_id)
+    if room is None and create and isinstance(room_id, str) and 0 < len(room_id) <= MAX_ROOM_ID_LENGTH:
+        with rooms_lock:
+            room = rooms.get(room_id)
+            if room is None:
+                room = rooms[room_id] = Room(room_id, actor_pool)
+                logging.info(f"Created room {room_id}")
+    return room
+
+def close_room_if_empty(room):
+    # Forgets a room once nobody plays in or watches it. The default room always stays.
+    if room.room_id == DEFAULT_ROOM or room.members or room.players or spectator_hub.count(room.room_id):
+        return
+    with rooms_lock:
+        if rooms.get(room.room_id) is room:
+            del rooms[room.room_id]
+            room.chat.forget_all()
+            if state_arena is not None:
+                state_arena.release(room.room_id)
+            logging.info(f"Closed room {room.room_id}")
+            spectator_hub.publish_room(room.room_id, "room_closed", encode_message("room_closed", {"room": room.room_id}), closed=True)
+
+def run_message(room, conn, message, received_at):
+    # Handles one message, on the room's actor or inline for messages that need no room.
+    admission.started(time.monotonic() - received_at)
+    request_id = message.get("id")
+    previous = getattr(replying, "command", None)
+    replying.command = (conn, request_id) if request_id is not None else None
+    try:
+        dispatch_message(room, conn, message)
+    finally:
+        if request_id is not None:
+            send_message(conn, "done", {})
+        replying.command = previous
+        if message.get("type") in ("join", "spectate", "resume"):
+            with pending_lock:
+                if room is not None and pending_rooms.get(conn) is room:
+                    del pending_rooms[conn]
+        admission.end()
+
+def dispatch_message(room, conn, message):
+    # Calls the handler for a message's type.
+    # room: Room the message was routed to, or None
     # conn: Client connection
     # message: JSON-decoded message dictionary
     message_type = message.get("type")
-    username = message["data"].get("username") if "data" in message else None
+    data = message.get("data") or {}
+    if not isinstance(data, dict):
+        send_message(conn, "error", {"message": "Message data must be an object."})
+        return
+    username = data.get("username")
+
+    if message_type == "leaderboard":
+        handle_leaderboard(conn, username)
+        return
+    if message_type == "watch_rooms":
+        handle_watch_rooms(conn)
+        return
+    if message_type == "evaluate":
+        handle_evaluate(conn, data.get("boards"), data.get("id"))
+        return
+    if message_type == "ping":
+        send_message(conn, "pong", {})
+        return
+    if message_type == "pong":
+        return
+
+    if room is None:
+        send_message(conn, "error", {"message": "Unknown room."})
+        return
+
+    if message_type in ("move", "reset") and spectator_hub.is_spectator(conn):
+        send_message(conn, "error", {"message": "Spectators cannot play. Use join to take a seat."})
+        return
+
+    # Acting as a username requires owning it, checked with O(1) index lookups
+    if message_type in ("move", "chat", "reset") and username in room.players \
+            and not sessions.authorize(conn, room.room_id, username, data.get("token")):
+        send_message(conn, "error", {"message": f"You are not playing as {username}."})
+        return
 
     if message_type == "join":
-        handle_join(conn, username)
+        handle_join(room, conn, username, data.get("token"), data.get("time_control"))
+    elif message_type == "resume":
+        handle_resume(room, conn, username, data.get("token"), data.get("last_seq"))
     elif message_type == "move":
-        handle_move(conn, username, message["data"].get("position"))
+        handle_move(room, conn, username, data.get("position"))
     elif message_type == "chat":
-        handle_chat(conn, username, message["data"].get("message"))
+        handle_chat(room, conn, username, data.get("message"))
     elif message_type == "quit":
-        handle_quit(conn, username)
+        handle_quit(room, conn, username)
     elif message_type == "reset":
-        handle_reset(conn, username)
+        handle_reset(room, conn, username)
+    elif message_type == "spectate":
+        handle_spectate(room, conn)
 
-def handle_join(conn, username):
+def handle_join(room, conn, username, token=None, time_control=None):
     # Manages new player joining the game, ensuring unique usernames and player limits.
+    # A new player gets a seat (X or O) and an ownership token. A username held by another
+    # connection can only be taken over by presenting its token.
+    # room: Room being joined
     # conn: Client connection
     # username: Requested username for the player
-    
+    # token: Ownership token of the username, when reclaiming it from another connection
+    # time_control: Optional {"move", "total", "increment"} seconds, used if the room is empty
+    if rooms.get(room.room_id) is not room:
+        # The room closed while this join was queued; join its replacement instead
+        get_room(room.room_id, create=True).submit(handle_join, conn, username, token, time_control)
+        return
+
+    players = room.players
+    game_state = room.state
+
     # Check if the game is full or the username is invalid
-    if len(usernames) >= 2 and username not in usernames:
+    if len(players) >= 2 and username not in players:
         send_message(conn, "error", {"message": "Game is full. Please wait for the next game."})
         return
-    if not username:
+    if not username or not isinstance(username, str):
         send_message(conn, "error", {"message": "Invalid username."})
         return
+    if (DRAINING or conn in draining_clients) and username not in players:
+        send_message(conn, "error", {"message": "The server is shutting down and starts no new games."})
+        return
+    if time_control is not None and not players:
+        try:
+            room.time_control = parse_time_control(time_control)
+        except ValueError as e:
+            send_message(conn, "error", {"message": str(e)})
+            return
 
-    # If this client already has a username, it's switching
-    switching = conn in client_usernames
-    
-    # If another client is using this username, it's also switching
-    if not switching and username in [name for name in client_usernames.values()]:
-        switching = True
+    session = sessions.owner(room.room_id, username)
+    if session is not None and session.conn is not conn:
+        if not sessions.authorize(conn, room.room_id, username, token):
+            send_message(conn, "error", {"message": f"Username {username} is taken. Send its token to reclaim it."})
+            return
+        # Reclaiming: the previous connection stops playing as this username
+        take_over(room, session, conn)
 
-    # Add username to the set if it's new
-    if username not in usernames:
-        usernames.add(username)
+    # A spectator taking a seat stops watching
+    spectator_hub.unsubscribe(conn)
+
+    # A client seated in another room leaves it
+    previous_room = rooms.get(sessions.room_of(conn))
+    if previous_room is not None and previous_room is not room:
+        previous_room.submit(drop_connection, conn)
+
+    # Switching if this client already plays in the room or the username was already seated
+    switching = conn in room.members or session is not None
+
+    # Seat the username if it's new
+    if session is None:
+        symbol = room.free_symbol()
+        session = sessions.claim(conn, room.room_id, username, symbol)
+        room.seats[symbol] = username
+        players.add(username)
         game_state["next_turn"] = game_state["next_turn"] or username
 
     # Update the client's username
-    client_usernames[conn] = username
+    room.members[conn] = username
+    sessions.seat(conn, room.room_id)
 
     # Send appropriate message based on whether switching or joining
+    ack = {"username": username, "token": session.token, "symbol": session.symbol, "room": room.room_id,
+           "time_control": room.time_control}
     if switching:
-        send_message(conn, "move_ack", {"message": f"Switched to username: {username}"})
+        send_message(conn, "move_ack", {"message": f"Switched to username: {username}", **ack})
     else:
-        send_message(conn, "move_ack", {"message": f"{username} joined the game."})
+        send_message(conn, "move_ack", {"message": f"{username} joined the game.", **ack})
+        send_chat_history(room, conn)
     
-    if len(usernames) == 2:
+    if len(players) == 2:
         game_state["status"] = "ongoing"
-        broadcast_message("chat", {
+        broadcast_message(room, "chat", {
             "username": "Server", 
             "message": f"Game started! {game_state['next_turn']}'s turn."
         })
+        if room.clock is None:
+            start_clock(room)
     
-    # update_all_clients()
-    
-    logging.info(f"{'Switched to' if switching else 'Joined as'} {username}")
+    publish_room_summary(room)
+    logging.info(f"{'Switched to' if switching else 'Joined as'} {username} in room {room.room_id}")
 
-def handle_move(conn, username, position):
+def handle_resume(room, conn, username, token, last_seq):
+    # Gives a player who lost their connection their seat back on a new connection.
+    # Broadcasts they missed are replayed from the room's event log; if some of them are
+    # no longer kept, the current game state and chat history are sent instead.
+    # room: Room the player was seated in
+    # conn: The player's new connection
+    # username: Username the player was seated as
+    # token: The username's ownership token
+    # last_seq: Sequence number of the last broadcast the player received
+    session = sessions.owner(room.room_id, username)
+    if session is None or not sessions.authorize(conn, room.room_id, username, token):
+        send_message(conn, "error", {"message": "Nothing to resume. Please join the game again."})
+        return
+    take_over(room, session, conn)
+    spectator_hub.unsubscribe(conn)
+    previous_room = rooms.get(sessions.room_of(conn))
+    if previous_room is not None and previous_room is not room:
+        previous_room.submit(drop_connection, conn)
+    room.members[conn] = username
+    sessions.seat(conn, room.room_id)
+
+    ack = {"message": f"Resumed as {username}.", "username": username, "token": session.token,
+           "symbol": session.symbol, "room": room.room_id, "seq": room.seq}
+    missed = room.events_since(last_seq)
+    if missed is None:
+        send_message(conn, "move_ack", {**ack, "snapshot": True})
+        send_encoded(conn, "game_update", encode_message("game_update", game_state_data(room), room.seq))
+        send_chat_history(room, conn)
+    else:
+        send_message(conn, "move_ack", {**ack, "replayed": len(missed)})
+        for _, message_type, message in missed:
+            send_encoded(conn, message_type, message)
+    broadcast_message(room, "chat", {"username": "Server", "message": f"{username} is back."})
+    logging.info(f"{username} resumed in room {room.room_id} ({'snapshot' if missed is None else f'{len(missed)} replayed'})")
+
+def take_over(room, session, conn):
+    # Moves a seated username to conn, after its owner reconnected or presented its token elsewhere.
+    if session.expiry is not None:
+        timer_wheel.cancel(session.expiry)
+        session.expiry = None
+    previous = sessions.transfer(session, conn)
+    if previous is not None and room.members.get(previous) == session.username:
+        del room.members[previous]
+        sessions.unseat(previous, room.room_id)
+
+def handle_move(room, conn, username, position):
     # Validates and processes player moves, updating the board and checking for game status.
+    # room: Room the move is made in
     # conn: Client connection
     # username: Player's username making the move
     # position: Target position on the board for the move
-    if username not in usernames:
+    players = room.players
+    game_state = room.state
+    if username not in players:
         send_message(conn, "error", {"message": "Username not recognized."})
         return
 
-    if len(usernames) != 2:
-        send_message(conn, "error", {"message": f"Invalid number of players. Currently, there are {len(usernames)} player(s). Please wait for another player to join or use the join command."})
+    if len(players) != 2:
+        send_message(conn, "error", {"message": f"Invalid number of players. Currently, there are {len(players)} player(s). Please wait for another player to join or use the join command."})
         return
 
     if not position or "row" not in position or "col" not in position:
@@ -235,142 +712,692 @@ def handle_move(conn, username, position):
         send_message(conn, "error", {"message": "It's not your turn."})
         return
 
-    symbol = "X" if username == list(usernames)[0] else "O"
+    # A move that arrives after the deadline but before its timer fired still loses on time
+    if room.clock is not None and room.clock.flagged():
+        flag_fall(room)
+        return
+
+    symbol = sessions.owner(room.room_id, username).symbol
     game_state["board"][row][col] = symbol
+    room.moves.record()
 
-    game_state["next_turn"] = [user for user in usernames if user != username][0]
+    game_state["next_turn"] = room.seats["O" if symbol == "X" else "X"]
+    if room.clock is not None:
+        room.clock.stop()
+        run_clock(room, "O" if symbol == "X" else "X")
 
-    update_all_clients()
-    check_game_status()
+    update_all_clients(room)
+    check_game_status(room)
 
     send_message(conn, "move_ack", {"message": f"Move accepted for {username} at position ({row}, {col})"})
 
-    logging.info(f"{username} made a move at position ({row}, {col})")
+    logging.info(f"{username} made a move at position ({row}, {col}) in room {room.room_id}")
 
-def handle_chat(conn, username, chat_message):
-    # Broadcasts chat messages to all connected players.
+def handle_chat(room, conn, username, chat_message):
+    # Sends a chat message to the room's players and spectators.
+    # Rate limiting is per seated player, so reconnecting does not reset it, and happens
+    # before anything is encoded, encrypted or logged.
+    # room: Room the chat belongs to
     # conn: Client connection
     # username: Player's username
     # chat_message: Chat message text
-    if username not in usernames or not chat_message:
+    if username not in room.players or not chat_message:
         send_message(conn, "error", {"message": "Invalid chat message or unrecognized username."})
+        return
+    allowed = room.chat.allow(username)
+    if allowed == "dropped":
+        return
+    if allowed == "limited":
+        send_message(conn, "error", {"message": "You are sending messages too quickly. Please slow down."})
+        logging.warning(f"Rate limiting chat from {username}")
+        return
+    if len(chat_message) > MAX_CHAT_LENGTH:
+        send_message(conn, "error", {"message": f"Chat messages are limited to {MAX_CHAT_LENGTH} characters."})
     else:
-        broadcast_message("chat", {"username": username, "message": chat_message})
+        room.chat.record(username, chat_message)
+        broadcast_message(room, "chat", {"username": username, "message": chat_message})
         logging.info(f"Broadcasting chat from {username}: {chat_message}")
 
-def handle_quit(conn, username):
+def handle_quit(room, conn, username):
     # Handles player quitting, updating game state and notifying other players.
+    # room: Room being left
     # conn: Client connection
     # username: Player's username
-    if username in usernames:
-        usernames.remove(username)
-        broadcast_message("chat", {"username": "Server", "message": f"{username} has left the game."})
-    if conn in client_usernames:
-        username = client_usernames[conn]
-        del client_usernames[conn]
-        broadcast_message("chat", {"username": "Server", "message": f"{username} has left the game. From the machine: {conn.getpeername()}" })
+    spectator_hub.unsubscribe(conn)
+    session = sessions.owner(room.room_id, username)
+    if session is not None and session.conn is conn:
+        unseat_player(room, session)
+        broadcast_message(room, "chat", {"username": "Server", "message": f"{username} has left the game."})
+    if conn in room.members:
+        username = room.members.pop(conn)
+        sessions.unseat(conn, room.room_id)
+        broadcast_message(room, "chat", {"username": "Server", "message": f"{username} has left the game. From the machine: {peer_name(conn)}" })
         logging.info(f"{username} has left the game.")
         # reset_game() # Maybe don't reset game when someone leaves
+    close_room_if_empty(room)
+    release_drained([conn])
 
-def handle_reset(conn, username):
+def drop_connection(room, conn, resumable=False):
+    # Silently removes a client that disconnected or moved to another room.
+    # resumable: True if the connection was lost, so its seats are held for RESUME_GRACE seconds
+    for session in sessions.sessions_of(conn, room.room_id):
+        if resumable:
+            hold_seat(room, session)
+        else:
+            unseat_player(room, session)
+    room.members.pop(conn, None)
+    sessions.unseat(conn, room.room_id)
+    close_room_if_empty(room)
+
+def hold_seat(room, session):
+    # Keeps a disconnected player's seat until they resume or the grace period runs out.
+    sessions.detach(session)
+    session.expiry = timer_wheel.schedule(RESUME_GRACE, lambda: room.submit(expire_seat, session))
+    broadcast_message(room, "chat", {
+        "username": "Server",
+        "message": f"{session.username} lost their connection. Their seat is held for {RESUME_GRACE} seconds."
+    })
+
+def expire_seat(room, session):
+    # Frees a held seat whose player did not resume in time.
+    session.expiry = None
+    if session.conn is not None or sessions.owner(room.room_id, session.username) is not session:
+        return
+    unseat_player(room, session)
+    broadcast_message(room, "chat", {"username": "Server", "message": f"{session.username} did not come back."})
+    logging.info(f"Seat of {session.username} in room {room.room_id} expired")
+    close_room_if_empty(room)
+
+def unseat_player(room, session):
+    # Frees a player's seat and username. The clocks wait until the seat is taken again.
+    stop_clock(room)
+    room.players.discard(session.username)
+    room.chat.forget(session.username)
+    if room.seats.get(session.symbol) == session.username:
+        room.seats[session.symbol] = None
+    sessions.release(session)
+    publish_room_summary(room)
+
+def handle_reset(room, conn, username):
     # Handles game reset requests from clients
+    # room: Room to reset
     # conn: Client connection
     # username: Player's username
-    if username not in usernames:
+    if username not in room.players:
         send_message(conn, "error", {"message": "You must join the game first."})
         return
-        
-    reset_game()
-    broadcast_message("chat", {
+
+    # Announced before the reset so the players being unseated still get the message
+    broadcast_message(room, "chat", {
         "username": "Server",
         "message": f"{username} has reset the game! Please rejoin with usernames to start a new game."
     })
+    reset_game(room)
+    close_room_if_empty(room)
+
+def handle_leaderboard(conn, username):
+    # Sends the top players and, if a username is given, that player's own rank.
+    # conn: Client connection
+    # username: Optional player to look up
+    data = {"top": player_stats.leaderboard()}
+    if username:
+        data["player"] = player_stats.rank(username)
+    send_message(conn, "leaderboard", data)
 
-def broadcast_message(message_type, data):
-    # Sends a message to all connected clients.
+def handle_spectate(room, conn):
+    # Subscribes a client to a room's game updates without taking a seat.
+    # room: Room to watch
+    # conn: Client connection
+    if sessions.is_seated(conn):
+        send_message(conn, "error", {"message": "Players cannot spectate. Quit the game first."})
+        return
+    spectator_hub.subscribe(conn, room.room_id, "game_update", encode_message("game_update", game_state_data(room)))
+    send_message(conn, "move_ack", {"message": f"Spectating room {room.room_id}."})
+    send_chat_history(room, conn)
+    logging.info(f"Client is spectating room {room.room_id} ({spectator_hub.count(room.room_id)} spectators)")
+
+def handle_watch_rooms(conn):
+    # Subscribes a client to a summary of every room, sent again whenever a room's game changes.
+    # conn: Client connection
+    spectator_hub.watch_rooms(conn)
+    # Watching starts first, so a room that changes while the listing is built is not missed
+    spectator_hub.seed_rooms({room.room_id: ("room_update", encode_message("room_update", room_summary(room)))
+                              for room in list(rooms.values())})
+    logging.info(f"Client {peer_name(conn)} is watching all rooms")
+
+def handle_evaluate(conn, boards, request_id=None):
+    # Sends perfect-play evaluations of a batch of boards, in chunks of "evaluation" messages.
+    # conn: Client connection
+    # boards: 3x3 list or 9 character string boards
+    # request_id: Optional id echoed in every chunk, so a client can tell its batches apart
+    if not isinstance(boards, list) or not boards:
+        send_message(conn, "error", {"message": "Evaluate needs a list of boards."})
+        return
+    if len(boards) > MAX_EVAL_BATCH:
+        send_message(conn, "error", {"message": f"At most {MAX_EVAL_BATCH} boards can be evaluated at once."})
+        return
+    for offset, results in evaluate_chunks(boards):
+        send_message(conn, "evaluation", {
+            "id": request_id,
+            "offset": offset,
+            "results": results,
+            "done": offset + len(results) == len(boards)
+        })
+    logging.info(f"Evaluated {len(boards)} boards for {peer_name(conn)}")
+
+def send_chat_history(room, conn):
+    # Sends the room's recent chat lines to a player or spectator who just arrived.
+    history = room.chat.recent()
+    if history:
+        send_message(conn, "chat_history", {"messages": history})
+
+def broadcast_message(room, message_type, data):
+    # Sends a message to everyone in a room.
+    # Players get every message; spectators get the latest game snapshots and chat
+    # in order, through the spectator hub.
+    # room: Room to send to
     # message_type: Type of the message
     # data: Message content
-    for client in clients:
-        send_message(client, message_type, data)
+    message = room.record(message_type, lambda seq: encode_message(message_type, data, seq))
+    for client in list(room.members):
+        send_encoded(client, message_type, message)
+    if message_type in SPECTATOR_MESSAGE_TYPES:
+        spectator_hub.publish(room.room_id, message_type, message)
+    else:
+        spectator_hub.publish_event(room.room_id, message_type, message)
+    if message_type == "game_update":
+        publish_room_summary(room)
+
+def peer_name(conn):
+    # Returns a client's address for messages, even if the socket is already closed.
+    try:
+        return conn.getpeername()
+    except (socket.error, AttributeError):
+        return "unknown"
 
-def update_all_clients():
-    # Sends the updated game state to all players after each move.
-    broadcast_message("game_update", {
+def game_state_data(room):
+    # Returns the public game state sent in game_update messages.
+    game_state = room.state
+    data = {
         "board": game_state["board"],
         "next_turn": game_state["next_turn"],
         "status": game_state["status"]
-    })
+    }
+    if room.clock is not None:
+        data["clock"] = room.clock.snapshot()
+    return data
+
+def room_summary(room):
+    # Returns a room's entry in the room listing: its game state and who sits where.
+    return {"room": room.room_id, **game_state_data(room), "players": dict(room.seats)}
 
-def reset_game():
+def publish_room_summary(room):
+    # Sends the room's entry to clients watching rooms, if there are any, and mirrors it for sidecars.
+    if rooms.get(room.room_id) is not room:
+        return  # Closed, and its id may already belong to a new room with its own record
+    if state_arena is not None:
+        state_arena.write(room.room_id, room.to_compact(), room.seq, room.moves.total,
+                          room.clock.snapshot() if room.clock is not None else None)
+    if spectator_hub.watching_rooms():
+        spectator_hub.publish_room(room.room_id, "room_update", encode_message("room_update", room_summary(room)))
+
+def update_all_clients(room):
+    # Sends the updated game state to everyone in the room after each move.
+    broadcast_message(room, "game_update", game_state_data(room))
+
+def reset_game(room):
     # Resets the game board and clears players' data for a new game session.
+    game_state = room.state
     game_state["board"] = [["" for _ in range(3)] for _ in range(3)]
     game_state["next_turn"] = None
     game_state["status"] = "waiting for players"
-    client_usernames.clear()
-    usernames.clear()
-    logging.info("Game reset")
+    stop_clock(room)
+    for conn in room.members:
+        sessions.unseat(conn, room.room_id)
+    for session in sessions.sessions_in(room.room_id):
+        sessions.release(session)
+    members = list(room.members)
+    room.members.clear()
+    room.players.clear()
+    room.chat.forget_all()
+    room.seats = {"X": None, "O": None}
+    publish_room_summary(room)
+    logging.info(f"Game reset in room {room.room_id}")
+    release_drained(members)
 
-def check_game_status():
+def check_game_status(room):
     # Checks for a win, draw, or ongoing game status after each move.
-    for i in range(3):
-        if game_state["board"][i][0] == game_state["board"][i][1] == game_state["board"][i][2] != "":
-            end_game(game_state["board"][i][0])
-            return
+    result = game_result(*pack_board(room.state["board"]))
+    if result in ("X", "O"):
+        end_game(room, result)
+    elif result == "draw":
+        broadcast_message(room, "game_result", {"result": "draw"})
+        if room.seats["X"] and room.seats["O"]:
+            player_stats.record_result(room.seats["X"], room.seats["O"], 0.5)
+        logging.info(f"Game in room {room.room_id} ended in a draw.")
+        reset_game(room)
 
-    # Check columns
-    for i in range(3):
-        if game_state["board"][0][i] == game_state["board"][1][i] == game_state["board"][2][i] != "":
-            end_game(game_state["board"][0][i])
-            return
+def end_game(room, winner_symbol, reason=None):
+    # Ends the game and announces the winner, if there is one.
+    # room: Room whose game ended
+    # winner_symbol: Symbol ('X' or 'O') of the winning player
+    # reason: Why the game ended other than by three in a row, e.g. "timeout"
+    winner_username = room.seats[winner_symbol]
+    result = {
+        "result": "win",
+        "winner": winner_username,
+        "symbol": winner_symbol
+    }
+    if reason:
+        result["reason"] = reason
+    broadcast_message(room, "game_result", result)
+    logging.info(f"Game in room {room.room_id} ended. Winner: {winner_username} ({winner_symbol})")
+    loser_username = room.seats["O" if winner_symbol == "X" else "X"]
+    if loser_username:
+        player_stats.record_result(winner_username, loser_username, 1)
+    reset_game(room)
+
+def start_clock(room):
+    # Starts the room's time control for a new game; the player to move is on the clock.
+    room.clock = GameClock(room.time_control)
+    for symbol, username in room.seats.items():
+        if username is not None and username == room.state["next_turn"]:
+            run_clock(room, symbol)
+
+def run_clock(room, symbol):
+    # Starts a player's clock and schedules the check for when it runs out.
+    # Each running clock holds one timer on the shared wheel, replaced after every move.
+    clock = room.clock
+    if clock.timer is not None:
+        timer_wheel.cancel(clock.timer)
+    clock.start(symbol)
+    schedule_clock_check(room, clock)
 
-    # Check diagonals
-    if game_state["board"][0][0] == game_state["board"][1][1] == game_state["board"][2][2] != "":
-        end_game(game_state["board"][0][0])
+def schedule_clock_check(room, clock):
+    # Sets the timer that checks the running clock on the room's actor once it should have run out.
+    started = clock.turn_started
+    clock.timer = timer_wheel.schedule(clock.time_left(), lambda: room.submit(check_clock, clock, started))
+
+def stop_clock(room):
+    # Stops the room's time control, e.g. when the game ends or a seat is freed.
+    clock = room.clock
+    if clock is None:
         return
+    if clock.timer is not None:
+        timer_wheel.cancel(clock.timer)
+    room.clock = None
+
+def check_clock(room, clock, started):
+    # Runs on the room's actor when a clock's timer fires.
+    # started: turn_started of the turn the timer was set for
+    if room.clock is not clock or clock.turn is None or clock.turn_started != started:
+        return  # The game ended or the player moved after the timer was queued
+    if clock.flagged():
+        flag_fall(room)
+    else:
+        # Timers never fire early, but the float arithmetic can leave a moment to go
+        schedule_clock_check(room, clock)
+
+def flag_fall(room):
+    # Forfeits the game of the player whose clock ran out.
+    loser_symbol = room.clock.turn
+    stop_clock(room)
+    broadcast_message(room, "chat", {"username": "Server", "message": f"{room.seats[loser_symbol]} ran out of time."})
+    end_game(room, "O" if loser_symbol == "X" else "X", "timeout")
+
+ADMIN_HELP = """Commands:
+  rooms            Every room with its players, queued commands and move rate
+  connections      Every connection with its seats and send queue
+  kick ID          Disconnect a connection now and free its seats
+  drain ID         Refuse the connection new games and disconnect it when its game ends
+  reset ROOM       Reset a room's game
+  loglevel LEVEL   Change the log level (DEBUG, INFO, WARNING, ERROR)
+  shutdown         Stop accepting clients and new games, and exit once running games end"""
+
+def handle_admin(words):
+    # Runs an admin console command and returns its reply. Called on the console's thread;
+    # anything that changes a room is submitted to the room's actor.
+    # words: The command line, split on whitespace
+    command, args = words[0].lower(), words[1:]
+    if command == "help":
+        return ADMIN_HELP
+    if command == "rooms":
+        return admin_rooms()
+    if command == "connections":
+        return admin_connections()
+    if command in ("kick", "drain", "reset", "loglevel") and len(args) != 1:
+        return f"Usage: {command} {'ROOM' if command == 'reset' else 'LEVEL' if command == 'loglevel' else 'ID'}"
+    if command == "kick":
+        conn = admin_connection(args[0])
+        # Frees its seats now rather than holding them for a resume
+        for room_id in {session.room_id for session in sessions.sessions_of(conn)} | {sessions.room_of(conn)}:
+            room = rooms.get(room_id)
+            if room:
+                room.submit(drop_connection, conn)
+        disconnect_client(conn)
+        return f"Kicked connection {args[0]}"
+    if command == "drain":
+        conn = admin_connection(args[0])
+        draining_clients.add(conn)
+        send_message(conn, "chat", {"username": "Server", "message": "This connection will be closed when your game ends."})
+        release_drained([conn])
+        return f"Draining connection {args[0]}"
+    if command == "reset":
+        room = rooms.get(args[0])
+        if room is None:
+            return f"No room {args[0]}"
+        room.submit(admin_reset)
+        return f"Resetting room {args[0]}"
+    if command == "loglevel":
+        level = logging.getLevelName(args[0].upper())
+        if not isinstance(level, int):
+            return f"Unknown log level {args[0]}"
+        logging.getLogger().setLevel(level)
+        return f"Log level set to {args[0].upper()}"
+    if command == "shutdown":
+        start_drain()
+        return "Draining: no new clients or games; the server exits when running games end"
+    return f"Unknown command {command}. Try help."
+
+def admin_rooms():
+    lines = []
+    for room in list(rooms.values()):
+        seats = " ".join(f"{symbol}={username or '-'}" for symbol, username in room.seats.items())
+        lines.append(f"{room.room_id}: {room.state['status']}, {seats}, {len(room.members)} members, "
+                     f"{spectator_hub.count(room.room_id)} spectators, {room.actor.depth} queued, "
+                     f"{room.moves.total} moves, {room.moves.per_second() * 60:.1f} moves/min")
+    return "\n".join(lines) or "No rooms"
+
+def admin_connections():
+    lines = []
+    for conn, connection_id in sorted(list(connection_ids.items()), key=lambda item: item[1]):
+        seats = ", ".join(f"{session.username} in {session.room_id}" for session in sessions.sessions_of(conn))
+        outq = outbound_queues.get(conn)
+        metrics = outq.metrics() if outq else {}
+        lines.append(f"{connection_id} {peer_name(conn)}: {seats or 'not seated'}, queue {metrics.get('depth')} "
+                     f"(peak {metrics.get('peak_depth')}), sent {metrics.get('sent')}, dropped {metrics.get('dropped')}"
+                     f"{', draining' if conn in draining_clients else ''}")
+    return "\n".join(lines) or "No connections"
 
-    if game_state["board"][0][2] == game_state["board"][1][1] == game_state["board"][2][0] != "":
-        end_game(game_state["board"][0][2])
+def admin_connection(text):
+    # Returns the connection with the id the admin console shows. Raises ValueError if there is none.
+    for conn, connection_id in list(connection_ids.items()):
+        if str(connection_id) == text:
+            return conn
+    raise ValueError(f"No connection {text}")
+
+def admin_reset(room):
+    broadcast_message(room, "chat", {"username": "Server", "message": "An administrator has reset the game."})
+    reset_game(room)
+    close_room_if_empty(room)
+
+def disconnect_client(conn):
+    # Closes a client's connection; its handler thread then does the usual cleanup.
+    try:
+        conn.shutdown(socket.SHUT_RDWR)
+    except (socket.error, AttributeError):
+        pass
+
+def release_drained(conns):
+    # Disconnects draining clients that no longer have a seat.
+    for conn in conns:
+        if conn in draining_clients and not sessions.is_seated(conn):
+            disconnect_client(conn)
+
+def start_drain():
+    # Stops taking new clients and games; the server exits once no game is running.
+    global DRAINING
+    if DRAINING:
         return
+    DRAINING = True
+    logging.info("Draining: waiting for running games to end")
+    for room in list(rooms.values()):
+        room.submit(broadcast_message, "chat", {"username": "Server", "message": "The server is shutting down after the current games."})
+    timer_wheel.schedule(DRAIN_CHECK_INTERVAL, check_drained)
 
-    # Check for draw
-    if all(cell != "" for row in game_state["board"] for cell in row):
-        broadcast_message("game_result", {"result": "draw"})
-        logging.info("Game ended in a draw.")
-        reset_game()
+def check_drained():
+    # Runs on the timer thread while draining. Game clocks make sure running games end.
+    global RUNNING
+    if any(room.state["status"] == "ongoing" and len(room.players) == 2 for room in list(rooms.values())):
+        timer_wheel.schedule(DRAIN_CHECK_INTERVAL, check_drained)
+        return
+    logging.info("Drained: no games running, shutting down")
+    for conn in list(clients):
+        disconnect_client(conn)
+    RUNNING = False
 
-def end_game(winner_symbol):
-    # Ends the game and announces the winner, if there is one.
-    # winner_symbol: Symbol ('X' or 'O') of the winning player
-    winner_username = list(usernames)[0] if winner_symbol == "X" else list(usernames)[1]
-    broadcast_message("game_result", {
-        "result": "win",
-        "winner": winner_username,
-        "symbol": winner_symbol
-    })
-    logging.info(f"Game ended. Winner: {winner_username} ({winner_symbol})")
-    reset_game()
+def request_handoff(conn, words):
+    # Admin console takeover for "handoff": a new server process asks for this one's sockets
+    # and rooms. The accept loop does the handoff, so no client is accepted meanwhile.
+    if DRAINING or HANDED_OFF:
+        conn.sendall(b"Error: the server is shutting down\n")
+        return
+    # One deadline covers every step, so the handoff is over, one way or the other, once it passes
+    deadline = time.monotonic() + HANDOFF_TIMEOUT + 2 * HANDOFF_DRAIN
+    done = threading.Event()
+    handoff_requests.put((conn, deadline, done))
+    while not done.wait(1):
+        if not RUNNING:  # The accept loop stopped before it took the request
+            return
+
+def hand_off(listeners, conn, deadline):
+    # Passes the listening sockets and every room to the process taking over. Clients are told
+    # the server is restarting and disconnected first, so their seats are held for them to resume
+    # on the new process. Returns True once the new process is serving; otherwise this one carries on.
+    # listeners: Listening socket -> True if its clients are trusted
+    # deadline: time.monotonic() by which the handoff must be done; each step gets what is left of it
+    global player_stats
+    logging.info("Handing off to a new server process")
+    for client in list(clients):
+        send_message(client, "restart", {"message": "The server is restarting. Reconnecting..."})
+    wait_for(lambda: all(transport.depth == 0 for transport in list(outbound_queues.values())),
+             min(HANDOFF_DRAIN, deadline - time.monotonic()))
+    for client in list(clients):
+        disconnect_client(client)
+    wait_for(lambda: not clients, min(HANDOFF_DRAIN, deadline - time.monotonic()))
+    player_stats.close()  # Final flush, so the new process loads every result
+    try:
+        state = {"rooms": snapshot_rooms(deadline)}
+        send_handoff(conn, list(listeners.items()), state, deadline)
+    except (OSError, ValueError, queue.Empty) as e:
+        logging.error(f"Handoff failed, carrying on: {e}")
+        player_stats = PlayerStats(player_stats.path)
+        return False
+    logging.info("Handed off; exiting")
+    return True
+
+def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+def snapshot_rooms(deadline):
+    # Returns the handoff state of every room still in play, each taken on its room's actor
+    # after the commands already queued there.
+    # Raises queue.Empty if some room has not answered by the time.monotonic() deadline.
+    taken = queue.SimpleQueue()
+    current = list(rooms.values())
+    for room in current:
+        room.submit(lambda room: taken.put(room_handoff(room)))
+    snapshots = [taken.get(timeout=max(0, deadline - time.monotonic())) for _ in current]
+    return [snapshot for snapshot in snapshots if snapshot["sessions"] or snapshot["room"] == DEFAULT_ROOM]
+
+def room_handoff(room):
+    # Returns what another server process needs to carry on a room's game, copied so it can be
+    # sent from another thread.
+    return {
+        "room": room.room_id,
+        "state": {**room.state, "board": [list(row) for row in room.state["board"]]},
+        "seats": dict(room.seats),
+        "time_control": room.time_control,
+        "clock": room.clock.to_dict() if room.clock is not None else None,
+        "seq": room.seq,
+        "events": list(room.events),
+        "sessions": [[session.username, session.token, session.symbol] for session in sessions.sessions_in(room.room_id)]
+    }
+
+def restore_room(data):
+    # Recreates a room handed over by the previous server process. Its players have
+    # RESUME_GRACE seconds to reconnect and resume with their tokens.
+    room = get_room(data["room"], create=True)
+    room.state.update(data["state"])
+    room.seats = dict(data["seats"])
+    room.players.update(username for username in room.seats.values() if username is not None)
+    room.time_control = data["time_control"]
+    room.seq = data["seq"]
+    room.events.extend(tuple(event) for event in data["events"])
+    for username, token, symbol in data["sessions"]:
+        session = sessions.restore(room.room_id, username, token, symbol)
+        session.expiry = timer_wheel.schedule(RESUME_GRACE, lambda session=session: room.submit(expire_seat, session))
+    if data["clock"] is not None:
+        room.clock = GameClock.from_dict(data["clock"])
+        if room.clock.turn is not None:
+            schedule_clock_check(room, room.clock)
+    publish_room_summary(room)
+    logging.info(f"Took over room {room.room_id} with {len(data['sessions'])} held seats")
+
+def init_server(inline=False, persist=True):
+    # Sets up stats, spectators, room actors and timers, once. start_server calls it before
+    # listening; in-process drivers (see loopback.py) call it instead of start_server.
+    # inline: Run room actors in the thread that sends each message instead of on worker threads
+    # persist: Save results to STATS_DB; False keeps ratings in memory, so simulations never touch the real leaderboard
+    global player_stats
+    global spectator_hub
+    global actor_pool
+    global state_arena
+    if actor_pool is not None:
+        return
+    player_stats = PlayerStats(STATS_DB if persist else None)
+    if LIVE_STATE is not None:
+        state_arena = LiveStateArena(LIVE_STATE)
+    spectator_hub = SpectatorHub(send_encoded)
+    actor_pool = InlinePool() if inline else ActorPool()
+    rooms[DEFAULT_ROOM] = Room(DEFAULT_ROOM, actor_pool, game_state, usernames)
+    timer_thread = threading.Thread(target=timer_wheel.run, args=(lambda: RUNNING,))
+    timer_thread.daemon = True
+    timer_thread.start()
+
+def open_unix_listener(path, trusted):
+    # Listens on a Unix domain socket, replacing a socket file left behind by an earlier run.
+    # trusted: Create the socket file readable and writable by the server's user only
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # The umask is set around bind so the socket file never exists with wider permissions
+    previous_umask = os.umask(0o177) if trusted else None
+    try:
+        listener.bind(path)
+    finally:
+        if previous_umask is not None:
+            os.umask(previous_umask)
+    listener.listen()
+    return listener
+
+def same_user(conn):
+    # True if a Unix socket peer runs as the server's user. Where the OS cannot tell,
+    # the socket file's permissions are relied on alone.
+    if not hasattr(socket, "SO_PEERCRED"):
+        return True
+    _, uid, _ = struct.unpack("3i", conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+    return uid == os.getuid()
 
 def start_server():
     # Starts the server, accepting and managing client connections in threads.
     global RUNNING
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.bind((HOST, PORT))
-    server_socket.listen()
-    server_socket.settimeout(1)
-    logging.info(f"Server started, listening on {HOST}:{PORT}")
+    global HANDED_OFF
+    global UNIX_SOCKET
+    global key_exchange
+    key_exchange = KeyExchange.load_or_create(SERVER_KEY_FILE)
+    listeners = {}  # Listening socket -> True if its clients are trusted
+    if TAKEOVER is not None:
+        # Everything is received before init_server, which loads player stats the old process has just saved
+        handoff_conn, received, state = receive_handoff(TAKEOVER)
+        init_server()
+        for room_data in state["rooms"]:
+            restore_room(room_data)
+        for listener, trusted in received:
+            listeners[listener] = trusted
+            if listener.family == socket.AF_UNIX:
+                UNIX_SOCKET = listener.getsockname()
+            logging.info(f"Took over listening socket {listener.getsockname()}{' (trusted, unencrypted)' if trusted else ''}")
+    else:
+        init_server()
+    if TAKEOVER is None and TCP_ENABLED:
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # Restart without waiting out TIME_WAIT
+        server_socket.bind((HOST, PORT))
+        server_socket.listen()
+        listeners[server_socket] = False
+        logging.info(f"Server started, listening on {HOST}:{PORT}")
+    if TAKEOVER is None and UNIX_SOCKET is not None:
+        listeners[open_unix_listener(UNIX_SOCKET, TRUST_LOCAL)] = TRUST_LOCAL
+        logging.info(f"Listening on Unix socket {UNIX_SOCKET}{' (trusted, unencrypted)' if TRUST_LOCAL else ''}")
+    admin_console = None
+    if ADMIN_SOCKET is not None:
+        admin_console = AdminConsole(open_unix_listener(ADMIN_SOCKET, True), handle_admin, same_user,
+                                     {"handoff": request_handoff}).start()
+        logging.info(f"Admin console on {ADMIN_SOCKET}")
+    if TAKEOVER is not None:
+        confirm_handoff(handoff_conn)
 
     try:
         while RUNNING:
-            try:
-                conn, addr = server_socket.accept()
-                threading.Thread(target=handle_client, args=(conn, addr)).start()
-            except socket.timeout:
-                continue
+            if not handoff_requests.empty():
+                conn, deadline, done = handoff_requests.get()
+                try:
+                    if hand_off(listeners, conn, deadline):
+                        HANDED_OFF = True
+                        RUNNING = False
+                        break
+                finally:
+                    done.set()
+            if DRAINING and listeners:
+                # Draining: connected clients stay, new ones are turned away by the closed listeners
+                for listener in listeners:
+                    listener.close()
+                listeners.clear()
+            # Wakes up every second to notice RUNNING being cleared
+            ready, _, _ = select.select(list(listeners), [], [], 1)
+            for listener in ready:
+                try:
+                    conn, addr = listener.accept()
+                except socket.error:
+                    continue
+                trusted = listeners[listener]
+                if trusted and not same_user(conn):
+                    logging.warning("Refusing Unix socket client running as another user")
+                    conn.close()
+                    continue
+                if not admission.admit_connection():
+                    # Refused before the key exchange, so this costs no handler thread or RSA work
+                    conn.close()
+                    if admission.refused_connections % 100 == 1:
+                        logging.warning(f"Refusing connections: {admission.max_connections} clients connected")
+                    continue
+                threading.Thread(target=handle_client, args=(conn, addr or UNIX_SOCKET, trusted)).start()
     except KeyboardInterrupt:
         logging.info("Server shutting down.")
         RUNNING = False
     finally:
-        server_socket.close()
+        for listener in listeners:
+            listener.close()
+        if admin_console is not None:
+            admin_console.close()
+        # After a handoff the socket files belong to the new process
+        for path in (UNIX_SOCKET, ADMIN_SOCKET) if not HANDED_OFF else ():
+            if path is not None:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+        player_stats.close()
+        spectator_hub.close()
+        actor_pool.close()
+        if state_arena is not None:
+            state_arena.close()
 
 if __name__ == "__main__":
     handle_arguments()
@@ -0,0 +1,133 @@
+# Perfect-play evaluation of tic-tac-toe positions from a precomputed table.
+# Every position reachable from the empty board is solved once, the first time the table is
+# needed, and stored in an array indexed by the packed board key (x_mask << 9 | o_mask).
+# Evaluating a batch is then one table lookup per board, done as a single NumPy gather
+# when the caller passes NumPy arrays.
+
+import threading
+from array import array
+from engine import FULL_BOARD, game_result, to_move, legal_moves, play, pack_board
+
+TABLE_SIZE = 1 << 18  # One entry per (x_mask, o_mask) pair
+INVALID = 0xFFFF  # Entry of a position that cannot occur in a game
+NO_MOVE = 15  # Best move of a finished game
+VALUES = ("draw", "X", "O")  # Result under perfect play, by the entry's low two bits
+EVAL_CHUNK = 250  # Results per chunk when a batch is evaluated in pieces
+CELL_MARKS = {"X": "X", "O": "O", "": "", " ": "", ".": "", "-": ""}  # Accepted characters in string boards
+
+table = None  # array("H") of entries: value | best move << 2 | distance << 6
+table_lock = threading.Lock()
+
+def board_key(x_mask, o_mask):
+    return x_mask << 9 | o_mask
+
+def solve_table():
+    # Returns the table, solving every reachable position on first use.
+    global table
+    if table is None:
+        with table_lock:
+            if table is None:
+                solved = array("H", [INVALID]) * TABLE_SIZE
+                solve(solved, 0, 0)
+                table = solved
+    return table
+
+def solve(solved, x_mask, o_mask):
+    # Fills in the entry of a position and everything reachable from it. Returns the entry.
+    key = board_key(x_mask, o_mask)
+    if solved[key] != INVALID:
+        return solved[key]
+    result = game_result(x_mask, o_mask)
+    if result is not None:
+        entry = VALUES.index(result) | NO_MOVE << 2
+        solved[key] = entry
+        return entry
+
+    symbol = to_move(x_mask, o_mask)
+    best = None  # (rank, cell, value, distance) of the best move so far
+    for cell in legal_moves(x_mask, o_mask):
+        child = solve(solved, *play(x_mask, o_mask, symbol, cell))
+        value = VALUES[child & 3]
+        distance = (child >> 6) + 1
+        # Prefer wins (sooner is better), then draws, then losses (later is better)
+        if value == symbol:
+            rank = (0, distance)
+        elif value == "draw":
+            rank = (1, 0)
+        else:
+            rank = (2, -distance)
+        if best is None or rank < best[0]:
+            best = (rank, cell, value, distance)
+    _, cell, value, distance = best
+    entry = VALUES.index(value) | cell << 2 | distance << 6
+    solved[key] = entry
+    return entry
+
+def parse_board(board):
+    # Returns (x_mask, o_mask) for a 3x3 list board or a 9 character string such as "X.O......".
+    # Raises ValueError for anything else.
+    if isinstance(board, str):
+        if len(board) != 9 or any(cell not in CELL_MARKS for cell in board):
+            raise ValueError("A board string has 9 characters, each X, O or '.'.")
+        board = [[CELL_MARKS[cell] for cell in board[row * 3:row * 3 + 3]] for row in range(3)]
+    if not isinstance(board, list) or len(board) != 3 \
+            or any(not isinstance(row, list) or len(row) != 3 for row in board):
+        raise ValueError("A board is a 3x3 list or a 9 character string.")
+    if any(cell not in ("X", "O", "") for row in board for cell in row):
+        raise ValueError("Board cells must be X, O or empty.")
+    return pack_board(board)
+
+def decode_entry(entry):
+    # Returns (value, best move cell or None, distance to the result in plies), or None for an impossible position.
+    if entry == INVALID:
+        return None
+    move = entry >> 2 & 15
+    return VALUES[entry & 3], None if move == NO_MOVE else move, entry >> 6
+
+def evaluate(x_mask, o_mask):
+    # Evaluates one packed board. See decode_entry.
+    if x_mask & o_mask or x_mask > FULL_BOARD or o_mask > FULL_BOARD:
+        return None
+    return decode_entry(solve_table()[board_key(x_mask, o_mask)])
+
+def evaluate_batch(x_masks, o_masks):
+    # Evaluates many packed boards at once. Returns the raw table entries, in order;
+    # pass each to decode_entry. NumPy arrays are looked up in one vectorised gather
+    # and give back a NumPy array; other sequences give back a list.
+    solved = solve_table()
+    if type(x_masks).__module__ == "numpy":
+        import numpy  # Only loaded by callers that already use it
+        x_masks = numpy.asarray(x_masks, dtype=numpy.int64)
+        o_masks = numpy.asarray(o_masks, dtype=numpy.int64)
+        entries = numpy.frombuffer(solved, dtype=numpy.uint16)[(x_masks & FULL_BOARD) << 9 | (o_masks & FULL_BOARD)]
+        return numpy.where((x_masks & o_masks) | (x_masks >> 9) | (o_masks >> 9), INVALID, entries)
+    return [INVALID if x_mask & o_mask or x_mask > FULL_BOARD or o_mask > FULL_BOARD
+            else solved[x_mask << 9 | o_mask] for x_mask, o_mask in zip(x_masks, o_masks)]
+
+def evaluate_boards(boards):
+    # Evaluates 3x3 list or string boards. Returns one dict per board, in order:
+    # {"value": "X", "O" or "draw" under perfect play, "move": best cell (row * 3 + col) or None,
+    #  "distance": plies until the result}, or {"error": reason} for a board that cannot be evaluated.
+    packed = []
+    errors = {}
+    for i, board in enumerate(boards):
+        try:
+            packed.append(parse_board(board))
+        except ValueError as e:
+            errors[i] = str(e)
+            packed.append((0, 0))
+    entries = evaluate_batch([x for x, _ in packed], [o for _, o in packed])
+    results = []
+    for i, entry in enumerate(entries):
+        decoded = None if i in errors else decode_entry(entry)
+        if decoded is None:
+            results.append({"error": errors.get(i, "Position cannot occur in a game.")})
+        else:
+            results.append({"value": decoded[0], "move": decoded[1], "distance": decoded[2]})
+    return results
+
+def evaluate_chunks(boards, size=EVAL_CHUNK):
+    # Evaluates boards a chunk at a time, yielding (offset of the chunk, results), so a large
+    # batch never needs all of its results in memory or in one message.
+    for offset in range(0, len(boards), size):
+        yield offset, evaluate_boards(boards[offset:offset + size])
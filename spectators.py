@@ -0,0 +1,214 @@
+import threading
+import logging
+from collections import deque
+
+EVENT_BACKLOG = 50  # Ordered events (chat lines) kept per room for spectators that fall behind
+LOBBY = object()  # Key of the room listing in dirty_rooms, next to real room ids
+
+class RoomFeed:
+    # Latest snapshot of one room and how far each of its spectators has caught up.
+    def __init__(self):
+        self.version = 0  # Bumped on every publish
+        self.latest = {}  # message_type -> (version, message_type, encoded message)
+        self.events = deque(maxlen=EVENT_BACKLOG)  # (version, message_type, encoded message), oldest first
+        self.spectators = {}  # conn -> version of the last message sent to it
+        self.welcome = set()  # New spectators still owed the current snapshots
+
+class SpectatorHub:
+    # Read-only subscribers to rooms, fed from their own sender thread.
+    # Publishing only records the room's latest message of each type and wakes the
+    # sender, so the player's handler thread never waits on spectators. A spectator
+    # that falls behind skips the intermediate events and gets the newest snapshot.
+    # Events that must not be merged (chat) are kept in a short per-room backlog instead.
+    def __init__(self, send):
+        # send: Callable taking (conn, message_type, encoded message) that writes to one connection
+        self.send = send
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.rooms = {}  # room -> RoomFeed
+        self.spectator_rooms = {}  # conn -> room it is watching
+        self.dirty_rooms = {}  # Rooms with snapshots not yet fanned out, oldest first (dict as ordered set)
+        self.lobby = {}  # room -> (version, message_type, encoded message): newest summary of every room
+        self.lobby_version = 0
+        self.lobby_watchers = {}  # conn -> lobby version of the last summary sent to it
+        self.closed_rooms = set()  # Rooms whose last summary is dropped from the listing once sent
+        self.running = True
+        self.sender_thread = threading.Thread(target=self.sender_loop)
+        self.sender_thread.daemon = True
+        self.sender_thread.start()
+
+    def is_spectator(self, conn):
+        return conn in self.spectator_rooms
+
+    def room_of(self, conn):
+        # Returns the room a spectator watches, or None.
+        return self.spectator_rooms.get(conn)
+
+    def count(self, room):
+        # Number of spectators watching a room.
+        with self.lock:
+            feed = self.rooms.get(room)
+            return len(feed.spectators) if feed else 0
+
+    def subscribe(self, conn, room, message_type, message):
+        # Starts sending a room's snapshots to conn, moving it from any room it was watching.
+        # message_type, message: Encoded snapshot used if the room has not published one yet
+        with self.lock:
+            self.remove(conn)
+            feed = self.rooms.get(room)
+            if feed is None:
+                feed = self.rooms[room] = RoomFeed()
+            if message_type not in feed.latest:
+                feed.version += 1
+                feed.latest[message_type] = (feed.version, message_type, message)
+            # Only events published from now on; earlier chat is sent as chat_history
+            feed.spectators[conn] = feed.version
+            feed.welcome.add(conn)
+            self.spectator_rooms[conn] = room
+            self.mark_dirty(room)
+
+    def unsubscribe(self, conn):
+        with self.lock:
+            self.remove(conn)
+            self.lobby_watchers.pop(conn, None)
+            if not self.lobby_watchers:
+                self.lobby.clear()
+                self.closed_rooms.clear()
+
+    def watching_rooms(self):
+        # True if anyone watches the room listing.
+        return bool(self.lobby_watchers)
+
+    def watch_rooms(self, conn):
+        # Starts sending conn a summary of every room whenever one changes.
+        # The caller then passes the current rooms to seed_rooms.
+        with self.lock:
+            self.lobby_watchers[conn] = 0
+
+    def seed_rooms(self, summaries):
+        # Adds summaries for rooms that have not published one since watching started.
+        # summaries: Maps room -> (message_type, encoded message)
+        with self.lock:
+            for room, (message_type, message) in summaries.items():
+                if room not in self.lobby:
+                    self.lobby_version += 1
+                    self.lobby[room] = (self.lobby_version, message_type, message)
+            self.mark_dirty(LOBBY)
+
+    def publish_room(self, room, message_type, message, closed=False):
+        # Replaces a room's summary in the room listing; a no-op while nobody watches it.
+        # closed: True if the room is gone, so its summary is forgotten once sent
+        with self.lock:
+            if not self.lobby_watchers:
+                return
+            self.lobby_version += 1
+            self.lobby[room] = (self.lobby_version, message_type, message)
+            if closed:
+                self.closed_rooms.add(room)
+            else:
+                self.closed_rooms.discard(room)
+            self.mark_dirty(LOBBY)
+
+    def remove(self, conn):
+        # Drops conn from the room it watches. Caller holds the lock.
+        room = self.spectator_rooms.pop(conn, None)
+        if room is None:
+            return
+        feed = self.rooms[room]
+        feed.spectators.pop(conn, None)
+        feed.welcome.discard(conn)
+        if not feed.spectators:
+            del self.rooms[room]
+
+    def publish(self, room, message_type, message):
+        # Replaces the room's latest message of this type; a no-op without spectators.
+        with self.lock:
+            feed = self.rooms.get(room)
+            if feed is None:
+                return
+            feed.version += 1
+            feed.latest[message_type] = (feed.version, message_type, message)
+            self.mark_dirty(room)
+
+    def publish_event(self, room, message_type, message):
+        # Queues a message every spectator should see in order, such as a chat line.
+        with self.lock:
+            feed = self.rooms.get(room)
+            if feed is None:
+                return
+            feed.version += 1
+            feed.events.append((feed.version, message_type, message))
+            self.mark_dirty(room)
+
+    def mark_dirty(self, room):
+        # Queues a room for fan-out once. Caller holds the lock.
+        if room not in self.dirty_rooms:
+            self.dirty_rooms[room] = None
+            self.wakeup.notify()
+
+    def sender_loop(self):
+        # Fans out the newest snapshots of dirty rooms to spectators that are behind.
+        while True:
+            with self.lock:
+                while self.running and not self.dirty_rooms:
+                    self.wakeup.wait()
+                if not self.running:
+                    return
+                room = next(iter(self.dirty_rooms))
+                del self.dirty_rooms[room]
+            if room is LOBBY:
+                self.send_lobby()
+            else:
+                self.send_room(room)
+
+    def send_room(self, room):
+        with self.lock:
+            feed = self.rooms.get(room)
+            if feed is None:
+                return
+            latest = sorted(feed.latest.values())
+            events = list(feed.events)
+            version = feed.version
+            welcome = feed.welcome
+            feed.welcome = set()
+            behind = [conn for conn, seen in feed.spectators.items() if seen < version or conn in welcome]
+
+        for conn in behind:
+            with self.lock:
+                seen = feed.spectators.get(conn)
+                if seen is None or (seen >= version and conn not in welcome):
+                    continue
+                feed.spectators[conn] = version
+            if conn in welcome:
+                pending = latest + [event for event in events if event[0] > seen]
+            else:
+                pending = [message for message in latest + events if message[0] > seen]
+            self.send_all(conn, pending)
+
+    def send_lobby(self):
+        # Sends each room listing watcher the summaries that changed since it was last sent.
+        # Only the newest summary of a room is kept, so a burst of moves becomes one message.
+        with self.lock:
+            summaries = sorted(self.lobby.values())
+            watchers = list(self.lobby_watchers.items())
+            for conn, _ in watchers:
+                self.lobby_watchers[conn] = self.lobby_version
+            # Every watcher is now getting the closing summaries, so they can go
+            for room in self.closed_rooms:
+                del self.lobby[room]
+            self.closed_rooms.clear()
+        for conn, seen in watchers:
+            self.send_all(conn, [summary for summary in summaries if summary[0] > seen])
+
+    def send_all(self, conn, pending):
+        for _, message_type, message in sorted(pending):
+            try:
+                self.send(conn, message_type, message)
+            except Exception as e:
+                logging.error(f"Error sending to spectator: {e}")
+                break
+
+    def close(self):
+        with self.lock:
+            self.running = False
+            self.wakeup.notify_all()
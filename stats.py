@@ -0,0 +1,176 @@
+import sqlite3
+import threading
+import logging
+import bisect
+
+DEFAULT_RATING = 1200.0  # Rating given to a player the first time they finish a game
+K_FACTOR = 32  # How far a single result moves a rating
+TOP_K = 10  # Number of players returned by a leaderboard request
+
+def expected_score(rating_a, rating_b):
+    # Probability that a player rated rating_a beats a player rated rating_b (Elo).
+    return 1 / (1 + 10 ** ((rating_b - rating_a) / 400))
+
+def update_ratings(rating_a, rating_b, score_a, k_factor=K_FACTOR):
+    # Returns the new ratings of both players after one game.
+    # score_a: 1 if player a won, 0.5 for a draw, 0 if player a lost
+    change = k_factor * (score_a - expected_score(rating_a, rating_b))
+    return rating_a + change, rating_b - change
+
+class PlayerStats:
+    # Persistent wins/losses/draws/rating per player.
+    # Results are applied to an in-memory cache straight away and written to SQLite
+    # in batches by a background thread, so recording a result never waits on disk.
+    # A rating-sorted index is kept up to date on every change so leaderboard and
+    # rank lookups never scan the table.
+    def __init__(self, path, top_k=TOP_K, flush_interval=1.0):
+        # path: SQLite file, or None to keep results in memory only, e.g. for simulations
+        self.path = path
+        self.top_k = top_k
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.players = {}  # username -> [wins, losses, draws, rating]
+        self.ranking = []  # Sorted list of (-rating, username), best player first
+        self.dirty = set()  # Usernames changed since the last flush
+        self.top_cache = None  # Cached leaderboard payload, cleared when the top K changes
+        self.flush_event = threading.Event()
+        self.running = True
+        self.writer_thread = None
+        if path is None:
+            return
+
+        connection = sqlite3.connect(self.path)
+        try:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS players ("
+                "username TEXT PRIMARY KEY, wins INTEGER NOT NULL, losses INTEGER NOT NULL, "
+                "draws INTEGER NOT NULL, rating REAL NOT NULL)"
+            )
+            connection.commit()
+            # Loaded once at startup; every later read is served from memory
+            for username, wins, losses, draws, rating in connection.execute(
+                    "SELECT username, wins, losses, draws, rating FROM players"):
+                self.players[username] = [wins, losses, draws, rating]
+                self.ranking.append((-rating, username))
+        finally:
+            connection.close()
+        self.ranking.sort()
+
+        self.writer_thread = threading.Thread(target=self.writer_loop)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+
+    def get_player(self, username):
+        # Creates a cache entry for a player seen for the first time. Caller holds the lock.
+        player = self.players.get(username)
+        if player is None:
+            player = [0, 0, 0, DEFAULT_RATING]
+            self.players[username] = player
+            bisect.insort(self.ranking, (-DEFAULT_RATING, username))
+        return player
+
+    def set_rating(self, username, player, rating):
+        # Moves a player inside the ranking index. Caller holds the lock.
+        old_key = (-player[3], username)
+        index = bisect.bisect_left(self.ranking, old_key)
+        del self.ranking[index]
+        new_index = bisect.bisect_left(self.ranking, (-rating, username))
+        self.ranking.insert(new_index, (-rating, username))
+        player[3] = rating
+        # Only results that touch the top K invalidate the cached leaderboard
+        if index < self.top_k or new_index < self.top_k:
+            self.top_cache = None
+
+    def record_result(self, player_a, player_b, score_a):
+        # Records one finished game between player_a and player_b.
+        # score_a: 1 if player_a won, 0.5 for a draw, 0 if player_a lost
+        with self.lock:
+            a = self.get_player(player_a)
+            b = self.get_player(player_b)
+            if score_a == 1:
+                a[0] += 1
+                b[1] += 1
+            elif score_a == 0:
+                a[1] += 1
+                b[0] += 1
+            else:
+                a[2] += 1
+                b[2] += 1
+            rating_a, rating_b = update_ratings(a[3], b[3], score_a)
+            self.set_rating(player_a, a, rating_a)
+            self.set_rating(player_b, b, rating_b)
+            self.dirty.add(player_a)
+            self.dirty.add(player_b)
+
+    def player_entry(self, username, rank):
+        # Formats one player's stats for a leaderboard message. Caller holds the lock.
+        wins, losses, draws, rating = self.players[username]
+        return {
+            "rank": rank,
+            "username": username,
+            "rating": round(rating),
+            "wins": wins,
+            "losses": losses,
+            "draws": draws
+        }
+
+    def leaderboard(self):
+        # Returns the top K players, reusing the cached list until the top K changes.
+        with self.lock:
+            if self.top_cache is None:
+                self.top_cache = [
+                    self.player_entry(username, rank + 1)
+                    for rank, (_, username) in enumerate(self.ranking[:self.top_k])
+                ]
+            return self.top_cache
+
+    def rank(self, username):
+        # Returns a player's stats and 1-based rank, or None if they have never finished a game.
+        with self.lock:
+            player = self.players.get(username)
+            if player is None:
+                return None
+            index = bisect.bisect_left(self.ranking, (-player[3], username))
+            return self.player_entry(username, index + 1)
+
+    def flush(self):
+        # Writes every player changed since the last flush in a single transaction.
+        with self.lock:
+            if self.path is None:
+                self.dirty.clear()
+            if not self.dirty:
+                return
+            rows = [(name, *self.players[name]) for name in self.dirty]
+            self.dirty.clear()
+        try:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT INTO players (username, wins, losses, draws, rating) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(username) DO UPDATE SET wins=excluded.wins, losses=excluded.losses, "
+                    "draws=excluded.draws, rating=excluded.rating",
+                    rows
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Error saving player stats: {e}")
+            with self.lock:
+                self.dirty.update(row[0] for row in rows)
+
+    def writer_loop(self):
+        # Background thread that flushes batched results to disk.
+        # The connection is opened here because SQLite connections belong to one thread.
+        self.connection = sqlite3.connect(self.path)
+        try:
+            while self.running:
+                self.flush_event.wait(self.flush_interval)
+                self.flush_event.clear()
+                self.flush()
+            self.flush()
+        finally:
+            self.connection.close()
+
+    def close(self):
+        # Stops the writer thread after a final flush.
+        self.running = False
+        self.flush_event.set()
+        if self.writer_thread is not None:
+            self.writer_thread.join()
@@ -3,16 +3,45 @@ import socket
 import threading
 import time
 import json
-from server import start_server, RUNNING, PORT, game_state, usernames, clients, client_encryptions
-from client import send_message, handle_message
-from encryption import KeyExchange, MessageEncryption
+import os
+import tempfile
+import stat
+import server
+from server import start_server, RUNNING, PORT, game_state, usernames, clients, client_encryptions, rooms, reset_game, DEFAULT_ROOM
+from client import handle_message
+from encryption import MessageEncryption, FrameReader, KeyExchange
+from connection import GameConnection, AsyncGameConnection
+import asyncio
+from stats import PlayerStats
+from spectators import SpectatorHub
+from chat import ChatChannel, TokenBucket
+from outbound import OutboundQueue, HIGH_WATERMARK, MAX_QUEUE, SLOW_CONSUMER_DEADLINE
+from timerwheel import TimerWheel
+from admission import AdmissionController
+from engine import pack_board, unpack_board, game_result, BoardBatch, load_numpy, X_WON, DRAW, ONGOING
+from compact import CompactGame, IN_USE, encode_word, decode_word
+from rooms import Room, EVENT_LOG_SIZE
+from clocks import GameClock, parse_time_control
+from solver import evaluate, evaluate_boards, evaluate_chunks
+from tournament import Tournament, play_block
+from loopback import LoopbackConnection
+from admin import AdminConsole, send_command
+from livestate import LiveStateArena, LiveStateReader, HEADER_SIZE, COUNTER, RECORD
+from handoff import send_handoff, receive_handoff, confirm_handoff
 
 TEST_HOST = '127.0.0.1'  # Use localhost instead of before 0.0.0.0
 
 class TestTicTacToeGame(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        # Start server in a separate thread
+        # Start server in a separate thread, also listening on a trusted Unix socket
+        cls.socket_dir = tempfile.TemporaryDirectory()
+        server.UNIX_SOCKET = os.path.join(cls.socket_dir.name, "server.sock")
+        server.TRUST_LOCAL = True
+        server.ADMIN_SOCKET = os.path.join(cls.socket_dir.name, "admin.sock")
+        server.LIVE_STATE = os.path.join(cls.socket_dir.name, "live-state")
+        server.STATS_DB = os.path.join(cls.socket_dir.name, "stats.db")  # Keep test ratings out of the working tree
+        server.SERVER_KEY_FILE = os.path.join(cls.socket_dir.name, "server_key.pem")
         cls.server_thread = threading.Thread(target=start_server)
         cls.server_thread.daemon = True
         cls.server_thread.start()
@@ -21,6 +50,7 @@ class TestTicTacToeGame(unittest.TestCase):
     def setUp(self):
         # Reset game state before each test
         global game_state, usernames, clients, client_encryptions
+        reset_game(rooms[DEFAULT_ROOM])  # Also frees seats and usernames left over from earlier tests
         game_state["board"] = [["" for _ in range(3)] for _ in range(3)]
         game_state["next_turn"] = None
         game_state["status"] = "ongoing"
@@ -28,100 +58,40 @@ class TestTicTacToeGame(unittest.TestCase):
         clients.clear()
         client_encryptions.clear()
         
-        # Create test client sockets
-        self.client_socket1 = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.client_socket2 = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.client_socket1.connect((TEST_HOST, PORT))
-        self.client_socket2.connect((TEST_HOST, PORT))
-
-        # Setup encryption for test clients
-        self.key_exchange1 = KeyExchange()
-        self.key_exchange2 = KeyExchange()
-        
-        # Setup encryption for client 1
-        server_public_key = self.client_socket1.recv(1024)
-        self.encryption1 = MessageEncryption()
-        encrypted_symmetric_key = self.key_exchange1.encrypt_symmetric_key(
-            server_public_key,
-            self.encryption1.symmetric_key
-        )
-        self.client_socket1.sendall(encrypted_symmetric_key)
-
-        # Setup encryption for client 2
-        server_public_key = self.client_socket2.recv(1024)
-        self.encryption2 = MessageEncryption()
-        encrypted_symmetric_key = self.key_exchange2.encrypt_symmetric_key(
-            server_public_key,
-            self.encryption2.symmetric_key
-        )
-        self.client_socket2.sendall(encrypted_symmetric_key)
-
-        # Create message queues for each client
+        # Connect two test clients; every message they receive is collected in order
         self.client1_messages = []
         self.client2_messages = []
-
-        # Start listener threads for both clients
-        self.listener1 = threading.Thread(target=self.message_listener, 
-                                        args=(self.client_socket1, self.client1_messages, self.encryption1))
-        self.listener2 = threading.Thread(target=self.message_listener, 
-                                        args=(self.client_socket2, self.client2_messages, self.encryption2))
-        self.listener1.daemon = True
-        self.listener2.daemon = True
-        self.listener1.start()
-        self.listener2.start()
-
-        # Give time for encryption setup to complete
-        time.sleep(0.1)
+        self.client1 = GameConnection(TEST_HOST, PORT).connect()
+        self.client2 = GameConnection(TEST_HOST, PORT).connect()
+        self.client1.on("*", self.client1_messages.append)
+        self.client2.on("*", self.client2_messages.append)
+        self.client1.start()
+        self.client2.start()
 
     def tearDown(self):
         time.sleep(0.2)
         
-        if hasattr(self, 'client_socket1'):
+        if hasattr(self, 'client1'):
             try:
-                self.send_test_message(self.client_socket1, "quit", {"username": "player1"}, self.encryption1)
+                self.client1.quit("player1")
                 time.sleep(0.1)
             except:
                 pass
             finally:
-                self.client_socket1.close()
+                self.client1.close()
         
-        if hasattr(self, 'client_socket2'):
+        if hasattr(self, 'client2'):
             try:
-                self.send_test_message(self.client_socket2, "quit", {"username": "player2"}, self.encryption2)
+                self.client2.quit("player2")
                 time.sleep(0.1)
             except:
                 pass
             finally:
-                self.client_socket2.close()
+                self.client2.close()
         time.sleep(0.2)
 
-    def send_test_message(self, client_socket, message_type, data, encryption):
-        message = {
-            "type": message_type,
-            "data": data
-        }
-        encrypted_message = encryption.encrypt_message(json.dumps(message) + '\n')
-        client_socket.sendall(encrypted_message)
-
-    def message_listener(self, client_socket, message_queue, encryption):
-        buffer = ""
-        while True:
-            try:
-                data = client_socket.recv(1024)
-                if not data:
-                    break
-                decrypted_data = encryption.decrypt_message(data)
-                buffer += decrypted_data
-                while '\n' in buffer:
-                    line, buffer = buffer.split('\n', 1)
-                    if line:
-                        try:
-                            message = json.loads(line)
-                            message_queue.append(message)
-                        except json.JSONDecodeError:
-                            print(f"Test listener JSON decode error: {line}")
-            except Exception as e:
-                break
+    def send_test_message(self, connection, message_type, data):
+        connection.send(message_type, data)
 
     def clear_message_queues(self):
         self.client1_messages.clear()
@@ -154,19 +124,19 @@ class TestTicTacToeGame(unittest.TestCase):
 
     def test_valid_move(self):
         # Join game with two players
-        self.send_test_message(self.client_socket1, "join", {"username": "player1"}, self.encryption1)
+        self.send_test_message(self.client1, "join", {"username": "player1"})
         time.sleep(0.2)
-        self.send_test_message(self.client_socket2, "join", {"username": "player2"}, self.encryption2)
+        self.send_test_message(self.client2, "join", {"username": "player2"})
         
         # Wait for join messages to be processed
         self.wait_for_messages(timeout=2)
         self.clear_message_queues()
 
         # Make a move with the first player
-        self.send_test_message(self.client_socket1, "move", {
+        self.send_test_message(self.client1, "move", {
             "username": "player1",
             "position": {"row": 0, "col": 0}
-        }, self.encryption1)
+        })
 
         # Wait specifically for game updates
         player1_updates = self.wait_for_specific_message(self.client1_messages, "game_update")
@@ -196,7 +166,7 @@ class TestTicTacToeGame(unittest.TestCase):
 
     def test_join_game(self):
         # Test joining game with valid username
-        self.send_test_message(self.client_socket1, "join", {"username": "player1"}, self.encryption1)
+        self.send_test_message(self.client1, "join", {"username": "player1"})
         self.wait_for_messages()
         
         response = next((msg for msg in self.client1_messages if msg["type"] == "move_ack"), None)
@@ -205,12 +175,24 @@ class TestTicTacToeGame(unittest.TestCase):
 
     def test_duplicate_username(self):
         # Test joining with duplicate username
-        self.send_test_message(self.client_socket1, "join", {"username": "player1"}, self.encryption1)
+        self.send_test_message(self.client1, "join", {"username": "player1"})
         self.wait_for_messages()
+        join_ack = next(msg for msg in self.client1_messages if msg["type"] == "move_ack")
         self.clear_message_queues()
         
-        # Second client tries to use same username should succeed with a switch
-        self.send_test_message(self.client_socket2, "join", {"username": "player1"}, self.encryption2)
+        # Second client cannot take the username without its token
+        self.send_test_message(self.client2, "join", {"username": "player1"})
+        self.wait_for_messages()
+        errors = [msg for msg in self.client2_messages if msg["type"] == "error"]
+        self.assertTrue(len(errors) > 0)
+        self.assertIn("taken", errors[0]["data"]["message"])
+        self.clear_message_queues()
+
+        # With the token it succeeds with a switch
+        self.send_test_message(self.client2, "join", {
+            "username": "player1",
+            "token": join_ack["data"]["token"]
+        })
         self.wait_for_messages()
         
         # Should get a switch confirmation
@@ -218,14 +200,31 @@ class TestTicTacToeGame(unittest.TestCase):
         self.assertTrue(len(switch_messages) > 0)
         self.assertIn("switched to username", switch_messages[0]["data"]["message"].lower())
 
+    def test_move_requires_ownership(self):
+        # A client cannot move for a username another client owns
+        self.send_test_message(self.client1, "join", {"username": "player1"})
+        time.sleep(0.2)
+        self.send_test_message(self.client2, "join", {"username": "player2"})
+        self.wait_for_messages()
+        self.clear_message_queues()
+
+        self.send_test_message(self.client2, "move", {
+            "username": "player1",
+            "position": {"row": 0, "col": 0}
+        })
+        errors = self.wait_for_specific_message(self.client2_messages, "error", retries=1)
+
+        self.assertIn("not playing as player1", errors[0]["data"]["message"])
+        self.assertEqual(game_state["board"][0][0], "")
+
     def test_username_switching(self):
         # Test switching usernames for the same client
-        self.send_test_message(self.client_socket1, "join", {"username": "player1"}, self.encryption1)
+        self.send_test_message(self.client1, "join", {"username": "player1"})
         self.wait_for_messages()
         self.clear_message_queues()
 
         # Switch to a different username
-        self.send_test_message(self.client_socket1, "join", {"username": "player2"}, self.encryption1)
+        self.send_test_message(self.client1, "join", {"username": "player2"})
         self.wait_for_messages()
 
         switch_messages = [msg for msg in self.client1_messages if msg["type"] == "move_ack"]
@@ -234,44 +233,242 @@ class TestTicTacToeGame(unittest.TestCase):
 
     def test_username_persistence(self):
         # Test that usernames persist after client disconnection
-        self.send_test_message(self.client_socket1, "join", {"username": "player1"}, self.encryption1)
+        self.send_test_message(self.client1, "join", {"username": "player1"})
         self.wait_for_messages()
         self.clear_message_queues()
 
         # Create a new client connection
-        new_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        new_socket.connect((TEST_HOST, PORT))
-        
-        # Setup encryption for new socket
-        server_public_key = new_socket.recv(1024)
-        encryption3 = MessageEncryption()
-        key_exchange3 = KeyExchange()
-        encrypted_symmetric_key = key_exchange3.encrypt_symmetric_key(
-            server_public_key,
-            encryption3.symmetric_key
-        )
-        new_socket.sendall(encrypted_symmetric_key)
-        time.sleep(0.1)  # Give time for encryption setup
+        new_client = GameConnection(TEST_HOST, PORT).connect()
         
         # Try to use the same username with new connection
-        self.send_test_message(new_socket, "join", {"username": "player1"}, encryption3)
+        self.send_test_message(new_client, "join", {"username": "player1"})
         
         # Wait for response and verify it's allowed
         time.sleep(1)
-        new_socket.close()
+        new_client.close()
+
+    def test_async_connection(self):
+        # The asyncio client joins and receives the typed acknowledgement with its token
+        async def join():
+            connection = await AsyncGameConnection(TEST_HOST, PORT).connect()
+            await connection.join("async_player", room="async")
+            messages = await asyncio.wait_for(connection.receive(), 2)
+            await connection.close()
+            return connection, messages
+
+        connection, messages = asyncio.run(join())
+        self.assertEqual(messages[0]["type"], "move_ack")
+        self.assertEqual(connection.tokens["async_player"], messages[0]["data"]["token"])
+
+    def test_watch_rooms(self):
+        # A client watching rooms gets a summary of a room when its game changes
+        self.client1.watch_rooms()
+        time.sleep(0.2)
+        self.send_test_message(self.client2, "join", {"username": "player2", "room": "watched"})
+        watched = []
+        deadline = time.time() + 2
+        while not watched and time.time() < deadline:
+            time.sleep(0.1)
+            watched = [msg["data"] for msg in self.client1_messages
+                       if msg["type"] == "room_update" and msg["data"]["room"] == "watched"]
+
+        self.assertTrue(watched)
+        self.assertEqual(watched[-1]["players"], {"X": "player2", "O": None})
+
+    def test_resume_after_disconnect(self):
+        # A player who loses their connection gets their seat back and the moves they missed
+        self.send_test_message(self.client1, "join", {"username": "player1"})
+        time.sleep(0.2)
+        self.send_test_message(self.client2, "join", {"username": "player2"})
+        self.wait_for_messages()
+        self.client1.move("player1", 0, 0)
+        self.wait_for_specific_message(self.client1_messages, "game_update", retries=1)
+        self.client1.close()
+        time.sleep(0.2)
+        self.assertIn("player1", usernames)  # Seat is held
+        self.client2.move("player2", 1, 1)
+        time.sleep(0.2)
+
+        # Reconnect on the same object, which keeps the token and last sequence number
+        self.client1_messages.clear()
+        self.client1.connect()
+        self.client1.start()
+        self.client1.resume("player1")
+        acks = self.wait_for_specific_message(self.client1_messages, "move_ack", retries=1)
+        self.assertIn("replayed", acks[0]["data"])
+        updates = self.wait_for_specific_message(self.client1_messages, "game_update", retries=1)
+        self.assertEqual(updates[-1]["data"]["board"][1][1], "O")
+
+        # Without the token there is nothing to resume
+        self.send_test_message(self.client2, "resume", {"username": "player1", "last_seq": 0})
+        errors = self.wait_for_specific_message(self.client2_messages, "error", retries=1)
+        self.assertIn("Nothing to resume", errors[0]["data"]["message"])
+
+    def test_move_timeout_forfeits(self):
+        # A player who does not move within the room's time control loses the game
+        control = {"move": 1, "total": 60, "increment": 0}
+        self.send_test_message(self.client1, "join", {"username": "player1", "room": "clocked", "time_control": control})
+        time.sleep(0.2)
+        self.send_test_message(self.client2, "join", {"username": "player2", "room": "clocked"})
+        results = self.wait_for_specific_message(self.client2_messages, "game_result", timeout=4, retries=1)
+        self.assertEqual(results[0]["data"]["winner"], "player2")
+        self.assertEqual(results[0]["data"]["reason"], "timeout")
+
+    def test_evaluate_batch(self):
+        # A large batch comes back in chunks that together cover every board, in order
+        boards = ["XX.OO...."] * 600 + ["bad"]
+        self.client1.evaluate(boards, "batch1")
+        deadline = time.time() + 3
+        while time.time() < deadline and not any(msg["type"] == "evaluation" and msg["data"]["done"]
+                                                 for msg in self.client1_messages):
+            time.sleep(0.1)
+        chunks = [msg["data"] for msg in self.client1_messages if msg["type"] == "evaluation"]
+        self.assertEqual([chunk["offset"] for chunk in chunks], [0, 250, 500])
+        results = [result for chunk in chunks for result in chunk["results"]]
+        self.assertEqual(len(results), len(boards))
+        self.assertEqual(results[0], {"value": "X", "move": 2, "distance": 1})
+        self.assertIn("error", results[-1])
+        self.assertEqual(chunks[0]["id"], "batch1")
+
+    def test_full_evaluate_request_in_list_form(self):
+        # The largest evaluate request the protocol allows fits in one frame
+        board = [["X", "O", "X"], ["O", "X", "O"], ["X", "O", "X"]]
+        self.client1.evaluate([board] * server.MAX_EVAL_BATCH, "full")
+        deadline = time.time() + 10
+        while time.time() < deadline and not any(msg["type"] == "evaluation" and msg["data"]["done"]
+                                                 for msg in self.client1_messages):
+            time.sleep(0.1)
+        chunks = [msg["data"] for msg in self.client1_messages if msg["type"] == "evaluation"]
+        self.assertEqual(sum(len(chunk["results"]) for chunk in chunks), server.MAX_EVAL_BATCH)
+
+    def test_malformed_frame_closes_connection(self):
+        # A frame that decrypts to something other than a JSON object gets an error, then the server hangs up
+        disconnected = threading.Event()
+        self.client1.on("disconnected", lambda message: disconnected.set())
+        self.client1.socket.sendall(self.client1.encryption.encrypt_frame("not json"))
+        self.assertTrue(disconnected.wait(3))
+        errors = [msg["data"]["message"] for msg in self.client1_messages if msg["type"] == "error"]
+        self.assertEqual(errors, ["Malformed message; closing the connection."])
+
+    def test_trusted_unix_socket(self):
+        # A local client on the trusted Unix socket plays without the key exchange
+        self.assertEqual(stat.S_IMODE(os.stat(server.UNIX_SOCKET).st_mode), 0o600)
+        local_messages = []
+        local = GameConnection(None, None, path=server.UNIX_SOCKET, plaintext=True).connect()
+        local.on("*", local_messages.append)
+        local.start()
+        try:
+            local.join("player1", "local")
+            acks = self.wait_for_specific_message(local_messages, "move_ack", retries=1)
+            self.assertEqual(acks[0]["data"]["room"], "local")
+        finally:
+            local.quit("player1")
+            local.close()
+
+    def test_batch_join_and_move(self):
+        # Commands in one frame run in order, and replies carry the command ids
+        self.send_test_message(self.client2, "join", {"username": "player2", "room": "batched"})
+        time.sleep(0.2)
+        self.client1.batch([
+            (1, "join", {"username": "player1", "room": "batched"}),
+            (2, "chat", {"username": "player1", "message": "hi"}),
+            (3, "move", {"username": "player1", "position": {"row": 0, "col": 0}}),
+        ])
+        deadline = time.time() + 3
+        while time.time() < deadline and not any(msg["type"] == "done" and msg.get("id") == 3
+                                                 for msg in self.client1_messages):
+            time.sleep(0.1)
+        replies = {}
+        for msg in self.client1_messages:
+            if "id" in msg:
+                replies.setdefault(msg["id"], []).append(msg["type"])
+        self.assertEqual(replies[1][0], "move_ack")
+        self.assertEqual(replies[2], ["done"])  # Chat went to the room joined just before it
+        self.assertEqual(replies[3], ["error", "done"])  # player2 joined first, so it is their turn
+
+    def test_admin_console(self):
+        # The admin socket reports rooms and connections, and can kick a player out of a game
+        self.send_test_message(self.client1, "join", {"username": "player1", "room": "admin"})
+        self.send_test_message(self.client2, "join", {"username": "player2", "room": "admin"})
+        self.wait_for_messages()
+        self.send_test_message(self.client1, "move", {"username": "player1", "position": {"row": 0, "col": 0}})
+        self.send_test_message(self.client2, "move", {"username": "player2", "position": {"row": 0, "col": 0}})
+        time.sleep(0.3)
+
+        rooms_report = send_command(server.ADMIN_SOCKET, "rooms")
+        self.assertIn("admin: ongoing", rooms_report)
+        self.assertIn("1 moves", rooms_report)
+        connections = send_command(server.ADMIN_SOCKET, "connections").splitlines()
+        kicked = next(line for line in connections if "player1 in admin" in line)
+        self.assertEqual(send_command(server.ADMIN_SOCKET, "kick nobody"), "Error: No connection nobody")
+        send_command(server.ADMIN_SOCKET, f"kick {kicked.split()[0]}")
+        time.sleep(0.5)
+        self.assertNotIn("player1", rooms["admin"].players)
+        self.assertIn("X=-", send_command(server.ADMIN_SOCKET, "rooms"))
+
+        self.assertEqual(send_command(server.ADMIN_SOCKET, "loglevel warning"), "Log level set to WARNING")
+        send_command(server.ADMIN_SOCKET, "loglevel info")
+        self.assertTrue(send_command(server.ADMIN_SOCKET, "bogus").startswith("Unknown command"))
+
+    def test_live_state_mirror(self):
+        # A sidecar reading the live state file sees moves without talking to the server
+        self.send_test_message(self.client1, "join", {"username": "player1", "room": "mirrored"})
+        time.sleep(0.2)
+        self.send_test_message(self.client2, "join", {"username": "player2", "room": "mirrored"})
+        self.wait_for_messages()
+        self.send_test_message(self.client1, "move", {"username": "player1", "position": {"row": 1, "col": 1}})
+        time.sleep(0.3)
+        reader = LiveStateReader(server.LIVE_STATE)
+        self.addCleanup(reader.close)
+        room, = [room for room in reader.rooms() if room["room"] == "mirrored"]
+        self.assertEqual(room["board"][1][1], "X")
+        self.assertEqual(room["status"], "ongoing")
+        self.assertEqual(room["players"], {"X": "player1", "O": "player2"})
+        self.assertEqual(room["moves"], 1)
+        self.assertIsNotNone(room["clock"])
+
+    def test_closed_room_does_not_publish(self):
+        # A closed room whose id was reused must not write over the new room's live state record
+        stale = server.get_room("reused", create=True)
+        server.close_room_if_empty(stale)
+        live = server.get_room("reused", create=True)
+        self.addCleanup(server.close_room_if_empty, live)
+        live.state["status"] = "ongoing"
+        server.publish_room_summary(live)
+        server.publish_room_summary(stale)
+        reader = LiveStateReader(server.LIVE_STATE)
+        self.addCleanup(reader.close)
+        self.assertEqual([room["status"] for room in reader.rooms() if room["room"] == "reused"], ["ongoing"])
+
+    def test_rooms_are_isolated(self):
+        # Players in different rooms do not see each other's chat or share a board
+        self.send_test_message(self.client1, "join", {"username": "player1", "room": "side"})
+        self.send_test_message(self.client2, "join", {"username": "player2"})
+        self.wait_for_messages()
+        self.clear_message_queues()
+
+        self.send_test_message(self.client1, "chat", {
+            "username": "player1",
+            "message": "Only for the side room"
+        })
+        chat_messages1 = self.wait_for_specific_message(self.client1_messages, "chat", retries=1)
+
+        self.assertEqual(chat_messages1[0]["data"]["message"], "Only for the side room")
+        self.assertFalse([msg for msg in self.client2_messages if msg["type"] == "chat"])
+        self.assertEqual(usernames, {"player2"})
 
     def test_invalid_move(self):
         # Join game with two players
-        self.send_test_message(self.client_socket1, "join", {"username": "player1"}, self.encryption1)
-        self.send_test_message(self.client_socket2, "join", {"username": "player2"}, self.encryption2)
+        self.send_test_message(self.client1, "join", {"username": "player1"})
+        self.send_test_message(self.client2, "join", {"username": "player2"})
         self.wait_for_messages()
         self.clear_message_queues()
         
         # Test move to invalid position
-        self.send_test_message(self.client_socket1, "move", {
+        self.send_test_message(self.client1, "move", {
             "username": "player1",
             "position": {"row": 3, "col": 3}
-        }, self.encryption1)
+        })
         self.wait_for_messages()
         
         error_messages = [msg for msg in self.client1_messages if msg["type"] == "error"]
@@ -279,15 +476,16 @@ class TestTicTacToeGame(unittest.TestCase):
         self.assertIn("Invalid", error_messages[0]["data"]["message"])
 
     def test_chat_message(self):
-        # Join game and send chat message
-        self.send_test_message(self.client_socket1, "join", {"username": "player1"}, self.encryption1)
+        # Join game with two players and send chat message
+        self.send_test_message(self.client1, "join", {"username": "player1"})
+        self.send_test_message(self.client2, "join", {"username": "player2"})
         self.wait_for_messages()
         self.clear_message_queues()
         
-        self.send_test_message(self.client_socket1, "chat", {
+        self.send_test_message(self.client1, "chat", {
             "username": "player1",
             "message": "Hello, World!"
-        }, self.encryption1)
+        })
         self.wait_for_messages()
         
         # Verify both clients received the chat message
@@ -301,19 +499,20 @@ class TestTicTacToeGame(unittest.TestCase):
 
     def test_win_condition(self):
         # Join game with two players
-        self.send_test_message(self.client_socket1, "join", {"username": "player1"}, self.encryption1)
-        self.send_test_message(self.client_socket2, "join", {"username": "player2"}, self.encryption2)
+        self.send_test_message(self.client1, "join", {"username": "player1"})
+        time.sleep(0.2)  # player1 must join first so they have the first turn
+        self.send_test_message(self.client2, "join", {"username": "player2"})
         
         # Wait for join messages to be processed
         self.wait_for_messages()
         self.clear_message_queues()
 
         moves = [
-            {"socket": self.client_socket1, "username": "player1", "position": {"row": 0, "col": 0}},
-            {"socket": self.client_socket2, "username": "player2", "position": {"row": 1, "col": 0}},
-            {"socket": self.client_socket1, "username": "player1", "position": {"row": 0, "col": 1}},
-            {"socket": self.client_socket2, "username": "player2", "position": {"row": 1, "col": 1}},
-            {"socket": self.client_socket1, "username": "player1", "position": {"row": 0, "col": 2}}
+            {"socket": self.client1, "username": "player1", "position": {"row": 0, "col": 0}},
+            {"socket": self.client2, "username": "player2", "position": {"row": 1, "col": 0}},
+            {"socket": self.client1, "username": "player1", "position": {"row": 0, "col": 1}},
+            {"socket": self.client2, "username": "player2", "position": {"row": 1, "col": 1}},
+            {"socket": self.client1, "username": "player1", "position": {"row": 0, "col": 2}}
         ]
 
         # Execute moves
@@ -321,7 +520,7 @@ class TestTicTacToeGame(unittest.TestCase):
             self.send_test_message(move["socket"], "move", {
                 "username": move["username"],
                 "position": move["position"]
-            }, self.encryption1 if move["socket"] == self.client_socket1 else self.encryption2)
+            })
             self.wait_for_messages()
 
         # Wait a bit
@@ -351,5 +550,573 @@ class TestTicTacToeGame(unittest.TestCase):
         self.assertEqual(len(usernames), 0, "Usernames were not cleared after game reset")
         self.assertEqual(len(clients), 2, "Clients removed")
 
+class TestLoopback(unittest.TestCase):
+    def receive_until(self, client, message_type, timeout=2):
+        # Returns every message received up to and including the first of message_type.
+        messages = []
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            messages += client.receive(timeout=0.1)
+            if any(message["type"] == message_type for message in messages):
+                break
+        return messages
+
+    def test_game_over_loopback(self):
+        # The full server logic runs without sockets or encryption
+        player1 = LoopbackConnection().connect()
+        player2 = LoopbackConnection().connect()
+        player1.join("loop1", "loopback")
+        self.receive_until(player1, "move_ack")
+        player2.join("loop2", "loopback")
+        self.receive_until(player2, "move_ack")
+        for client, username, col in [(player1, "loop1", 0), (player2, "loop2", 0), (player1, "loop1", 1),
+                                      (player2, "loop2", 1), (player1, "loop1", 2)]:
+            client.move(username, 0 if client is player1 else 1, col)
+            self.receive_until(client, "move_ack")
+        results = [message for message in self.receive_until(player2, "game_result") if message["type"] == "game_result"]
+        self.assertEqual(results[0]["data"]["winner"], "loop1")
+        self.assertIn(player1, clients)
+        player1.close()
+        player2.close()
+        self.assertNotIn(player1, clients)
+
+    def test_chat_limits_only_seated_players(self):
+        # Rate limits are kept per seated username, and dropped when the player leaves
+        client = LoopbackConnection().connect()
+        self.addCleanup(client.close)
+        client.join("talker", "chatty")
+        self.receive_until(client, "move_ack")
+        room = rooms["chatty"]
+        client.chat("ghost", "boo")
+        self.receive_until(client, "error")
+        client.chat("talker", "hi")
+        self.receive_until(client, "chat")
+        self.assertEqual(set(room.chat.buckets), {"talker"})
+        client.quit("talker")
+        deadline = time.time() + 2
+        while time.time() < deadline and room.chat.buckets:
+            time.sleep(0.05)
+        self.assertEqual(room.chat.buckets, {})
+
+    def test_bad_room_id_gives_admission_back(self):
+        # A room id that is not a string is refused without leaking an in-flight slot
+        client = LoopbackConnection().connect()
+        self.addCleanup(client.close)
+        in_flight = server.admission.metrics()["in_flight"]
+        for _ in range(server.admission.max_in_flight + 1):
+            client.send("join", {"username": "bad", "room": ["x"]})
+        self.assertEqual(server.admission.metrics()["in_flight"], in_flight)
+        client.join("good", "loopback-good")
+        acks = [message for message in self.receive_until(client, "move_ack") if message["type"] == "move_ack"]
+        self.assertEqual(acks[0]["data"]["username"], "good")
+
+    def test_refused_batch_commands_are_done(self):
+        # Commands refused before they run still get their id-tagged error and "done"
+        client = LoopbackConnection().connect()
+        self.addCleanup(client.close)
+        limit = server.admission.max_in_flight
+        server.admission.max_in_flight = 0  # Overloaded: low priority commands are shed
+        try:
+            client.batch([(1, "chat", {"username": "nobody", "message": "hi"}), (2, "batch", {})])
+        finally:
+            server.admission.max_in_flight = limit
+        replies = [(message["id"], message["type"]) for message in client.receive(timeout=1) if "id" in message]
+        self.assertEqual(replies, [(1, "error"), (1, "done"), (2, "error"), (2, "done")])
+
+    def test_batch_without_object_data(self):
+        # A batch whose data is not an object is refused like one without commands
+        client = LoopbackConnection().connect()
+        self.addCleanup(client.close)
+        server.handle_message(client, {"type": "batch", "data": ["x"]})  # Bypasses send(), which adds a token to data
+        errors = [message["data"]["message"] for message in client.receive(timeout=1) if message["type"] == "error"]
+        self.assertEqual(errors, ["A batch needs a list of commands."])
+
+class TestPlayerStats(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "stats.db")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_in_memory_stats(self):
+        # Simulation drivers keep ratings without a database
+        stats = PlayerStats(None)
+        stats.record_result("alice", "bob", 1)
+        stats.flush()
+        self.assertEqual(stats.rank("alice")["rank"], 1)
+        stats.close()
+
+    def test_results_update_leaderboard(self):
+        stats = PlayerStats(self.path, top_k=2)
+        stats.record_result("alice", "bob", 1)
+        stats.record_result("carol", "bob", 0.5)
+
+        top = stats.leaderboard()
+        self.assertEqual([entry["username"] for entry in top], ["alice", "carol"])
+        self.assertEqual(top[0]["wins"], 1)
+        self.assertEqual(stats.rank("bob")["rank"], 3)
+        self.assertEqual(stats.rank("bob")["losses"], 1)
+        self.assertIsNone(stats.rank("dave"))
+        stats.close()
+
+    def test_results_persist(self):
+        stats = PlayerStats(self.path)
+        stats.record_result("alice", "bob", 1)
+        stats.close()
+
+        reopened = PlayerStats(self.path)
+        self.assertEqual(reopened.rank("alice")["wins"], 1)
+        self.assertEqual(reopened.rank("alice")["rank"], 1)
+        self.assertGreater(reopened.rank("alice")["rating"], reopened.rank("bob")["rating"])
+        reopened.close()
+
+class TestSpectatorHub(unittest.TestCase):
+    def test_slow_spectator_gets_latest_snapshot(self):
+        sent = []
+        release = threading.Event()
+
+        def send(conn, message_type, message):
+            release.wait(2)
+            sent.append((conn, message))
+
+        hub = SpectatorHub(send)
+        hub.subscribe("watcher", "main", "game_update", "board 0")
+        time.sleep(0.1)  # Sender is now blocked delivering "board 0"
+        for i in range(1, 5):
+            hub.publish("main", "game_update", f"board {i}")
+        release.set()
+        time.sleep(0.2)
+        hub.close()
+
+        self.assertEqual(sent, [("watcher", "board 0"), ("watcher", "board 4")])
+
+    def test_publish_without_spectators_is_dropped(self):
+        sent = []
+        hub = SpectatorHub(lambda conn, message_type, message: sent.append(message))
+        hub.publish("main", "game_update", "board")
+        hub.subscribe("watcher", "main", "game_update", "initial")
+        time.sleep(0.1)
+        hub.unsubscribe("watcher")
+        hub.publish("main", "game_update", "later")
+        time.sleep(0.1)
+        hub.close()
+
+        self.assertEqual(sent, ["initial"])
+        self.assertEqual(hub.count("main"), 0)
+
+class TestChatChannel(unittest.TestCase):
+    def test_token_bucket_limits_bursts(self):
+        bucket = TokenBucket(rate=0.0001, capacity=3)
+        self.assertEqual([bucket.consume() for _ in range(4)], [True, True, True, False])
+
+    def test_spammer_is_warned_once(self):
+        channel = ChatChannel(rate=0.0001, burst=1)
+        self.assertEqual(channel.allow("conn"), "ok")
+        self.assertEqual(channel.allow("conn"), "limited")
+        self.assertEqual(channel.allow("conn"), "dropped")
+        self.assertEqual(channel.allow("other"), "ok")
+
+    def test_history_keeps_recent_lines(self):
+        channel = ChatChannel(history_size=2)
+        for i in range(3):
+            channel.record("player1", f"line {i}")
+        self.assertEqual([line["message"] for line in channel.recent()], ["line 1", "line 2"])
+
+class TestEventLog(unittest.TestCase):
+    def test_events_since(self):
+        room = Room("log", None)
+        for i in range(EVENT_LOG_SIZE + 5):
+            room.record("chat", lambda seq: f"message {seq}")
+        self.assertEqual(room.events_since(room.seq), [])
+        self.assertEqual([event[0] for event in room.events_since(room.seq - 2)], [room.seq - 1, room.seq])
+        self.assertIsNone(room.events_since(1))  # Too far behind; needs a snapshot
+        self.assertIsNone(room.events_since(None))
+
+class TestGameClock(unittest.TestCase):
+    def test_move_limit_total_and_increment(self):
+        clock = GameClock({"move": 10, "total": 15, "increment": 2})
+        clock.start("X", now=0)
+        self.assertEqual(clock.time_left(now=4), 6)
+        clock.stop(now=4)
+        self.assertEqual(clock.remaining["X"], 13)  # 15 - 4 used + 2 increment
+        clock.start("O", now=4)
+        self.assertFalse(clock.flagged(now=13))
+        self.assertTrue(clock.flagged(now=14))  # Per-move limit
+        clock.stop(now=5)
+        clock.start("X", now=5)
+        clock.remaining["X"] = 3
+        self.assertTrue(clock.flagged(now=8))  # Total runs out before the per-move limit
+
+    def test_parse_time_control(self):
+        self.assertEqual(parse_time_control({"move": 5})["move"], 5)
+        for bad in ({"move": 0}, {"total": "long"}, {"increment": -1}, "blitz"):
+            with self.assertRaises(ValueError):
+                parse_time_control(bad)
+
+    def test_handoff_keeps_time_used(self):
+        clock = GameClock({"move": 10, "total": 15, "increment": 2})
+        clock.start("X", now=0)
+        saved = clock.to_dict(now=4)
+        restored = GameClock.from_dict(json.loads(json.dumps(saved)), now=100)
+        self.assertEqual(restored.time_left(now=100), 6)
+        self.assertEqual(GameClock.from_dict(GameClock(parse_time_control({})).to_dict()).turn, None)
+
+class TestHandoff(unittest.TestCase):
+    def test_listener_and_state_are_passed(self):
+        # A listening socket sent through the admin console still accepts in the receiving process
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        admin_path = os.path.join(directory.name, "admin.sock")
+        game_listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        game_listener.bind(("127.0.0.1", 0))
+        game_listener.listen()
+        address = game_listener.getsockname()
+        handed = []
+        console = AdminConsole(server.open_unix_listener(admin_path, True), lambda words: "no", takeovers={
+            "handoff": lambda conn, words: handed.append(send_handoff(conn, [(game_listener, True)], {"rooms": [1]}))
+        }).start()
+        self.addCleanup(console.close)
+
+        conn, listeners, state = receive_handoff(admin_path)
+        confirm_handoff(conn)
+        game_listener.close()
+        (listener, trusted), = listeners
+        self.assertTrue(trusted)
+        self.assertEqual(state, {"rooms": [1]})
+        with listener, socket.create_connection(address) as client:
+            accepted, _ = listener.accept()
+            accepted.close()
+        console.thread.join(2)
+        self.assertEqual(handed, [None])
+
+    def test_handoff_stops_at_deadline(self):
+        # A handoff whose deadline has passed sends nothing
+        old_side, new_side = socket.socketpair()
+        self.addCleanup(old_side.close)
+        self.addCleanup(new_side.close)
+        with self.assertRaises(TimeoutError):
+            send_handoff(old_side, [], {"rooms": []}, deadline=time.monotonic() - 1)
+        new_side.setblocking(False)
+        self.assertRaises(BlockingIOError, new_side.recv, 1)
+
+    def test_refused_handoff(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        admin_path = os.path.join(directory.name, "admin.sock")
+        console = AdminConsole(server.open_unix_listener(admin_path, True), lambda words: "no", takeovers={
+            "handoff": lambda conn, words: conn.sendall(b"Error: the server is shutting down\n")
+        }).start()
+        self.addCleanup(console.close)
+        with self.assertRaisesRegex(ValueError, "shutting down"):
+            receive_handoff(admin_path)
+
+    def test_room_round_trip(self):
+        # A room's game, seats, clock and event log survive the move to another process
+        room = Room("handoff-test", server.InlinePool())
+        room.state.update({"board": [["X", "", ""], ["", "", ""], ["", "", ""]], "next_turn": "bob", "status": "ongoing"})
+        room.seats = {"X": "alice", "O": "bob"}
+        room.players.update(["alice", "bob"])
+        room.clock = GameClock(room.time_control)
+        room.clock.start("O")
+        room.record("chat", lambda seq: f"event {seq}")
+        alice = server.sessions.claim(None, room.room_id, "alice", "X")
+        saved = json.loads(json.dumps(server.room_handoff(room)))
+        server.sessions.release(alice)
+
+        server.restore_room(saved)
+        restored = rooms.pop("handoff-test")
+        self.addCleanup(lambda: server.sessions.release(server.sessions.owner("handoff-test", "alice")))
+        self.assertEqual(restored.state, room.state)
+        self.assertEqual(restored.players, {"alice", "bob"})
+        self.assertEqual(restored.clock.turn, "O")
+        self.assertEqual(restored.events_since(0), [(1, "chat", "event 1")])
+        self.assertTrue(server.sessions.authorize(object(), "handoff-test", "alice", alice.token))
+        server.timer_wheel.cancel(restored.clock.timer)
+
+class TestLiveState(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "live")
+        self.arena = LiveStateArena(self.path, slots=4)
+        self.reader = LiveStateReader(self.path)
+        self.addCleanup(self.reader.close)
+
+    def test_rooms_are_mirrored_and_released(self):
+        self.arena.write("a", CompactGame(1, 2, "X", "ongoing", "alice", "bob"), seq=7, moves=2,
+                         clock={"X": 12.5, "O": 30})
+        self.arena.write("b", CompactGame())
+        rooms_seen = {room["room"]: room for room in self.reader.rooms()}
+        self.assertEqual(rooms_seen["a"]["board"][0], ["X", "O", ""])
+        self.assertEqual((rooms_seen["a"]["seq"], rooms_seen["a"]["moves"]), (7, 2))
+        self.assertEqual(rooms_seen["a"]["clock"], {"X": 12.5, "O": 30})
+        self.assertIsNone(rooms_seen["b"]["clock"])
+        self.arena.release("a")
+        self.assertEqual([room["room"] for room in self.reader.rooms()], ["b"])
+        self.arena.close()
+        self.assertTrue(self.reader.closed)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_record_being_written_is_not_read(self):
+        self.arena.write("a", CompactGame())
+        slot = self.arena.slot_of["a"]
+        COUNTER.pack_into(self.arena.map, HEADER_SIZE + slot * RECORD.size, 3)  # A writer stopped halfway
+        with self.assertRaises(TimeoutError):
+            self.reader.read(slot)
+        self.arena.write("a", CompactGame(status="draw"))
+        self.assertEqual(self.reader.read(slot)["status"], "draw")
+        self.arena.close()
+
+class TestBoardBatch(unittest.TestCase):
+    def check_batch(self, batch):
+        won = batch.add()
+        drawn = batch.add(*pack_board([["X", "O", "X"], ["X", "O", "O"], ["O", "X", ""]]))
+        ongoing = batch.add()
+        batch.play_many([won, drawn, ongoing], ["X", "X", "X"], [0, 8, 4])
+        batch.play_many([won], ["X"], [1])
+        batch.play(won, "X", 2)
+        self.assertEqual(batch.resolve(), {won: "X", drawn: "draw"})
+        self.assertEqual(batch.resolve(), {})
+        self.assertEqual(batch.results([won, drawn, ongoing]), [X_WON, DRAW, ONGOING])
+        self.assertEqual(batch.boards([ongoing, won]), [(16, 0), (7, 0)])
+        batch.release(won)
+        self.assertEqual(batch.add(), won)
+        self.assertEqual(batch.board(won), (0, 0))
+
+    def test_pure_python(self):
+        self.check_batch(BoardBatch(4, use_numpy=False))
+
+    def test_numpy(self):
+        if load_numpy() is None:
+            self.skipTest("NumPy is not installed")
+        self.check_batch(BoardBatch(4))
+
+class TestSolver(unittest.TestCase):
+    def test_perfect_play(self):
+        self.assertEqual(evaluate(0, 0), ("draw", 0, 9))
+        x_mask, o_mask = pack_board([["X", "X", ""], ["O", "O", ""], ["", "", ""]])
+        self.assertEqual(evaluate(x_mask, o_mask), ("X", 2, 1))  # X wins at once
+        x_mask, o_mask = pack_board([["X", "X", ""], ["O", "O", ""], ["X", "", ""]])
+        self.assertEqual(evaluate(x_mask, o_mask), ("O", 5, 1))  # O to move and win
+        self.assertIsNone(evaluate(0, 0b11))  # O cannot have moved first
+
+    def test_boards_and_chunks(self):
+        results = evaluate_boards(["XXXOO....", [["", "", ""], ["", "X", ""], ["", "", ""]], "XO"])
+        self.assertEqual(results[0], {"value": "X", "move": None, "distance": 0})
+        self.assertEqual(results[1]["value"], "draw")
+        self.assertIn("error", results[2])
+        chunks = list(evaluate_chunks(["........."] * 5, size=2))
+        self.assertEqual([offset for offset, _ in chunks], [0, 2, 4])
+
+class TestTournament(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.checkpoint = os.path.join(self.temp_dir.name, "tournament.json")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_blocks_are_deterministic(self):
+        block = ("random", "greedy", 50, "0:0:0")
+        self.assertEqual(play_block(block), play_block(block))
+        self.assertEqual(play_block(("perfect", "perfect", 10, "0:0:1")), (0, 0, 10))
+
+    def test_resume_matches_uninterrupted_run(self):
+        options = {"bots": ["random", "greedy", "perfect"], "games_per_match": 40, "block_size": 10, "workers": 2}
+        expected = Tournament(**options).run()
+
+        # Stop after three blocks of the first round, as if the run had been killed
+        partial = Tournament(checkpoint=self.checkpoint, **options)
+        partial.schedule = partial.blocks(partial.pairings())
+        for block in partial.schedule[:3]:
+            partial.record(block, play_block(block))
+            partial.next_block += 1
+        partial.save()
+
+        self.assertEqual(Tournament(checkpoint=self.checkpoint, **options).run(), expected)
+        with self.assertRaises(ValueError):
+            Tournament(checkpoint=self.checkpoint, **{**options, "games_per_match": 80})
+
+class TestKeyExchange(unittest.TestCase):
+    def test_server_key_is_persisted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "server_key.pem")
+            created = KeyExchange.load_or_create(path)
+            loaded = KeyExchange.load_or_create(path)
+            self.assertEqual(created.get_public_key_bytes(), loaded.get_public_key_bytes())
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
+        # Clients encrypt with the server's public key without a key pair of their own
+        encryption = MessageEncryption()
+        encrypted = KeyExchange.encrypt_symmetric_key(loaded.get_public_key_bytes(), encryption.get_symmetric_key())
+        self.assertEqual(loaded.decrypt_symmetric_key(encrypted), encryption.get_symmetric_key())
+
+class TestFrameReader(unittest.TestCase):
+    def test_split_and_batched_frames(self):
+        encryption = MessageEncryption()
+        reader = FrameReader(encryption)
+        stream = b"".join(encryption.encrypt_frame(f"message {i}") for i in range(3))
+        self.assertEqual(reader.feed(stream[:10]), [])
+        self.assertEqual(reader.feed(stream[10:]), ["message 0", "message 1", "message 2"])
+        self.assertEqual(reader.buffer, b"")
+
+class TestRoomListing(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.hub = SpectatorHub(lambda conn, message_type, message: self.sent.append((conn, message)))
+
+    def tearDown(self):
+        self.hub.close()
+
+    def test_bursts_are_coalesced_and_closed_rooms_forgotten(self):
+        self.hub.close()  # Fan out by hand instead of on the sender thread
+        self.hub.sender_thread.join(1)
+        self.hub.publish_room("a", "room_update", "ignored")  # Nobody watches yet
+        self.hub.watch_rooms("watcher")
+        self.hub.seed_rooms({"a": ("room_update", "a0"), "b": ("room_update", "b0")})
+        self.hub.send_lobby()
+        for i in range(1, 4):
+            self.hub.publish_room("a", "room_update", f"a{i}")
+        self.hub.publish_room("b", "room_closed", "b closed", closed=True)
+        self.hub.send_lobby()
+        self.assertEqual([message for _, message in self.sent], ["a0", "b0", "a3", "b closed"])
+        self.assertEqual(list(self.hub.lobby), ["a"])
+
+class StuckConnection:
+    # Stand-in for a client socket whose owner stopped reading.
+    def __init__(self):
+        self.release = threading.Event()
+        self.shut_down = False
+
+    def sendall(self, data):
+        self.release.wait(2)
+
+    def shutdown(self, how):
+        self.shut_down = True
+
+    def getpeername(self):
+        return ("127.0.0.1", 0)
+
+class TestOutboundQueue(unittest.TestCase):
+    def setUp(self):
+        self.conn = StuckConnection()
+        self.queue = OutboundQueue(self.conn, MessageEncryption())
+        self.queue.put("move_ack", "first")
+        time.sleep(0.1)  # Writer thread is now stuck sending "first"
+        for i in range(HIGH_WATERMARK):
+            self.assertTrue(self.queue.put("move_ack", f"ack {i}"))
+
+    def tearDown(self):
+        self.conn.release.set()
+        self.queue.close()
+
+    def test_slow_consumer_drops_chat_and_coalesces_updates(self):
+        self.assertFalse(self.queue.put("chat", "hello"))
+        self.queue.put("game_update", "board 1")
+        self.queue.put("game_update", "board 2")
+
+        metrics = self.queue.metrics()
+        self.assertTrue(metrics["congested"])
+        self.assertEqual(metrics["dropped"], 1)
+        self.assertEqual(metrics["coalesced"], 1)
+        self.assertEqual(metrics["depth"], HIGH_WATERMARK + 1)
+        self.assertEqual(self.queue.queue[-1], ("game_update", "board 2"))
+
+    def test_deadline_enforced_without_new_messages(self):
+        # A congested client that is sent nothing more is still disconnected once the deadline passes
+        congested = []
+        self.queue.on_congested = lambda: congested.append(True)
+        self.queue.put("move_ack", "one more")
+        self.assertEqual(congested, [True])
+        self.assertGreater(self.queue.check_deadline(), 0)
+        self.assertFalse(self.conn.shut_down)
+        self.queue.congested_since -= SLOW_CONSUMER_DEADLINE + 1
+        self.assertIsNone(self.queue.check_deadline())
+        self.assertTrue(self.conn.shut_down)
+
+    def test_full_queue_disconnects(self):
+        for i in range(MAX_QUEUE):
+            if not self.queue.put("move_ack", f"more {i}"):
+                break
+        self.assertTrue(self.conn.shut_down)
+        self.assertFalse(self.queue.put("move_ack", "after"))
+
+class TestTimerWheel(unittest.TestCase):
+    def run_ticks(self, wheel, ticks):
+        # Returns the tick at which each callback ran
+        fired = {}
+        for _ in range(ticks):
+            for callback in wheel.step():
+                fired[callback()] = wheel.current
+        return fired
+
+    def test_timers_fire_on_their_tick_across_levels(self):
+        wheel = TimerWheel(tick=1, slots=4, levels=3)
+        for delay in (1, 3, 4, 5, 17, 63, 64, 100):
+            wheel.schedule(delay, lambda delay=delay: delay, now=wheel.next_tick_time - wheel.tick)
+        fired = self.run_ticks(wheel, 130)
+        self.assertEqual(fired, {1: 1, 3: 3, 4: 4, 5: 5, 17: 17, 63: 63, 64: 64, 100: 100})
+        self.assertEqual(wheel.count, 0)
+
+    def test_cancelled_timer_does_not_fire(self):
+        wheel = TimerWheel(tick=1, slots=4, levels=2)
+        timer = wheel.schedule(6, lambda: "cancelled", now=wheel.next_tick_time - wheel.tick)
+        wheel.schedule(6, lambda: "kept", now=wheel.next_tick_time - wheel.tick)
+        wheel.cancel(timer)
+        self.assertEqual(self.run_ticks(wheel, 10), {"kept": 6})
+
+    def test_timer_scheduled_mid_tick_is_not_early(self):
+        wheel = TimerWheel(tick=1, slots=4, levels=2)
+        start = wheel.next_tick_time - wheel.tick
+        fired = []
+        wheel.schedule(1, lambda: fired.append(True), now=start + 0.5)
+        wheel.advance(start + 1)
+        self.assertEqual(fired, [])  # Only half a second after it was scheduled
+        wheel.advance(start + 2)
+        self.assertEqual(fired, [True])
+
+class TestAdmissionController(unittest.TestCase):
+    def test_connection_limit(self):
+        admission = AdmissionController(max_connections=1)
+        self.assertTrue(admission.admit_connection())
+        self.assertFalse(admission.admit_connection())
+        admission.release_connection()
+        self.assertTrue(admission.admit_connection())
+
+    def test_overload_sheds_joins_but_not_moves(self):
+        admission = AdmissionController(max_in_flight=1)
+        self.assertTrue(admission.begin("join"))
+        self.assertFalse(admission.begin("join"))
+        self.assertTrue(admission.begin("move"))
+        admission.end()
+        admission.end()
+        self.assertTrue(admission.begin("chat"))
+
+    def test_queue_latency_sheds(self):
+        admission = AdmissionController(latency_target=0.1)
+        for _ in range(10):
+            admission.begin("move")
+            admission.started(1.0)
+            admission.end()
+        self.assertFalse(admission.begin("join"))
+        self.assertEqual(admission.metrics()["shed"], 1)
+
+class TestCompactGames(unittest.TestCase):
+    def test_rules_on_packed_boards(self):
+        board = [["X", "O", ""], ["", "X", "O"], ["", "", "X"]]
+        x_mask, o_mask = pack_board(board)
+        self.assertEqual(unpack_board(x_mask, o_mask), board)
+        self.assertEqual(game_result(x_mask, o_mask), "X")
+        draw = pack_board([["X", "O", "X"], ["X", "O", "O"], ["O", "X", "X"]])
+        self.assertEqual(game_result(*draw), "draw")
+        self.assertIsNone(game_result(0, 0))
+
+    def test_board_word_round_trip(self):
+        game = decode_word(encode_word(CompactGame(0b1, 0b10, "O", "ongoing")), "alice", "bob")
+        self.assertEqual((game.x_mask, game.o_mask, game.next_symbol, game.status, game.x_player, game.o_player),
+                         (0b1, 0b10, "O", "ongoing", "alice", "bob"))
+        self.assertTrue(encode_word(CompactGame()) & IN_USE)
+
 if __name__ == '__main__':
     unittest.main()
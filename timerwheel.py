@@ -0,0 +1,109 @@
+import threading
+import time
+import math
+import logging
+
+class Timer:
+    # One scheduled callback. Returned by TimerWheel.schedule so it can be cancelled.
+    __slots__ = ("expires", "callback", "bucket")
+
+    def __init__(self, expires, callback):
+        self.expires = expires  # Tick number at which the callback runs
+        self.callback = callback
+        self.bucket = None  # Set holding this timer, so cancelling is O(1)
+
+class TimerWheel:
+    # Hierarchical timing wheel: `levels` wheels of `slots` buckets each.
+    # Level 0 buckets are one tick wide, level 1 buckets are `slots` ticks wide, and so on.
+    # Scheduling and cancelling are O(1), and a tick only touches the timers that expire
+    # in it plus, every `slots` ticks, one bucket cascaded down from the level above.
+    # This lets a single thread track deadlines for any number of connections.
+    def __init__(self, tick=1.0, slots=64, levels=4):
+        self.tick = tick  # Seconds per tick
+        self.slots = slots
+        self.levels = levels
+        self.wheels = [[set() for _ in range(slots)] for _ in range(levels)]
+        self.current = 0  # Ticks processed so far
+        self.next_tick_time = time.monotonic() + tick
+        self.count = 0  # Timers currently scheduled
+        self.lock = threading.Lock()
+
+    def schedule(self, delay, callback, now=None):
+        # Runs callback (with no arguments) after at least `delay` seconds.
+        # now: time.monotonic() to count the delay from; the part of a tick already gone by
+        #      is added, so the callback never runs early
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            elapsed = max(0, now - (self.next_tick_time - self.tick))
+            ticks = max(1, math.ceil((delay + elapsed) / self.tick))
+            timer = Timer(self.current + ticks, callback)
+            self.insert(timer)
+            self.count += 1
+            return timer
+
+    def cancel(self, timer):
+        with self.lock:
+            if timer.bucket is not None:
+                timer.bucket.discard(timer)
+                timer.bucket = None
+                self.count -= 1
+
+    def insert(self, timer):
+        # Puts a timer in the bucket of the lowest level that can hold its delay. Caller holds the lock.
+        remaining = timer.expires - self.current
+        level = 0
+        span = self.slots
+        while remaining >= span and level < self.levels - 1:
+            level += 1
+            span *= self.slots
+        width = span // self.slots
+        # Timers further out than the top level can reach wait in its furthest bucket and get re-cascaded
+        expires = min(timer.expires, self.current + span - width)
+        bucket = self.wheels[level][(expires // width) % self.slots]
+        bucket.add(timer)
+        timer.bucket = bucket
+
+    def step(self):
+        # Advances the wheel by one tick and returns the callbacks that are now due.
+        with self.lock:
+            self.current += 1
+            # Cascade higher level buckets whose range starts at this tick
+            width = self.slots
+            for level in range(1, self.levels):
+                if self.current % width:
+                    break
+                bucket = self.wheels[level][(self.current // width) % self.slots]
+                timers = list(bucket)
+                bucket.clear()
+                for timer in timers:
+                    self.insert(timer)
+                width *= self.slots
+
+            bucket = self.wheels[0][self.current % self.slots]
+            due = []
+            for timer in list(bucket):
+                if timer.expires <= self.current:
+                    bucket.discard(timer)
+                    timer.bucket = None
+                    due.append(timer.callback)
+            self.count -= len(due)
+            return due
+
+    def advance(self, now=None):
+        # Processes every tick that has elapsed by `now` and runs the due callbacks.
+        if now is None:
+            now = time.monotonic()
+        while self.next_tick_time <= now:
+            self.next_tick_time += self.tick
+            for callback in self.step():
+                try:
+                    callback()
+                except Exception as e:
+                    logging.error(f"Timer callback failed: {e}")
+
+    def run(self, running=lambda: True):
+        # Ticks the wheel in the calling thread while running() is true.
+        while running():
+            time.sleep(max(0, self.next_tick_time - time.monotonic()))
+            self.advance()
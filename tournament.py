@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import random
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from engine import WINNING, BoardBatch, legal_moves
+from stats import DEFAULT_RATING, update_ratings
+import solver
+
+GAMES_PER_MATCH = 1000  # Games each pair of bots plays per round, half with each symbol
+BLOCK_SIZE = 500  # Games one worker plays per task
+CHECKPOINT_EVERY = 20  # Finished blocks between checkpoint writes
+TOURNAMENT_K = 16  # Elo K factor applied once per block, using the block's average score
+
+# Bot strategies. Each takes (x_mask, o_mask, symbol, rng) and returns the cell to play.
+# They are looked up by name in the worker processes, so only names cross process boundaries.
+
+def random_move(x_mask, o_mask, symbol, rng):
+    return rng.choice(legal_moves(x_mask, o_mask))
+
+def first_move(x_mask, o_mask, symbol, rng):
+    # Always the lowest free cell.
+    return legal_moves(x_mask, o_mask)[0]
+
+def greedy_move(x_mask, o_mask, symbol, rng):
+    # Wins if it can, blocks the opponent's win if it must, otherwise plays at random.
+    mine, theirs = (x_mask, o_mask) if symbol == "X" else (o_mask, x_mask)
+    cells = legal_moves(x_mask, o_mask)
+    for masks in (mine, theirs):
+        for cell in cells:
+            if WINNING[masks | 1 << cell]:
+                return cell
+    return rng.choice(cells)
+
+def perfect_move(x_mask, o_mask, symbol, rng):
+    # The solver's best move: never loses.
+    return solver.evaluate(x_mask, o_mask)[1]
+
+STRATEGIES = {
+    "random": random_move,
+    "first": first_move,
+    "greedy": greedy_move,
+    "perfect": perfect_move,
+}
+
+def play_block(block):
+    # Runs in a worker process. Plays a block of games between two bots with the server's rules.
+    # block: (x bot name, o bot name, number of games, seed)
+    # Returns (X wins, O wins, draws). The same block always gives the same result.
+    # All games of the block move in lockstep on one BoardBatch: each ply the bot to move picks
+    # a cell in every running game, the moves are applied in bulk, and the touched boards are
+    # judged in one pass. A bot that picks an occupied or invalid cell forfeits.
+    x_bot, o_bot, games, seed = block
+    rng = random.Random(seed)
+    strategies = {"X": STRATEGIES[x_bot], "O": STRATEGIES[o_bot]}
+    counts = {"X": 0, "O": 0, "draw": 0}
+    batch = BoardBatch(games)
+    playing = [batch.add() for _ in range(games)]
+    symbol = "X"
+    while playing:
+        strategy = strategies[symbol]
+        moved, cells = [], []
+        for slot, (x_mask, o_mask) in zip(playing, batch.boards(playing)):
+            cell = strategy(x_mask, o_mask, symbol, rng)
+            if cell in legal_moves(x_mask, o_mask):
+                moved.append(slot)
+                cells.append(cell)
+            else:
+                counts["O" if symbol == "X" else "X"] += 1
+                batch.release(slot)
+        batch.play_many(moved, [symbol] * len(moved), cells)
+        finished = batch.resolve()
+        for slot, result in finished.items():
+            counts[result] += 1
+            batch.release(slot)
+        playing = [slot for slot in moved if slot not in finished]
+        symbol = "O" if symbol == "X" else "X"
+    return counts["X"], counts["O"], counts["draw"]
+
+class Tournament:
+    # Round-robin or Swiss tournament between bots, played in-process on a process pool.
+    # Games are split into blocks with seeds derived from the tournament seed, so a run is
+    # reproducible whatever the number of workers. Standings and Elo estimates are updated as
+    # blocks finish, in schedule order, and saved to the checkpoint file every few blocks;
+    # running again with the same settings and checkpoint carries on where it stopped.
+    def __init__(self, bots, swiss_rounds=None, games_per_match=GAMES_PER_MATCH, block_size=BLOCK_SIZE,
+                 seed=0, checkpoint=None, workers=None):
+        # bots: Names from STRATEGIES, each at most once
+        # swiss_rounds: Number of Swiss rounds, or None for a single round robin
+        # checkpoint: Path of the JSON checkpoint file, or None to keep nothing
+        # workers: Worker processes, defaulting to one per CPU
+        for bot in bots:
+            if bot not in STRATEGIES:
+                raise ValueError(f"Unknown bot {bot}. Choose from: {', '.join(STRATEGIES)}")
+        if len(set(bots)) != len(bots) or len(bots) < 2:
+            raise ValueError("A tournament needs at least two different bots.")
+        self.settings = {
+            "bots": list(bots),
+            "swiss_rounds": swiss_rounds,
+            "games_per_match": games_per_match,
+            "block_size": block_size,
+            "seed": seed,
+        }
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.rounds = swiss_rounds or 1
+        self.round = 0  # Rounds finished
+        self.schedule = None  # Blocks of the current round, or None before it is paired
+        self.next_block = 0  # Blocks of the current round already counted
+        self.results = {bot: [0, 0, 0] for bot in bots}  # bot -> [wins, losses, draws]
+        self.ratings = {bot: DEFAULT_RATING for bot in bots}
+        if checkpoint and os.path.exists(checkpoint):
+            self.load()
+
+    def load(self):
+        with open(self.checkpoint) as f:
+            saved = json.load(f)
+        if saved["settings"] != self.settings:
+            raise ValueError(f"Checkpoint {self.checkpoint} is from a tournament with other settings.")
+        self.round = saved["round"]
+        self.schedule = [tuple(block) for block in saved["schedule"]] if saved["schedule"] is not None else None
+        self.next_block = saved["next_block"]
+        self.results = saved["results"]
+        self.ratings = saved["ratings"]
+        logging.info(f"Resuming tournament at round {self.round + 1}, block {self.next_block}")
+
+    def save(self):
+        # Writes the checkpoint atomically, so a crash mid-write keeps the previous one.
+        if not self.checkpoint:
+            return
+        saved = {
+            "settings": self.settings,
+            "round": self.round,
+            "schedule": self.schedule,
+            "next_block": self.next_block,
+            "results": self.results,
+            "ratings": self.ratings,
+        }
+        temp_path = f"{self.checkpoint}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(saved, f)
+        os.replace(temp_path, self.checkpoint)
+
+    def pairings(self):
+        # Returns the (x bot, o bot) matches of the current round.
+        bots = self.settings["bots"]
+        if not self.settings["swiss_rounds"]:
+            return [(a, b) for a in bots for b in bots if a != b]
+        # Swiss: bots sorted by points, then rating, play their neighbour; an odd one out sits out
+        def points(bot):
+            wins, _, draws = self.results[bot]
+            return wins + draws / 2
+        ranked = sorted(bots, key=lambda bot: (-points(bot), -self.ratings[bot], bot))
+        matches = []
+        for a, b in zip(ranked[0::2], ranked[1::2]):
+            matches += [(a, b), (b, a)]
+        return matches
+
+    def blocks(self, matches):
+        # Splits each match into blocks of games with their own seeds.
+        games_per_side = max(1, self.settings["games_per_match"] // 2)
+        block_size = self.settings["block_size"]
+        blocks = []
+        for x_bot, o_bot in matches:
+            for start in range(0, games_per_side, block_size):
+                seed = f"{self.settings['seed']}:{self.round}:{len(blocks)}"
+                blocks.append((x_bot, o_bot, min(block_size, games_per_side - start), seed))
+        return blocks
+
+    def record(self, block, result):
+        # Adds a finished block to the standings and moves both bots' ratings.
+        x_bot, o_bot, games, _ = block
+        x_wins, o_wins, draws = result
+        self.results[x_bot][0] += x_wins
+        self.results[x_bot][1] += o_wins
+        self.results[x_bot][2] += draws
+        self.results[o_bot][0] += o_wins
+        self.results[o_bot][1] += x_wins
+        self.results[o_bot][2] += draws
+        score = (x_wins + draws / 2) / games
+        self.ratings[x_bot], self.ratings[o_bot] = update_ratings(
+            self.ratings[x_bot], self.ratings[o_bot], score, TOURNAMENT_K)
+
+    def run(self):
+        # Plays the remaining rounds and returns the standings.
+        with ProcessPoolExecutor(self.workers) as pool:
+            while self.round < self.rounds:
+                if self.schedule is None:
+                    self.schedule = self.blocks(self.pairings())
+                    self.next_block = 0
+                pending = self.schedule[self.next_block:]
+                # map returns results in schedule order, so ratings do not depend on which worker finishes first
+                for block, result in zip(pending, pool.map(play_block, pending)):
+                    self.record(block, result)
+                    self.next_block += 1
+                    if self.next_block % CHECKPOINT_EVERY == 0:
+                        self.save()
+                self.round += 1
+                self.schedule = None
+                self.save()
+                logging.info(f"Round {self.round} of {self.rounds} finished")
+        return self.standings()
+
+    def standings(self):
+        # Returns every bot's results, best rating first.
+        table = [{"bot": bot, "wins": wins, "losses": losses, "draws": draws, "rating": round(self.ratings[bot])}
+                 for bot, (wins, losses, draws) in self.results.items()]
+        table.sort(key=lambda entry: -entry["rating"])
+        return table
+
+def handle_arguments():
+    # Parses command-line arguments into Tournament keyword arguments.
+    options = {"bots": list(STRATEGIES)}
+    numbers = {"-g": "games_per_match", "-r": "swiss_rounds", "-s": "seed", "-w": "workers"}
+    n = len(sys.argv)
+    i = 1
+    while i < n:
+        arg = sys.argv[i]
+        if arg == "-h":
+            print("Usage:")
+            print("-h              Show this help message")
+            print(f"-b bot,bot,...  Bots to play (default: {','.join(STRATEGIES)})")
+            print(f"-g Games        Games per pair of bots per round (default: {GAMES_PER_MATCH})")
+            print("-r Rounds       Play a Swiss tournament of this many rounds instead of a round robin")
+            print("-s Seed         Seed for reproducible runs (default: 0)")
+            print("-w Workers      Worker processes (default: one per CPU)")
+            print("-c File         Checkpoint file; rerun with the same options to resume")
+            sys.exit(0)
+        elif arg in ("-b", "-c") or arg in numbers:
+            if i + 1 >= n:
+                print(f"Error: {arg} requires a value")
+                sys.exit(1)
+            value = sys.argv[i + 1]
+            if arg == "-b":
+                options["bots"] = value.split(",")
+            elif arg == "-c":
+                options["checkpoint"] = value
+            else:
+                try:
+                    options[numbers[arg]] = int(value)
+                except ValueError:
+                    print(f"Error: {arg} must be an integer")
+                    sys.exit(1)
+            i += 1
+        else:
+            print(f"Error: Unknown argument '{arg}'")
+            print("Use -h for help")
+            sys.exit(1)
+        i += 1
+    return options
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    try:
+        tournament = Tournament(**handle_arguments())
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    for rank, entry in enumerate(tournament.run(), 1):
+        print(f"{rank}. {entry['bot']} ({entry['rating']}) W{entry['wins']} L{entry['losses']} D{entry['draws']}")